@@ -76,9 +76,13 @@ class Ansible:
         if proxy_command:
             ssh_args += f' -o ProxyCommand="{proxy_command}"'
 
+        # Both properties are recomputed on each access
+        scenario_guests = self.description.scenario_guests
+        services_guests = self.description.services_guests
+
         networks = {}
         guests = {}
-        for _, guest in self.description.scenario_guests.items():
+        for _, guest in scenario_guests.items():
             if guest.instance not in guests:
                 guests[guest.instance] = {}
             if guest.base_name not in guests[guest.instance]:
@@ -95,10 +99,10 @@ class Ansible:
                 networks[guest.instance][interface.network.base_name]["members"][guest.base_name][guest.copy] = interface.private_ip
 
         for machine_name in machine_list:
-            if machine_name in self.description.services_guests:
-                machine = self.description.services_guests[machine_name]
-            elif machine_name in self.description.scenario_guests:
-                machine = self.description.scenario_guests[machine_name]
+            if machine_name in services_guests:
+                machine = services_guests[machine_name]
+            elif machine_name in scenario_guests:
+                machine = scenario_guests[machine_name]
             else:
                 raise AnsibleException(f"Machine name {machine_name} not found.")
 
@@ -128,6 +132,10 @@ class Ansible:
                 "parameters": parameters[machine.instance] if machine.instance else {},
             }
 
+            if self.config.platform == "docker" and self.config.docker.hosts:
+                # In cluster mode each container is reached through its own docker server
+                inventory[machine.base_name]["hosts"][machine.name]["ansible_docker_docker_host"] = self.client.get_docker_host(machine_name)
+
             if machine.os == "windows_srv_2022":
                 inventory[machine.base_name]["hosts"][machine.name]["ansible_shell_type"] = "powershell"
                 inventory[machine.base_name]["hosts"][machine.name]["ansible_become_method"] = "runas"
@@ -211,6 +219,24 @@ class Ansible:
             )
         self.output = ""
         self.debug_outputs = []
+        successful = self._invoke_ansible(inventory, playbook, quiet, verbosity)
+        logger.debug(self.output)
+
+        if not successful and quiet:
+            raise AnsibleException(self.output)
+
+    def _invoke_ansible(self, inventory, playbook, quiet, verbosity):
+        """ Run an Ansible playbook with ansible-runner.
+
+        Args:
+            inventory (dict): Ansible inventory dictionary.
+            playbook (str): Ansible playbook to run.
+            quiet (bool): If True, suppress ansible output.
+            verbosity (int): Ansible verbosity level.
+
+        Returns:
+            bool: whether the playbook ran successfully.
+        """
         extravars = { "ansible_no_target_syslog" : not self.config.ansible.keep_logs }
                 
         envvars = { 
@@ -232,10 +258,7 @@ class Ansible:
             extravars=extravars,
             envvars=envvars,
         )
-        logger.debug(self.output)
-
-        if (r.rc != 0 or r.status != "successful") and quiet:
-            raise AnsibleException(self.output)
+        return r.rc == 0 and r.status == "successful"
 
     def wait_for_connections(self, instances=None, guests=None, copies=None, only_instances=True, exclude=[], username=None, inventory=None):
         """Wait for machines to respond to ssh connections for ansible."""
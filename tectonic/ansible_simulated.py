@@ -0,0 +1,63 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+from pathlib import Path
+
+from tectonic.ansible import Ansible
+from tectonic.platform_simulated import SimulatedPlatform
+
+class AnsibleSimulated(Ansible):
+    """ Class that simulates Ansible runs on the simulated platform. """
+
+    # Debug output with the values that Tectonic reads from its playbooks
+    DEBUG_OUTPUT = {
+        "token": "simulated",
+        "password.stdout": "trainer simulated\nadmin simulated",
+        "agent_status": "running",
+        "agents_status": {},
+    }
+
+    def __init__(self, config, description, client):
+        super().__init__(config, description, client)
+        self.platform = SimulatedPlatform.get(config, description)
+
+    def _invoke_ansible(self, inventory, playbook, quiet, verbosity):
+        """ Simulate a playbook run: wait for the hosts to boot and
+        return the debug output of Tectonic playbooks.
+
+        Args:
+            inventory (dict): Ansible inventory dictionary.
+            playbook (str): Ansible playbook to run.
+            quiet (bool): If True, suppress ansible output.
+            verbosity (int): Ansible verbosity level.
+
+        Returns:
+            bool: whether the playbook ran successfully.
+        """
+        hosts = [host for group in inventory.values() for host in group.get("hosts", {})]
+        try:
+            self.platform.request("ansible")
+            self.platform.wait_for_boot(hosts)
+        except Exception as e:
+            self.output += f"\nPLAY [{Path(playbook).name}] failed: {e}"
+            return False
+        self.output += f"\nPLAY [{Path(playbook).name}] ok={len(hosts)}"
+        self.debug_outputs.append(dict(self.DEBUG_OUTPUT))
+        return True
@@ -0,0 +1,447 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of Tectonic on the simulated platform."""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import yaml
+
+import tectonic.utils as utils
+from tectonic.config import TectonicConfig
+from tectonic.description import Description
+from tectonic.core import Core
+from tectonic.platform_simulated import SimulatedPlatform
+
+PHASES = ["description", "images", "deploy", "list", "destroy"]
+
+STAGES = ["load", "scenario_guests", "parse_machines", "build_inventory", "terraform_variables", "packer_variables"]
+
+# Synthetic lab sizes of the description benchmark
+SIZES = {
+    "small": {"instances": 2, "guests": 3, "copies": 1, "networks": 2, "traffic_rules": 2},
+    "medium": {"instances": 20, "guests": 5, "copies": 2, "networks": 3, "traffic_rules": 10},
+    "large": {"instances": 100, "guests": 10, "copies": 2, "networks": 4, "traffic_rules": 40},
+}
+
+# Differences below this number of seconds are never considered regressions
+MIN_REGRESSION = 0.005
+
+# Terraform parallelism settings compared by default, 0 is automatic
+PARALLELISM_SETTINGS = [0, 1, 10, 50]
+
+def generate_lab(directory, name="benchmark", instances=1, guests=1, copies=1, networks=1, traffic_rules=0,
+                 services=("elastic", "caldera"), student_passwords=False):
+    """
+    Write a synthetic lab: a base lab directory with its description.yml and a lab edition file.
+
+    Guest guest1 is the entry point and belongs to every network, the other guests belong to one
+    network each. Traffic rules allow the entry point to reach the other guests.
+
+    Parameters:
+        directory (str): lab repository directory where to write the lab.
+        name (str): name of the lab. Default: benchmark
+        instances (int): number of instances. Default: 1
+        guests (int): number of guests. Default: 1
+        copies (int): number of copies of each guest except the entry point. Default: 1
+        networks (int): number of networks. Default: 1
+        traffic_rules (int): number of traffic rules. Default: 0
+        services (list(str)): services to enable (elastic, caldera, guacamole, moodle, ctfd). Default: elastic and caldera.
+        student_passwords (bool): whether to create student passwords. Default: False
+
+    Return:
+        str: path to the lab edition file.
+    """
+    guest_names = [f"guest{index}" for index in range(1, guests+1)]
+    network_names = [f"network{index}" for index in range(1, networks+1)]
+    guest_networks = {guest: [network_names[index % networks]] for index, guest in enumerate(guest_names)}
+    guest_networks[guest_names[0]] = network_names
+    destinations = guest_names[1:] or guest_names
+
+    description = {
+        "institution": "benchmark",
+        "lab_name": name,
+        "guest_settings": {
+            guest: {"entry_point": True} if index == 0 else {"copies": copies, "monitor": True}
+            for index, guest in enumerate(guest_names)
+        },
+        "topology": [
+            {"name": network, "members": [guest for guest in guest_names if network in guest_networks[guest]]}
+            for network in network_names
+        ],
+        "traffic_rules": [
+            {
+                "description": f"Allow access from {guest_names[0]} to port {8000+index}",
+                "source": f"{guest_names[0]}.{guest_networks[destinations[index % len(destinations)]][0]}",
+                "destination": f"{destinations[index % len(destinations)]}.{guest_networks[destinations[index % len(destinations)]][0]}",
+                "port_range": str(8000+index),
+                "protocol": "tcp",
+            }
+            for index in range(traffic_rules)
+        ],
+    }
+    for service in services:
+        description[f"{service}_settings"] = {"enable": True}
+
+    lab_dir = Path(directory) / name
+    os.makedirs(lab_dir, exist_ok=True)
+    with open(lab_dir / "description.yml", "w") as f:
+        yaml.safe_dump(description, f, sort_keys=False)
+
+    lab_edition = {
+        "base_lab": name,
+        "instance_number": instances,
+        "create_students_passwords": student_passwords,
+        "random_seed": "benchmark",
+        "student_prefix": "trainee",
+    }
+    lab_edition_file = Path(directory) / f"{name}.yml"
+    with open(lab_edition_file, "w") as f:
+        yaml.safe_dump(lab_edition, f, sort_keys=False)
+    return lab_edition_file.as_posix()
+
+def run_cycle(config, lab_edition_file):
+    """
+    Run a full cycle of a lab on a fresh simulated platform: load the
+    description, create the images, deploy, list and destroy everything.
+
+    Parameters:
+        config (Config): Tectonic config object, with the simulated platform.
+        lab_edition_file (str): path to the lab edition file.
+
+    Return:
+        dict: seconds taken by each phase, plus the number of machines and platform requests.
+    """
+    SimulatedPlatform.reset()
+    timings = {}
+
+    start = time.perf_counter()
+    description = Description(config, lab_edition_file)
+    core = Core(description)
+    timings["description"] = time.perf_counter() - start
+    services = [service.base_name for _, service in description.services_guests.items()]
+
+    start = time.perf_counter()
+    core.create_instances_images()
+    core.create_services_images(services)
+    timings["images"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.deploy(None, False, [])
+    timings["deploy"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.list_instances(None, None, None)
+    timings["list"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.destroy(None, True, True, services)
+    timings["destroy"] = time.perf_counter() - start
+
+    timings["machines"] = len(description.scenario_guests) + len(description.services_guests)
+    timings["requests"] = SimulatedPlatform.get(config, description).requests
+    return timings
+
+def run_description_stages(config, lab_edition_file):
+    """
+    Time the stages of the description pipeline for a lab on a fresh simulated platform.
+    The machines are deployed before building the inventory, so that their addresses are known.
+
+    Parameters:
+        config (Config): Tectonic config object, with the simulated platform.
+        lab_edition_file (str): path to the lab edition file.
+
+    Return:
+        dict: seconds taken by each stage.
+    """
+    SimulatedPlatform.reset()
+    timings = {}
+
+    start = time.perf_counter()
+    description = Description(config, lab_edition_file)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    description.scenario_guests
+    timings["scenario_guests"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    machines = description.parse_machines(None, None, None, False)
+    timings["parse_machines"] = time.perf_counter() - start
+
+    core = Core(description)
+    core.terraform.deploy(None)
+    core.terraform_service.deploy(None)
+    start = time.perf_counter()
+    core.ansible.build_inventory(machine_list=machines)
+    timings["build_inventory"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.terraform._get_terraform_variables()
+    core.terraform_service._get_terraform_variables()
+    timings["terraform_variables"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    core.packer._get_instance_variables(None)
+    core.packer._get_service_variables(None)
+    timings["packer_variables"] = time.perf_counter() - start
+    return timings
+
+def run_description_benchmark(config, sizes, repeat=3):
+    """
+    Generate a synthetic lab of each size and time the description pipeline.
+
+    Parameters:
+        config (Config): Tectonic config object, with the simulated platform.
+        sizes (dict): lab parameters of each size, as accepted by generate_lab.
+        repeat (int): number of runs of each size. The fastest run of each stage is kept. Default: 3
+
+    Return:
+        dict: seconds taken by each stage for each size.
+    """
+    results = {}
+    lab_repo_uri = config.lab_repo_uri
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config.lab_repo_uri = directory
+            for size, parameters in sizes.items():
+                lab_edition_file = generate_lab(directory, f"benchmark-{size}", **parameters)
+                runs = [run_description_stages(config, lab_edition_file) for _ in range(repeat)]
+                results[size] = {stage: min(run[stage] for run in runs) for stage in STAGES}
+    finally:
+        config.lab_repo_uri = lab_repo_uri
+    return results
+
+def run_parallelism_benchmark(config, lab_edition_file, settings, cycles=1):
+    """
+    Run full cycles of a lab with several Terraform parallelism settings.
+
+    Parameters:
+        config (Config): Tectonic config object, with the simulated platform.
+        lab_edition_file (str): path to the lab edition file.
+        settings (list(int)): values of terraform_parallelism to compare, 0 for automatic.
+        cycles (int): number of cycles of each setting. The fastest cycle is kept. Default: 1
+
+    Return:
+        dict: seconds taken to deploy and destroy with each setting.
+    """
+    results = {}
+    parallelism = config.terraform_parallelism
+    try:
+        for setting in settings:
+            config.terraform_parallelism = setting
+            runs = [run_cycle(config, lab_edition_file) for _ in range(cycles)]
+            results[setting] = {phase: min(run[phase] for run in runs) for phase in ["deploy", "destroy"]}
+    finally:
+        config.terraform_parallelism = parallelism
+    return results
+
+def compare_baseline(results, baseline, threshold):
+    """
+    Return the stages that are slower than their baseline by more than the threshold.
+
+    Parameters:
+        results (dict): seconds taken by each stage for each size.
+        baseline (dict): baseline seconds of each stage for each size.
+        threshold (int): allowed slowdown, as a percentage of the baseline.
+
+    Return:
+        list(list): size, stage, baseline and current seconds of each regression.
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, seconds in stages.items():
+            expected = baseline.get(size, {}).get(stage)
+            if expected is None:
+                continue
+            if seconds > expected * (1 + threshold / 100) and seconds - expected > MIN_REGRESSION:
+                regressions.append([size, stage, expected, seconds])
+    return regressions
+
+def summarize(results):
+    """
+    Summarize the timings of several cycles.
+
+    Parameters:
+        results (list(dict)): timings of each cycle, as returned by run_cycle.
+
+    Return:
+        tuple(list(str), list(list)): headers and rows of the summary table.
+    """
+    headers = ["Phase", "Min (s)", "Mean (s)", "Max (s)"]
+    rows = []
+    for phase in PHASES:
+        values = [result[phase] for result in results]
+        rows.append([phase, f"{min(values):.3f}", f"{sum(values)/len(values):.3f}", f"{max(values):.3f}"])
+    return headers, rows
+
+def load_config(config):
+    """
+    Load the configuration, using the simulated platform.
+
+    Parameters:
+        config (str): path to the ini file.
+
+    Return:
+        Config: Tectonic config object.
+    """
+    config = TectonicConfig.load(config)
+    config.platform = "simulated"
+    return config
+
+@click.group()
+@click.option(
+    "--config",
+    "-c",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Read tectonic configuration from specified INI file. The platform is always simulated.",
+    required=True,
+)
+@click.pass_context
+def benchmark(ctx, config):
+    """Benchmark Tectonic on the simulated platform."""
+    ctx.ensure_object(dict)
+    ctx.obj["config"] = load_config(config)
+
+@benchmark.command()
+@click.pass_context
+@click.option(
+    "--cycles",
+    "-n",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of deploy/list/destroy cycles to run.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False),
+    help="Export the timings of each cycle to this JSON file.",
+)
+@click.argument("lab_edition_file", type=click.Path(exists=True, dir_okay=False))
+def cycle(ctx, cycles, output, lab_edition_file):
+    """Benchmark full cycles of LAB_EDITION_FILE."""
+    results = [run_cycle(ctx.obj["config"], lab_edition_file) for _ in range(cycles)]
+    headers, rows = summarize(results)
+    click.echo(f"Machines: {results[0]['machines']}. Platform requests per cycle: {results[0]['requests']}.")
+    click.echo(utils.create_table(headers, rows))
+    if output:
+        with open(output, "w") as f:
+            json.dump({"cycles": results}, f, indent=2)
+
+@benchmark.command()
+@click.pass_context
+@click.option(
+    "--sizes",
+    "-s",
+    type=click.Choice(list(SIZES.keys())),
+    multiple=True,
+    help="Synthetic lab sizes to benchmark. [default: all]",
+)
+@click.option(
+    "--repeat",
+    "-n",
+    type=click.IntRange(min=1),
+    default=3,
+    show_default=True,
+    help="Number of runs of each size. The fastest run of each stage is reported.",
+)
+@click.option(
+    "--baseline",
+    "-b",
+    type=click.Path(dir_okay=False),
+    help="JSON file with the baseline timings to compare with.",
+)
+@click.option(
+    "--threshold",
+    "-t",
+    type=click.IntRange(min=0),
+    default=25,
+    show_default=True,
+    help="Allowed slowdown over the baseline, as a percentage.",
+)
+@click.option(
+    "--save_baseline/--no-save_baseline",
+    default=False,
+    show_default=True,
+    help="Store the timings as the new baseline instead of comparing with it.",
+)
+def description(ctx, sizes, repeat, baseline, threshold, save_baseline):
+    """Benchmark the description pipeline on synthetic labs of several sizes."""
+    sizes = {size: SIZES[size] for size in (sizes or SIZES.keys())}
+    results = run_description_benchmark(ctx.obj["config"], sizes, repeat)
+    rows = [[size] + [f"{stages[stage]:.4f}" for stage in STAGES] for size, stages in results.items()]
+    click.echo(utils.create_table(["Size"] + STAGES, rows))
+
+    if baseline and save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    elif baseline:
+        with open(baseline, "r") as f:
+            regressions = compare_baseline(results, json.load(f), threshold)
+        if regressions:
+            rows = [[size, stage, f"{expected:.4f}", f"{seconds:.4f}"] for size, stage, expected, seconds in regressions]
+            click.echo(utils.create_table(["Size", "Stage", "Baseline (s)", "Current (s)"], rows))
+            raise click.ClickException(f"{len(regressions)} stages are more than {threshold}% slower than the baseline.")
+
+@benchmark.command()
+@click.pass_context
+@click.option(
+    "--parallelism",
+    "-p",
+    "settings",
+    type=click.IntRange(min=0),
+    multiple=True,
+    help=f"Terraform parallelism to compare, 0 for automatic. [default: {', '.join(str(setting) for setting in PARALLELISM_SETTINGS)}]",
+)
+@click.option(
+    "--cycles",
+    "-n",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of cycles of each setting. The fastest cycle is reported.",
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False),
+    help="Export the timings of each setting to this JSON file.",
+)
+@click.argument("lab_edition_file", type=click.Path(exists=True, dir_okay=False))
+def parallelism(ctx, settings, cycles, output, lab_edition_file):
+    """Compare Terraform parallelism settings on full cycles of LAB_EDITION_FILE."""
+    results = run_parallelism_benchmark(ctx.obj["config"], lab_edition_file, list(settings or PARALLELISM_SETTINGS), cycles)
+    rows = [[setting or "auto", f"{phases['deploy']:.3f}", f"{phases['destroy']:.3f}"] for setting, phases in results.items()]
+    click.echo(utils.create_table(["Parallelism", "Deploy (s)", "Destroy (s)"], rows))
+    fastest = min(results, key=lambda setting: results[setting]["deploy"] + results[setting]["destroy"])
+    click.echo(f"Fastest: {fastest or 'auto'}.")
+    if output:
+        with open(output, "w") as f:
+            json.dump({str(setting): phases for setting, phases in results.items()}, f, indent=2)
+
+if __name__ == "__main__":
+    benchmark()
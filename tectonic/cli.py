@@ -338,6 +338,11 @@ def init_logging(logfile, loglevel):
     "--packer_executable_path",
     help="Packer executable path",
 )
+@click.option(
+    "--metrics_file",
+    type=click.Path(dir_okay=False),
+    help="Export client call metrics to this JSON file.",
+)
 @click.option(
     "--libvirt_uri",
     help="URI to connect to server, if using libvirt. [default: qemu:///system]",
@@ -383,6 +388,7 @@ def tectonic(
         gitlab_backend_username,
         gitlab_backend_access_token,
         packer_executable_path,
+        metrics_file,
         libvirt_uri,
         proxy,
         keep_ansible_logs,
@@ -417,6 +423,8 @@ def tectonic(
         config.packer_executable_path = packer_executable_path
     if packer_executable_path:
         config.packer_executable_path = packer_executable_path
+    if metrics_file:
+        config.metrics_file = metrics_file
     if libvirt_uri:
         config.libvirt.uri = libvirt_uri
     if proxy:
@@ -440,6 +448,7 @@ def tectonic(
     ctx.obj["config"] = config
     ctx.obj["description"] = Description(config, lab_edition_file)
     ctx.obj["core"] = Core(ctx.obj["description"])
+    ctx.call_on_close(ctx.obj["core"].report_metrics)
 
 @tectonic.command()
 @click.pass_context
@@ -471,8 +480,12 @@ def deploy(ctx, guest_images, instances, service_image_list, force):
     if not force:
         confirm_machines(ctx, instances, guest_names=None, copies=None, action="Deploying")
 
-    ctx.obj["core"].deploy(instances, guest_images, service_image_list)
+    routes = ctx.obj["core"].deploy(instances, guest_images, service_image_list)
     _info(ctx)
+    if routes:
+        logger.warning("The following routes must be added on the libvirt hosts for the instances to reach the services:")
+        rows = [[route["host"], route["destination"], route["gateway"]] for route in routes]
+        logger.info(utils.create_table(["Host", "Destination", "Gateway"], rows))
 
 
 @tectonic.command()
@@ -558,17 +571,24 @@ def destroy(ctx, images, services, service_image_list, instances, force):
     callback=split_guests,
     help="Guest or service names (repeatable or comma-separated) for which to create their base images. Use 'all' for all guests and services or 'none' for no machines. [default: only scenario guests]",
 )
+@click.option(
+    "--rebuild/--no-rebuild",
+    default=False,
+    show_default=True,
+    help="Whether to rebuild guest images whose definition, playbooks and Packer module did not change.",
+)
 @click.option(
     "--force",
     "-f",
     help="Force the destruction of instances without a confirmation prompt.",
     is_flag=True,
 )
-def create_images(ctx, guests, force):
+def create_images(ctx, guests, rebuild, force):
     """Create lab base images.
 
     Note that existing images will be destroyed. No guests using these
-    images can be running.
+    images can be running. Guest images that were built from the same
+    inputs are kept, unless --rebuild is set.
 
     """
     if guests is not None:
@@ -583,7 +603,7 @@ def create_images(ctx, guests, force):
         confirm_machines(ctx, instances=None, guest_names=guests, copies=None, action="Creating images for", print_instances=False)
 
     ctx.obj["core"].create_services_images(services)
-    ctx.obj["core"].create_instances_images(scenario_guests)
+    ctx.obj["core"].create_instances_images(scenario_guests, rebuild)
 
 
 @tectonic.command(name="list")
@@ -620,6 +640,30 @@ def list_instances(ctx, instances, guests, copies):
             rows.append([machine, info[0], info[1]])
         logger.info(utils.create_table(headers,rows))
         
+@tectonic.command()
+@click.pass_context
+@click.option(
+    "--instances", "-i", help="Range of instances to check.", type=NUMBER_RANGE
+)
+def check(ctx, instances):
+    """Show the resources that changed outside of Terraform (drift).
+
+    Only refreshes the Terraform states, nothing is changed.
+    """
+    logger.info("Checking Cyber Range resources...")
+    result = ctx.obj["core"].check(instances)
+
+    rows = []
+    for instance, addresses in sorted(result["instances"].items(), key=lambda item: (item[0] is None, item[0] or 0)):
+        for address in addresses:
+            rows.append([instance if instance is not None else "shared", address])
+    for address in result["services"]:
+        rows.append(["services", address])
+    if rows:
+        logger.info(utils.create_table(["Instance", "Drifted resource"], rows))
+    else:
+        logger.info("No drift found.")
+
 @tectonic.command()
 @click.pass_context
 @click.option(
@@ -810,6 +854,28 @@ def student_access(ctx, instances, force):
         rows.append([username, users['password']])
     logger.info(utils.create_table(headers,rows))
 
+@tectonic.command()
+@click.pass_context
+@click.option(
+    "--force",
+    "-f",
+    help="Migrate the Terraform states without a confirmation prompt.",
+    is_flag=True,
+)
+def migrate_states(ctx, force):
+    """Move a deployed lab from a single Terraform state to sharded states.
+
+    Instances are grouped in states of terraform_shard_size instances, as
+    configured in the ini file. Resources shared by all the instances
+    are moved to a separate state.
+    """
+    if not force:
+        logger.info(f"Migrating the Terraform state of the instances to shards of {ctx.obj['config'].terraform_shard_size} instances.")
+        click.confirm("Continue?", abort=True)
+    moved = ctx.obj["core"].migrate_terraform_states()
+    rows = [[state_name, count] for state_name, count in moved.items()]
+    logger.info(utils.create_table(["State", "Resources"], rows))
+
 @tectonic.command()
 @click.pass_context
 def info(ctx):
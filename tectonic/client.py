@@ -19,6 +19,7 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 
 class ClientException(Exception):
     pass
@@ -30,6 +31,8 @@ class Client(ABC):
     Description: Implement API calls for each deployment technology.
     You must implement this class if you add a new platform.
     """
+    # Machine information loaded with seed_machine_info
+    _machine_info = None
 
     def __init__(self, config, description):
         """
@@ -64,6 +67,20 @@ class Client(ABC):
         """
         pass
         
+    def wait_for_machines(self, machine_names):
+        """
+        Wait until the platform reports that new machines are ready. The
+        default implementation does not wait, as Terraform only reports
+        the machines once they are running.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+
+        Return:
+            dict: whether each machine is ready.
+        """
+        return {machine_name: True for machine_name in machine_names}
+
     @abstractmethod
     def get_machine_private_ip(self, machine_name):
         """
@@ -79,6 +96,30 @@ class Client(ABC):
         """
         pass
 
+    def get_machines_private_ip(self, machine_names):
+        """
+        Return the private IP address of several machines.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+
+        Return:
+            dict: IP address or None for each machine.
+        """
+        return {machine_name: self.get_machine_private_ip(machine_name) for machine_name in machine_names}
+
+    def get_machines_ip_in_services_network(self, machine_names):
+        """
+        Return the private IP address in the services network of several machines.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+
+        Return:
+            dict: IP address or None for each machine.
+        """
+        return {machine_name: self.get_machine_ip_in_services_network(machine_name) for machine_name in machine_names}
+
     def get_machine_ip_in_services_network(self, machine_name):
         """
         Return the private IP address of an machine in the services network.
@@ -118,6 +159,90 @@ class Client(ABC):
         """
         pass
 
+    @contextmanager
+    def image_usage_index(self, image_names):
+        """
+        Share image lookups and usage information between the image operations of a batch.
+        Inside the context, is_image_in_use and delete_image may answer from an index built
+        once for all images. The default implementation does not build any index.
+
+        Parameters:
+            image_names (list(str)): names of the images of the batch.
+        """
+        yield
+
+    def get_image_fingerprint(self, image_name):
+        """
+        Return the fingerprint of the inputs that an image was built from.
+        The default implementation does not keep fingerprints, so images
+        are always considered outdated.
+
+        Parameters:
+            image_name (str): name of the image.
+
+        Return:
+            str: fingerprint of the image, or None if the image does not exist or has no fingerprint.
+        """
+        return None
+
+    def get_image_fingerprints(self, image_names):
+        """
+        Return the fingerprints of several images. The default
+        implementation looks them up one by one.
+
+        Parameters:
+            image_names (list(str)): names of the images.
+
+        Return:
+            dict: fingerprint of each image, or None if the image does not exist or has no fingerprint.
+        """
+        return {image_name: self.get_image_fingerprint(image_name) for image_name in image_names}
+
+    def set_image_fingerprint(self, image_name, fingerprint):
+        """
+        Record the fingerprint of the inputs of an image after it was built.
+        The default implementation does nothing, for platforms where Packer
+        already stores the fingerprint with the image.
+
+        Parameters:
+            image_name (str): name of the image.
+            fingerprint (str): fingerprint of the image.
+        """
+        pass
+
+    def invalidate_cache(self):
+        """
+        Discard any information about machines and images kept by the client,
+        after they were changed outside of it (for example, by Terraform).
+        """
+        self._machine_info = None
+
+    def seed_machine_info(self, machine_info):
+        """
+        Load information about machines that is already known, for
+        example from the Terraform outputs, so that it is not requested
+        again to the platform. It is kept until the cache is invalidated.
+
+        Parameters:
+            machine_info (dict): id, private_ip, public_ip and/or services_ip of each machine.
+        """
+        if self._machine_info is None:
+            self._machine_info = {}
+        for machine_name, info in machine_info.items():
+            self._machine_info.setdefault(machine_name, {}).update(info)
+
+    def _get_machine_info(self, machine_name):
+        """
+        Return the known information about a machine.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            dict: known id, private_ip, public_ip and services_ip of the machine.
+        """
+        return (self._machine_info or {}).get(machine_name, {})
+
     @abstractmethod
     def delete_image(self, image_name):
         """
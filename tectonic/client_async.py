@@ -0,0 +1,145 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from tectonic.client import ClientException
+
+class ClientAsyncException(ClientException):
+    pass
+
+class AsyncClient:
+    """
+    AsyncClient class.
+
+    Description: asyncio interface to a Tectonic client. Each operation runs the
+    blocking call of the wrapped client in a thread pool, and a semaphore bounds
+    the number of operations in progress.
+    """
+
+    def __init__(self, client, concurrency=10):
+        """
+        Init method.
+
+        Parameters:
+            client (Client): Tectonic client object to wrap.
+            concurrency (int): maximum number of operations in progress at the same time. Default: 10
+        """
+        self.client = client
+        self.concurrency = int(concurrency)
+        if self.concurrency < 1:
+            raise ClientAsyncException(f"Invalid concurrency {concurrency}. Must be at least 1.")
+        self._executor = None
+        self._semaphores = {}
+
+    def _semaphore(self):
+        """
+        Return the semaphore of the running event loop.
+
+        Return:
+            asyncio.Semaphore: the semaphore.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores = {loop: asyncio.Semaphore(self.concurrency)}
+        return self._semaphores[loop]
+
+    async def _call(self, method, *args):
+        """
+        Run a method of the wrapped client in the thread pool.
+
+        Parameters:
+            method (str): name of the client method.
+            args: arguments of the method.
+
+        Return:
+            the result of the method.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        async with self._semaphore():
+            return await asyncio.get_running_loop().run_in_executor(self._executor, getattr(self.client, method), *args)
+
+    async def get_machine_status(self, machine_name):
+        return await self._call("get_machine_status", machine_name)
+
+    async def get_machine_private_ip(self, machine_name):
+        return await self._call("get_machine_private_ip", machine_name)
+
+    async def get_machine_ip_in_services_network(self, machine_name):
+        return await self._call("get_machine_ip_in_services_network", machine_name)
+
+    async def get_machine_public_ip(self, machine_name):
+        return await self._call("get_machine_public_ip", machine_name)
+
+    async def is_image_in_use(self, image_name):
+        return await self._call("is_image_in_use", image_name)
+
+    async def delete_image(self, image_name):
+        return await self._call("delete_image", image_name)
+
+    async def start_machine(self, machine_name):
+        return await self._call("start_machine", machine_name)
+
+    async def stop_machine(self, machine_name):
+        return await self._call("stop_machine", machine_name)
+
+    async def restart_machine(self, machine_name):
+        return await self._call("restart_machine", machine_name)
+
+    async def gather(self, method, names):
+        """
+        Run an operation for several machines or images concurrently.
+
+        Parameters:
+            method (str): name of the operation.
+            names (list(str)): names of the machines or images.
+
+        Return:
+            dict: result of the operation for each name.
+        """
+        names = list(names)
+        results = await asyncio.gather(*[getattr(self, method)(name) for name in names])
+        return dict(zip(names, results))
+
+    def run(self, method, names):
+        """
+        Synchronous adapter of gather, for callers outside of an event loop.
+
+        Parameters:
+            method (str): name of the operation.
+            names (list(str)): names of the machines or images.
+
+        Return:
+            dict: result of the operation for each name.
+        """
+        names = list(names)
+        if self.concurrency == 1 or len(names) <= 1:
+            return {name: getattr(self.client, method)(name) for name in names}
+        return asyncio.run(self.gather(method, names))
+
+    def close(self):
+        """
+        Shut down the thread pool.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -19,11 +19,13 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 from tectonic.client import Client, ClientException
+from tectonic.client_factory_aws import ClientFactoryAWS
 from tectonic.ssh import interactive_shell
 from tectonic.constants import OS_DATA
 
-import boto3
 import json
+import time
+from contextlib import contextmanager
 
 class ClientAWSException(ClientException):
     pass
@@ -52,7 +54,18 @@ class ClientAWS(Client):
         "stopped": "STOPPED",
         "terminated": "NOT FOUND",
     }
+    # Instance properties that can be answered from the Terraform outputs
+    MACHINE_INFO_PROPERTIES = {
+        "InstanceId": "id",
+        "PrivateIpAddress": "private_ip",
+        "PublicIpAddress": "public_ip",
+    }
     EIC_ENDPOINT_SSH_PROXY = "aws ec2-instance-connect open-tunnel --instance-id %h"
+    MAX_FILTER_VALUES = 200
+    # Tag of the AMIs with the fingerprint of their build inputs
+    IMAGE_FINGERPRINT_TAG = "TectonicFingerprint"
+    # Maximum number of instance ids in a describe_instance_status call
+    MAX_STATUS_INSTANCE_IDS = 100
 
     def __init__(self, config, description):
         """
@@ -63,11 +76,18 @@ class ClientAWS(Client):
             description (Description): Tectonic description object.
         """
         super().__init__(config, description)
+        self._images = None
+        self._image_usage = None
         try:
-            self.connection = boto3.client("ec2", config.aws.region)
+            self.client_factory = ClientFactoryAWS.get(config.aws)
+            self.connection = self.client_factory.client("ec2")
         except Exception as e:
             raise ClientAWSException(f"Error creating aws client: {e}") from e
 
+    def __del__(self):
+        # The connection is shared with other AWS clients and owned by the client factory.
+        pass
+
     def _get_machine_property(self, machine_name, property):
         """
         Return a property of an machine.
@@ -79,6 +99,9 @@ class ClientAWS(Client):
         Return:
             str: property og the machine.
         """
+        info_key = self.MACHINE_INFO_PROPERTIES.get(property)
+        if info_key in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)[info_key]
         try:
             response = self.connection.describe_instances(
                 Filters=[
@@ -94,25 +117,146 @@ class ClientAWS(Client):
         except Exception as e:
             raise ClientAWSException(f"Error getting machine property: {e}") from e
 
-    def _get_image_snapshots(self, image_name):
+    def _get_machine_ids(self, machine_names):
+        """
+        Return the instance identifiers of the machines. The identifiers
+        not known from the Terraform outputs are looked up with one
+        describe_instances call for every MAX_FILTER_VALUES names, and
+        kept with the machine information.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+
+        Returns:
+            dict: identifier of each machine, or None if it does not exist.
+        """
+        info_key = self.MACHINE_INFO_PROPERTIES["InstanceId"]
+        machine_ids = {machine_name: self._get_machine_info(machine_name).get(info_key) for machine_name in machine_names}
+        missing = [machine_name for machine_name, machine_id in machine_ids.items() if machine_id is None]
+        try:
+            found = {machine_name: [] for machine_name in missing}
+            for i in range(0, len(missing), self.MAX_FILTER_VALUES):
+                filters = [
+                    {"Name": "tag:Name", "Values": missing[i:i + self.MAX_FILTER_VALUES]},
+                    self.INSTANCE_STATE_NAME_FILTER,
+                ]
+                next_token = None
+                while True:
+                    if next_token is None:
+                        response = self.connection.describe_instances(Filters=filters, DryRun=False, MaxResults=1000)
+                    else:
+                        response = self.connection.describe_instances(Filters=filters, DryRun=False, MaxResults=1000, NextToken=next_token)
+                    for reservation in response["Reservations"]:
+                        for instance in reservation["Instances"]:
+                            for tag in instance.get("Tags", []):
+                                if tag["Key"] == "Name" and tag["Value"] in found:
+                                    found[tag["Value"]].append(instance["InstanceId"])
+                    next_token = response.get("NextToken")
+                    if not next_token:
+                        break
+        except Exception as e:
+            raise ClientAWSException(f"Error getting machine ids: {e}") from e
+        # Like _get_machine_property, names matching several instances are not resolved
+        resolved = {machine_name: instance_ids[0] for machine_name, instance_ids in found.items() if len(instance_ids) == 1}
+        self.seed_machine_info({machine_name: {info_key: machine_id} for machine_name, machine_id in resolved.items()})
+        return {**machine_ids, **resolved}
+
+    def _describe_images(self, image_names):
+        """
+        Return the images with the given names using one describe_images call
+        for every MAX_FILTER_VALUES names.
+
+        Parameters:
+            image_names (list(str)): names of the images.
+
+        Returns:
+            dict: image description for each name. Names not matching exactly one image map to None.
+        """
+        # A filter without values matches every image
+        if not image_names:
+            return {}
+        try:
+            images = {image_name: [] for image_name in image_names}
+            names = list(images)
+            for i in range(0, len(names), self.MAX_FILTER_VALUES):
+                response = self.connection.describe_images(Filters=[{"Name": "tag:Name", "Values": names[i:i + self.MAX_FILTER_VALUES]}], DryRun=False)
+                for image in response["Images"]:
+                    for tag in image.get("Tags", []):
+                        if tag["Key"] == "Name" and tag["Value"] in images:
+                            images[tag["Value"]].append(image)
+            return {image_name: found[0] if len(found) == 1 else None for image_name, found in images.items()}
+        except Exception as e:
+            raise ClientAWSException(f"Error describing images: {e}") from e
+
+    def _get_image(self, image_name):
         """
-        Return snapshot image identifier for an image.
+        Return the description of an image, using the batch index if available.
 
         Parameters:
             image_name (str): name of the image.
 
         Returns:
-            str: the identifier of the snapshot if it was found or None otherwise.
+            dict: the image description if it was found or None otherwise.
+        """
+        if self._images is not None and image_name in self._images:
+            return self._images[image_name]
+        return self._describe_images([image_name])[image_name]
+
+    def _get_instances_by_image(self, image_ids):
+        """
+        Return the instances using each of the given images.
+        The image-id filter is applied server side, so only matching instances are paged.
+
+        Parameters:
+            image_ids (list(str)): identifiers of the images.
+
+        Returns:
+            dict: list of instance identifiers for each image identifier.
         """
         try:
-            response = self.connection.describe_images(Filters=[{"Name": "tag:Name", "Values": [image_name]}], DryRun=False)
-            if len(response["Images"]) == 1:
-                return response["Images"][0]["BlockDeviceMappings"][0]["Ebs"]["SnapshotId"]
-            else:
-                return None
+            usage = {image_id: [] for image_id in image_ids}
+            for i in range(0, len(image_ids), self.MAX_FILTER_VALUES):
+                filters = [
+                    {"Name": "image-id", "Values": image_ids[i:i + self.MAX_FILTER_VALUES]},
+                    self.INSTANCE_STATE_NAME_FILTER,
+                ]
+                next_token = None
+                while True:
+                    if next_token is None:
+                        response = self.connection.describe_instances(Filters=filters, DryRun=False, MaxResults=1000)
+                    else:
+                        response = self.connection.describe_instances(Filters=filters, DryRun=False, MaxResults=1000, NextToken=next_token)
+                    for reservation in response["Reservations"]:
+                        for instance in reservation["Instances"]:
+                            if instance.get("ImageId") in usage:
+                                usage[instance["ImageId"]].append(instance["InstanceId"])
+                    next_token = response.get("NextToken")
+                    if not next_token:
+                        break
+            return usage
         except Exception as e:
-            raise ClientAWSException(f"Error getting machine snapshots: {e}") from e
+            raise ClientAWSException(f"Error getting instances by image: {e}") from e
+
+    @contextmanager
+    def image_usage_index(self, image_names):
+        """
+        Share image lookups and usage information between the image operations of a batch.
+        All images are described with one describe_images call and their usage is obtained
+        with one server side filtered describe_instances scan.
 
+        Parameters:
+            image_names (list(str)): names of the images of the batch.
+        """
+        images = self._describe_images(image_names)
+        image_ids = [image["ImageId"] for image in images.values() if image is not None]
+        usage = self._get_instances_by_image(image_ids) if image_ids else {}
+        self._images = images
+        self._image_usage = {image_name: usage.get(image["ImageId"], []) if image else [] for image_name, image in images.items()}
+        try:
+            yield
+        finally:
+            self._images = None
+            self._image_usage = None
 
     def delete_security_groups(self, desc):
         """
@@ -138,6 +282,49 @@ class ClientAWS(Client):
                 return "NOT FOUND"
         except Exception as e:
             raise ClientAWSException(f"Error getting machine status: {e}") from e
+
+    def wait_for_machines(self, machine_names, sleep=15, timeout=600):
+        """
+        Wait until the instance and system status checks of the machines
+        pass, like aws ec2 wait instance-status-ok and wait system-status-ok,
+        but resolving all the instance identifiers at once and asking for
+        the status of up to MAX_STATUS_INSTANCE_IDS instances in each call. This is specially
+        necessary for windows machines that require a reboot in user-data
+        due to hostname change.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+            sleep (int): maximum seconds between polls. Default: 15.
+            timeout (int): seconds to wait before giving up. Default: 600.
+
+        Return:
+            dict: whether each machine is ready.
+        """
+        try:
+            machine_ids = {machine_id: machine_name for machine_name, machine_id in self._get_machine_ids(machine_names).items()
+                           if machine_id is not None}
+            ready = set()
+            pending = list(machine_ids)
+            deadline = time.monotonic() + timeout
+            tries = 0
+            while pending:
+                for i in range(0, len(pending), self.MAX_STATUS_INSTANCE_IDS):
+                    response = self.connection.describe_instance_status(
+                        InstanceIds=pending[i:i + self.MAX_STATUS_INSTANCE_IDS],
+                        DryRun=False,
+                    )
+                    ready.update(status["InstanceId"] for status in response["InstanceStatuses"]
+                                 if status["InstanceStatus"]["Status"] == "ok" and status["SystemStatus"]["Status"] == "ok")
+                pending = [machine_id for machine_id in pending if machine_id not in ready]
+                tries += 1
+                delay = min(sleep, 2 ** tries)
+                if not pending or time.monotonic() + delay > deadline:
+                    break
+                time.sleep(delay)
+            ready_names = {machine_ids[machine_id] for machine_id in ready}
+            return {machine_name: machine_name in ready_names for machine_name in machine_names}
+        except Exception as e:
+            raise ClientAWSException(f"Error waiting for machines: {e}") from e
         
     def get_machine_private_ip(self, machine_name):
         try:
@@ -151,47 +338,64 @@ class ClientAWS(Client):
         except Exception as e:
             raise ClientAWSException(f"Error getting machine public IP: {e}") from e
         
-    def _get_image_id(self, image_name):
-        try:
-            response = self.connection.describe_images(Filters=[{"Name": "tag:Name", "Values": [image_name]}], DryRun=False)
-            if len(response["Images"]) == 1:
-                return response["Images"][0]["ImageId"]
-            else:
-                return None
-        except Exception as e:
-            raise ClientAWSException(f"Error getting image id: {e}") from e
-                 
     def is_image_in_use(self, image_name):
         try:
-            image_id = self._get_image_id(image_name)
-
-            first_request = True
-            next_token = ""
-            while next_token is not None:
-                if first_request:
-                    response = self.connection.describe_instances(Filters=[self.INSTANCE_STATE_NAME_FILTER], DryRun=False, MaxResults=50)
-                else:
-                    response = self.connection.describe_instances(Filters=[self.INSTANCE_STATE_NAME_FILTER], DryRun=False, MaxResults=50, NextToken=next_token)
-                next_token = response.get("NextToken", None)
-                first_request = False
-                for reservation in response["Reservations"]:
-                    for instance in reservation["Instances"]:
-                        if image_id == instance.get("ImageId",None):
-                            return True
-            return False
+            if self._image_usage is not None and image_name in self._image_usage:
+                return len(self._image_usage[image_name]) > 0
+            image = self._get_image(image_name)
+            if image is None:
+                return False
+            return len(self._get_instances_by_image([image["ImageId"]])[image["ImageId"]]) > 0
         except Exception as e:
             raise ClientAWSException(f"Error determining if image is in use: {e}") from e
         
+    def _image_fingerprint(self, image):
+        """
+        Return the fingerprint tag of an image description.
+
+        Parameters:
+            image (dict): image description, or None.
+
+        Returns:
+            str: the fingerprint, or None if there is no image or it has no fingerprint.
+        """
+        if image is None:
+            return None
+        return next((tag["Value"] for tag in image.get("Tags", []) if tag["Key"] == self.IMAGE_FINGERPRINT_TAG), None)
+
+    def get_image_fingerprint(self, image_name):
+        try:
+            return self._image_fingerprint(self._get_image(image_name))
+        except Exception as e:
+            raise ClientAWSException(f"Error getting image fingerprint: {e}") from e
+
+    def get_image_fingerprints(self, image_names):
+        """
+        Return the fingerprints of several images, described with a single describe_images call.
+
+        Parameters:
+            image_names (list(str)): names of the images.
+
+        Return:
+            dict: fingerprint of each image, or None if the image does not exist or has no fingerprint.
+        """
+        try:
+            return {image_name: self._image_fingerprint(image) for image_name, image in self._describe_images(image_names).items()}
+        except Exception as e:
+            raise ClientAWSException(f"Error getting image fingerprints: {e}") from e
+
     def delete_image(self, image_name):
         try:
             if self.is_image_in_use(image_name):
                 raise ClientAWSException(f"Error deleting image {image_name}: in use")
-            image_id = self._get_image_id(image_name)
-            snapshot_id = self._get_image_snapshots(image_name)
-            if image_id:
-                self.connection.deregister_image(ImageId=image_id, DryRun=False)
-            if snapshot_id:
-                self.connection.delete_snapshot(SnapshotId=snapshot_id, DryRun=False)
+            image = self._get_image(image_name)
+            if image:
+                self.connection.deregister_image(ImageId=image["ImageId"], DryRun=False)
+                snapshot_id = image["BlockDeviceMappings"][0]["Ebs"]["SnapshotId"]
+                if snapshot_id:
+                    self.connection.delete_snapshot(SnapshotId=snapshot_id, DryRun=False)
+                if self._images is not None and image_name in self._images:
+                    self._images[image_name] = None
         except Exception as e:
             raise ClientAWSException(f"Error deleting image: {e}") from e
         
@@ -19,10 +19,13 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 from tectonic.client import Client, ClientException
+from tectonic.placement import Placement
 
 import logging
 import docker
 import subprocess
+import time
+import threading
 from ipaddress import ip_network, ip_address
 
 class ClientDockerException(ClientException):
@@ -44,6 +47,13 @@ class ClientDocker(Client):
         "removing": "REMOVING",
         "dead": "DEAD",
     }
+    # Label of the images with the fingerprint of their build inputs
+    IMAGE_FINGERPRINT_LABEL = "tectonic.fingerprint"
+
+    placement = None
+    _inventory = None
+    _inventory_time = 0
+    _image_ids = None
 
     def __init__(self, config, description):
         """
@@ -54,6 +64,8 @@ class ClientDocker(Client):
             description (Description): Tectonic description object.
         """
         super().__init__(config, description)
+        # Concurrent queries must wait for the snapshot instead of listing the containers again
+        self._inventory_lock = threading.Lock()
         logging.getLogger("docker").setLevel(logging.WARNING)
         logging.getLogger("urllib3").setLevel(logging.WARNING)
         try:
@@ -61,10 +73,146 @@ class ClientDocker(Client):
         except Exception as e:
             self.connection = None
             raise ClientDockerException(f"Cannot connect to docker server at {config.docker.uri}: {e}")
-        
+        self._connect_hosts()
+
+    def _connect_hosts(self):
+        """
+        Connect to the docker servers of the cluster, if hosts are configured,
+        and place the lab instances on them.
+        """
+        self.connections = {}
+        self.invalidate_cache()
+        if not self.config.docker.hosts:
+            return
+        services_host = None
+        for host in self.config.docker.hosts:
+            if host["uri"] == self.config.docker.uri:
+                self.connections[host["name"]] = self.connection
+                services_host = host["name"]
+            else:
+                try:
+                    self.connections[host["name"]] = docker.DockerClient(base_url=host["uri"])
+                except Exception as e:
+                    raise ClientDockerException(f"Cannot connect to docker server at {host['uri']}: {e}")
+        self.placement = Placement(self.description, self.config.docker.hosts, services_host)
+
+    def _all_connections(self):
+        """
+        Return the connections to every docker server used by the lab.
+
+        Return:
+            list(DockerClient): the connection to the server in uri first, then the
+              connections to the other hosts.
+        """
+        result = [self.connection]
+        if self.placement is not None:
+            for host in self.config.docker.hosts:
+                connection = self.connections[host["name"]]
+                if connection is not self.connection:
+                    result.append(connection)
+        return result
+
+    def _get_connection(self, machine_name):
+        """
+        Return the connection to the docker server that runs a machine.
+        Service machines always run in the server configured in uri.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            DockerClient: the connection.
+        """
+        if self.placement is not None:
+            host = self.placement.host_of_machine(machine_name)
+            if host is not None:
+                return self.connections[host["name"]]
+        return self.connection
+
+    @staticmethod
+    def _container_name(container):
+        """
+        Return the name of a container listed without inspecting it.
+
+        Parameters:
+            container (Container): the container.
+
+        Return:
+            str: name of the container.
+        """
+        names = container.attrs.get("Names")
+        if names:
+            return names[0].lstrip("/")
+        return container.name
+
+    def _get_inventory(self):
+        """
+        Return a snapshot of the lab containers in every docker server, listed
+        with a single call per server. The snapshot is reused for
+        docker.inventory_ttl seconds, or until the cache is invalidated.
+
+        Return:
+            dict: containers by name in each server, keyed by the id of its connection.
+        """
+        with self._inventory_lock:
+            if self._inventory is None or time.monotonic() - self._inventory_time >= int(self.config.docker.inventory_ttl):
+                prefix = f"{self.description.institution}-{self.description.lab_name}-"
+                inventory = {}
+                for connection in self._all_connections():
+                    containers = inventory.setdefault(id(connection), {})
+                    for container in connection.containers.list(all=True, sparse=True, filters={"name": prefix}):
+                        name = self._container_name(container)
+                        if name and name.startswith(prefix):
+                            containers.setdefault(name, container)
+                self._inventory = inventory
+                self._inventory_time = time.monotonic()
+                self._image_ids = {}
+            return self._inventory
+
+    def _get_container(self, machine_name):
+        """
+        Return a container from the inventory snapshot of the server that runs it.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            Container: the container, or None if it does not exist.
+        """
+        return self._get_inventory()[id(self._get_connection(machine_name))].get(machine_name)
+
+    def _invalidate_inventory(self):
+        """
+        Discard the inventory snapshot and the image ids cached with it, so
+        they are listed again after the state of a container changes.
+        """
+        with self._inventory_lock:
+            self._inventory = None
+            self._image_ids = None
+
+    def invalidate_cache(self):
+        super().invalidate_cache()
+        self._invalidate_inventory()
+
+    def get_docker_host(self, machine_name):
+        """
+        Return the URI of the docker server that runs a machine.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            str: the docker server URI.
+        """
+        if self.placement is not None:
+            host = self.placement.host_of_machine(machine_name)
+            if host is not None:
+                return host["uri"]
+        return self.config.docker.uri
+
     def get_machine_status(self, machine_name):
         try:
-            container = self.connection.containers.get(machine_name)
+            container = self._get_container(machine_name)
             if container:
                 return self.STATE_MSG.get(container.status, "NOT FOUND")
             return "NOT FOUND"
@@ -77,8 +225,10 @@ class ClientDocker(Client):
         try:
             if machine_name in self.description.services_guests.keys():
                 return self.description.services_guests[machine_name].service_ip
+            elif "private_ip" in self._get_machine_info(machine_name):
+                return self._get_machine_info(machine_name)["private_ip"]
             else:
-                container = self.connection.containers.get(machine_name)
+                container = self._get_container(machine_name)
                 if container:
                     for network in container.attrs["NetworkSettings"]["Networks"]:
                         ip_addr = container.attrs["NetworkSettings"]["Networks"][network]["IPAddress"]
@@ -89,8 +239,10 @@ class ClientDocker(Client):
             raise ClientDockerException(str(e)) from e
         
     def get_machine_ip_in_services_network(self, machine_name):
+        if "services_ip" in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)["services_ip"]
         try:
-            container = self.connection.containers.get(machine_name)
+            container = self._get_container(machine_name)
             if container:
                 for network in container.attrs["NetworkSettings"]["Networks"]:
                     ip_addr = container.attrs["NetworkSettings"]["Networks"][network]["IPAddress"]
@@ -100,62 +252,127 @@ class ClientDocker(Client):
         except Exception as e:
             raise ClientDockerException(str(e)) from e
 
-    def _get_image_id(self, image_name):
+    def _get_image_id(self, image_name, connection=None):
+        connection = connection or self.connection
+        key = (id(connection), image_name)
+        with self._inventory_lock:
+            image_ids = self._image_ids
+            if image_ids is not None and key in image_ids:
+                return image_ids[key]
         try:
-            image = self.connection.images.get(image_name)
-            if image:
-                return image.id
-            return None
+            image = connection.images.get(image_name)
+            image_id = image.id if image else None
         except docker.errors.ImageNotFound as exception:
-            return None
+            image_id = None
         except Exception as e:
             raise ClientDockerException(f"Error getting image id: {e}") from e
+        with self._inventory_lock:
+            # Not cached if the snapshot was invalidated during the lookup
+            if image_ids is not None and image_ids is self._image_ids:
+                image_ids[key] = image_id
+        return image_id
                  
     def is_image_in_use(self, image_name):
         try:
-            for container in self.connection.containers.list():
-                if container.image and f"{image_name}:latest" in container.image.tags:
+            inventory = self._get_inventory()
+            for connection in self._all_connections():
+                image_id = self._get_image_id(image_name, connection)
+                if not image_id:
+                    continue
+                if any(container.attrs.get("ImageID") == image_id for container in inventory[id(connection)].values()):
+                    return True
+                # The inventory only has the containers of this lab
+                if connection.containers.list(all=True, filters={"ancestor": image_name}):
                     return True
             return False
         except Exception as e:
             raise ClientDockerException(f"Error determining if image is in use: {e}") from e
         
+    def get_image_fingerprint(self, image_name):
+        try:
+            fingerprints = set()
+            for connection in self._all_connections():
+                try:
+                    image = connection.images.get(image_name)
+                except docker.errors.ImageNotFound:
+                    image = None
+                if image is None:
+                    return None
+                fingerprints.add(image.labels.get(self.IMAGE_FINGERPRINT_LABEL))
+            # In cluster mode, every host must have the same image
+            return fingerprints.pop() if len(fingerprints) == 1 else None
+        except Exception as e:
+            raise ClientDockerException(f"Error getting image fingerprint: {e}") from e
+
     def delete_image(self, image_name):
         try:
             if self.is_image_in_use(image_name):
                 raise ClientDockerException(f"Error deleting image {image_name}: in use")
-            if self._get_image_id(image_name):
-                self.connection.images.remove(image_name)
+            for connection in self._all_connections():
+                if self._get_image_id(image_name, connection):
+                    connection.images.remove(image_name)
         except Exception as exception:
             raise ClientDockerException(f"{exception}")
+        finally:
+            with self._inventory_lock:
+                if self._image_ids:
+                    self._image_ids.clear()
+
+    def copy_image(self, image_name):
+        """
+        Copy an image from the server in uri to the other hosts of the cluster.
+
+        Parameters:
+            image_name (str): name of the image.
+        """
+        connections = self._all_connections()[1:]
+        if not connections:
+            return
+        try:
+            image = self.connection.images.get(image_name)
+            for connection in connections:
+                connection.images.load(b"".join(image.save(named=True)))
+        except Exception as exception:
+            raise ClientDockerException(f"Error copying image {image_name}: {exception}") from exception
+        finally:
+            with self._inventory_lock:
+                if self._image_ids:
+                    self._image_ids.clear()
         
     def start_machine(self, machine_name):
         try:
-            container = self.connection.containers.get(machine_name)
+            container = self._get_connection(machine_name).containers.get(machine_name)
             container.start()
         except Exception as exception:
             raise ClientDockerException(f"{exception}")
+        finally:
+            self._invalidate_inventory()
         
     def stop_machine(self, machine_name):
         try:
-            container = self.connection.containers.get(machine_name)
+            container = self._get_connection(machine_name).containers.get(machine_name)
             container.stop()
         except Exception as exception:
             raise ClientDockerException(f"{exception}")
+        finally:
+            self._invalidate_inventory()
         
     def restart_machine(self, machine_name):
         try:
-            container = self.connection.containers.get(machine_name)
+            container = self._get_connection(machine_name).containers.get(machine_name)
             container.restart()
         except Exception as exception:
             raise ClientDockerException(f"{exception}")
+        finally:
+            self._invalidate_inventory()
         
     def console(self, machine_name, username):
         try:
-            container = self.connection.containers.get(machine_name)
-            subprocess.run([f"docker exec -u {username} -it {container.id} /bin/bash"], shell=True)
+            container = self._get_connection(machine_name).containers.get(machine_name)
+            docker_host = f"-H {self.get_docker_host(machine_name)} " if self.placement is not None else ""
+            subprocess.run([f"docker {docker_host}exec -u {username} -it {container.id} /bin/bash"], shell=True)
             # TODO: Fix terminal using sockets
-            # container = self.connection.containers.get(machine_name)
+            # container = self._get_connection(machine_name).containers.get(machine_name)
             # (_,s) = container.exec_run("/bin/bash", stdin=True, socket=True, user=username)
             # while True:
             #     original_text_to_send = input("$") + '\n'
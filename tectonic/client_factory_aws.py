@@ -0,0 +1,254 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+class ClientFactoryAWSException(Exception):
+    pass
+
+class TokenBucket:
+    """
+    TokenBucket class.
+
+    Description: client-side rate limiter. Each request takes one token and tokens
+    are refilled at a fixed rate up to the bucket capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        Init method.
+
+        Parameters:
+            rate (float): tokens added per second.
+            capacity (float): maximum number of tokens. Default: rate.
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take one token, blocking until it is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class ClientFactoryAWS:
+    """
+    ClientFactoryAWS class.
+
+    Description: thread-safe factory of boto3 clients shared by all AWS components.
+    Clients are created from a dedicated boto3 session with a configurable connection
+    pool, the configured retry mode and an optional client-side token bucket, and
+    throttling events are counted per operation.
+    """
+
+    THROTTLING_ERROR_CODES = [
+        "RequestLimitExceeded",
+        "Throttling",
+        "ThrottlingException",
+        "TooManyRequestsException",
+    ]
+
+    _factories = {}
+    _factories_lock = threading.Lock()
+
+    def __init__(self, region, max_pool_connections=50, max_attempts=10, retry_mode="adaptive", requests_per_second=0):
+        """
+        Init method.
+
+        Parameters:
+            region (str): AWS region.
+            max_pool_connections (int): maximum number of connections kept in each client pool. Default: 50
+            max_attempts (int): maximum number of attempts of each request, including retries. Default: 10
+            retry_mode (str): botocore retry mode. Default: adaptive
+            requests_per_second (float): client-side rate limit. Use 0 to disable it. Default: 0
+        """
+        self.region = region
+        self.config = Config(
+            region_name=region,
+            max_pool_connections=int(max_pool_connections),
+            retries={"max_attempts": int(max_attempts), "mode": retry_mode},
+        )
+        self.rate_limiter = TokenBucket(float(requests_per_second)) if float(requests_per_second) > 0 else None
+        self._session = None
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"calls": 0, "retries": 0, "throttled": {}}
+        self._instrumentation = None
+
+    @classmethod
+    def get(cls, aws_config):
+        """
+        Return the factory shared by every component using the given AWS configuration.
+
+        Parameters:
+            aws_config (TectonicConfigAWS): Tectonic AWS config object.
+
+        Return:
+            ClientFactoryAWS: the shared factory.
+        """
+        key = (
+            aws_config.region,
+            str(aws_config.max_pool_connections),
+            str(aws_config.max_attempts),
+            aws_config.retry_mode,
+            str(aws_config.requests_per_second),
+        )
+        with cls._factories_lock:
+            if key not in cls._factories:
+                cls._factories[key] = ClientFactoryAWS(
+                    aws_config.region,
+                    aws_config.max_pool_connections,
+                    aws_config.max_attempts,
+                    aws_config.retry_mode,
+                    aws_config.requests_per_second,
+                )
+            return cls._factories[key]
+
+    def client(self, service_name="ec2"):
+        """
+        Return the shared client for a service, creating it on first use.
+
+        Parameters:
+            service_name (str): AWS service name. Default: ec2
+
+        Return:
+            botocore.client.BaseClient: boto3 client.
+        """
+        with self._lock:
+            if service_name not in self._clients:
+                try:
+                    if self._session is None:
+                        self._session = boto3.session.Session(region_name=self.region)
+                    client = self._session.client(service_name, config=self.config)
+                except Exception as e:
+                    raise ClientFactoryAWSException(f"Error creating aws client: {e}") from e
+                client.meta.events.register(f"before-send.{service_name}", self._before_send)
+                client.meta.events.register(f"needs-retry.{service_name}", self._count_retry)
+                if self._instrumentation is not None:
+                    self._register_instrumentation(client, service_name)
+                self._clients[service_name] = client
+            return self._clients[service_name]
+
+    def instrument(self, instrumentation):
+        """
+        Time every API call of the clients created by this factory.
+
+        Parameters:
+            instrumentation (Instrumentation): Tectonic instrumentation object.
+        """
+        if not instrumentation.enabled:
+            return
+        with self._lock:
+            if self._instrumentation is not None:
+                return
+            self._instrumentation = instrumentation
+            for service_name, client in self._clients.items():
+                self._register_instrumentation(client, service_name)
+
+    def _register_instrumentation(self, client, service_name):
+        """
+        Register the timing handlers in a client.
+        """
+        client.meta.events.register(f"before-call.{service_name}", self._before_call)
+        client.meta.events.register(f"after-call.{service_name}", self._after_call)
+        client.meta.events.register(f"after-call-error.{service_name}", self._after_call_error)
+
+    def _before_call(self, model=None, context=None, **kwargs):
+        """
+        Store the start time and name of an API call in its request context.
+        """
+        if context is not None:
+            context["tectonic_call"] = (model.name, time.perf_counter())
+
+    def _after_call(self, http_response=None, context=None, **kwargs):
+        """
+        Record an API call that received a response, which may be an error.
+        """
+        if context is not None and "tectonic_call" in context:
+            operation_name, start = context["tectonic_call"]
+            error = http_response is not None and http_response.status_code >= 300
+            self._instrumentation.record(f"aws.{operation_name}", time.perf_counter() - start, error)
+
+    def _after_call_error(self, context=None, **kwargs):
+        """
+        Record a failed API call.
+        """
+        if context is not None and "tectonic_call" in context:
+            operation_name, start = context["tectonic_call"]
+            self._instrumentation.record(f"aws.{operation_name}", time.perf_counter() - start, True)
+
+    def _before_send(self, **kwargs):
+        """
+        Apply the client-side rate limit before each request attempt.
+        """
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        with self._metrics_lock:
+            self._metrics["calls"] += 1
+
+    def _count_retry(self, response=None, operation=None, attempts=None, **kwargs):
+        """
+        Count throttling events of each operation.
+        """
+        if response is None:
+            return
+        error_code = response[1].get("Error", {}).get("Code")
+        if error_code in self.THROTTLING_ERROR_CODES:
+            operation_name = operation.name if operation is not None else "unknown"
+            with self._metrics_lock:
+                self._metrics["throttled"][operation_name] = self._metrics["throttled"].get(operation_name, 0) + 1
+                self._metrics["retries"] += 1
+            if self._instrumentation is not None:
+                self._instrumentation.record_retry(f"aws.{operation_name}")
+            logger.debug(f"AWS request {operation_name} throttled (attempt {attempts}).")
+
+    def metrics(self):
+        """
+        Return the request and throttling metrics of the clients created by this factory.
+
+        Return:
+            dict: number of requests sent, number of throttled retries and throttling events per operation.
+        """
+        with self._metrics_lock:
+            return {
+                "calls": self._metrics["calls"],
+                "retries": self._metrics["retries"],
+                "throttled": dict(self._metrics["throttled"]),
+            }
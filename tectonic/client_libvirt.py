@@ -19,14 +19,20 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 from tectonic.client import Client, ClientException
+from tectonic.placement import Placement
 from tectonic.ssh import interactive_shell
 
 import libvirt
 import libvirt_qemu
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from ipaddress import ip_network, ip_address
 import xml.etree.ElementTree as ET
 import uuid
+import json
+import hashlib
+from contextlib import contextmanager
 
 class ClientLibvirtException(ClientException):
     pass
@@ -36,6 +42,25 @@ class ClientLibvirtException(ClientException):
 def libvirt_callback(userdata, err):
     pass
 
+_event_loop_lock = threading.Lock()
+_event_loop_thread = None
+
+def _run_event_loop():
+    while True:
+        libvirt.virEventRunDefaultImpl()
+
+def start_event_loop():
+    """
+    Register the default libvirt event implementation and run it in a daemon thread.
+    It must be called before opening the connections that register for events.
+    """
+    global _event_loop_thread
+    with _event_loop_lock:
+        if _event_loop_thread is None:
+            libvirt.virEventRegisterDefaultImpl()
+            _event_loop_thread = threading.Thread(target=_run_event_loop, name="libvirt-event-loop", daemon=True)
+            _event_loop_thread.start()
+
 class ClientLibvirt(Client):
     """
     ClientLibvirt class.
@@ -53,6 +78,10 @@ class ClientLibvirt(Client):
         libvirt.VIR_DOMAIN_CRASHED: "CRASHED",
         libvirt.VIR_DOMAIN_PMSUSPENDED: "SUSPENDED",
     }
+    AGENT_WORKERS = 20
+    # Suffix of the sidecar volume with the metadata of an image, since
+    # libvirt volumes cannot hold arbitrary metadata
+    IMAGE_METADATA_SUFFIX = "-tectonic.json"
 
     def __init__(self, config, description):
         """
@@ -64,35 +93,187 @@ class ClientLibvirt(Client):
         """
         super().__init__(config, description)
         libvirt.registerErrorHandler(f=libvirt_callback, ctx=None)
+        self._agents_ready = set()
+        self._agents_condition = threading.Condition()
+        self._agent_events = config.libvirt.agent_events
+        self._image_usage = None
+        self._image_usage_stale = False
+        self.placement = None
+        self.connections = {}
         try:
-            self.connection = libvirt.open(config.libvirt.uri)
+            if self._agent_events:
+                start_event_loop()
+            self.connection = self._open(config.libvirt.uri)
+            if config.libvirt.hosts:
+                if len(config.libvirt.hosts) > 1 and not config.libvirt.routing:
+                    raise ClientLibvirtException("Libvirt hosts require routing to be enabled.")
+                services_host = None
+                for host in config.libvirt.hosts:
+                    if host["uri"] == config.libvirt.uri:
+                        self.connections[host["name"]] = self.connection
+                        services_host = host["name"]
+                    else:
+                        self.connections[host["name"]] = self._open(host["uri"])
+                self.placement = Placement(description, config.libvirt.hosts, services_host)
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}") from exception
 
+    def _open(self, uri):
+        """
+        Open a connection to a libvirt server, registering for events if configured.
+
+        Parameters:
+            uri (str): URI of the libvirt server.
+
+        Return:
+            virConnect: the connection.
+        """
+        connection = libvirt.open(uri)
+        if self._agent_events:
+            connection.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_AGENT_LIFECYCLE, self._agent_lifecycle_callback, None)
+            connection.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._domain_lifecycle_callback, None)
+        return connection
+
+    def _all_connections(self):
+        """
+        Return the connections to every libvirt server used by the lab.
+
+        Return:
+            list(tuple(virConnect, str)): each connection and its storage pool.
+        """
+        result = [(self.connection, self.config.libvirt.storage_pool)]
+        for host in self.config.libvirt.hosts if self.placement else []:
+            connection = self.connections[host["name"]]
+            if connection is not self.connection:
+                result.append((connection, host.get("storage_pool", self.config.libvirt.storage_pool)))
+        return result
+
+    def _get_connection(self, machine_name):
+        """
+        Return the connection to the libvirt server that runs a machine.
+        Service machines always run in the server configured in uri.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            virConnect: the connection.
+        """
+        if self.placement is not None:
+            host = self.placement.host_of_machine(machine_name)
+            if host is not None:
+                return self.connections[host["name"]]
+        return self.connection
+
+    def _lookup_domain(self, machine_name):
+        """
+        Look up a domain in the libvirt server that runs it.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            virDomain: the domain.
+        """
+        return self._get_connection(machine_name).lookupByName(machine_name)
+
+    def _agent_lifecycle_callback(self, connection, domain, state, reason, opaque):
+        """
+        Handle QEMU agent connection events: wake up the threads waiting for agents.
+        """
+        with self._agents_condition:
+            if state != libvirt.VIR_CONNECT_DOMAIN_EVENT_AGENT_LIFECYCLE_STATE_CONNECTED:
+                self._agents_ready.discard(domain.name())
+            self._agents_condition.notify_all()
+
+    def _domain_lifecycle_callback(self, connection, domain, event, detail, opaque):
+        """
+        Handle domain lifecycle events: forget the agent readiness of stopped or restarted domains.
+        """
+        if event in [libvirt.VIR_DOMAIN_EVENT_STARTED, libvirt.VIR_DOMAIN_EVENT_STOPPED, libvirt.VIR_DOMAIN_EVENT_SHUTDOWN, libvirt.VIR_DOMAIN_EVENT_CRASHED]:
+            self._forget_agent(domain.name())
+        if event in [libvirt.VIR_DOMAIN_EVENT_DEFINED, libvirt.VIR_DOMAIN_EVENT_UNDEFINED]:
+            self._image_usage_stale = True
+
+    def _forget_agent(self, machine_name):
+        """
+        Remove a machine from the agent readiness cache.
+
+        Parameters:
+            machine_name (str): name of the machine.
+        """
+        with self._agents_condition:
+            self._agents_ready.discard(machine_name)
+
     def _wait_for_agent(self, domain, sleep=5, max_tries = 10):
         """
         Connect to QEMU agent of an machine.
+        The wait gives up after the time of max_tries retries sleep seconds apart.
+        Retries back off exponentially up to sleep seconds, so they are more frequent
+        at first but the total wait does not change. Ready agents are cached, and
+        if agent events are enabled the wait ends as soon as the agent connects.
 
         Parameters:
             domain (LibvirtDomain): Libvirt domain
-            sleep (int): number of seconds to wait between retries Default: 5
+            sleep (int): maximum number of seconds to wait between retries Default: 5
             max_tries (int): max number of tries. Default: 10
         """
-        tries = 1
-        agent_ready = False
-        while not agent_ready and tries < max_tries:
+        machine_name = domain.name()
+        with self._agents_condition:
+            if machine_name in self._agents_ready:
+                return
+        deadline = time.monotonic() + sleep * (max_tries - 1)
+        tries = 0
+        while True:
             try:
                 libvirt_qemu.qemuAgentCommand(domain, '{"execute": "guest-ping"}', 10, 0)
-                agent_ready = True
+                break
             except libvirt.libvirtError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ClientLibvirtException("Cannot connect to QEMU agent.")
+                delay = min(sleep, 0.5 * 2 ** tries, remaining)
                 tries += 1
-                time.sleep(sleep)
-        if not agent_ready:
-            raise ClientLibvirtException("Cannot connect to QEMU agent.")
+                if self._agent_events:
+                    with self._agents_condition:
+                        self._agents_condition.wait(delay)
+                else:
+                    time.sleep(delay)
+        with self._agents_condition:
+            self._agents_ready.add(machine_name)
+
+    def wait_for_agents(self, machine_names, sleep=5, max_tries=10):
+        """
+        Wait in parallel for the QEMU agent of several machines.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+            sleep (int): maximum number of seconds to wait between retries Default: 5
+            max_tries (int): max number of tries. Default: 10
+
+        Return:
+            dict: whether the agent of each machine is ready.
+        """
+        def wait(machine_name):
+            try:
+                self._wait_for_agent(self._lookup_domain(machine_name), sleep, max_tries)
+                return True
+            except (libvirt.libvirtError, ClientLibvirtException):
+                return False
+        with ThreadPoolExecutor(max_workers=self.AGENT_WORKERS) as executor:
+            return dict(zip(machine_names, executor.map(wait, machine_names)))
+
+    def get_machines_private_ip(self, machine_names):
+        with ThreadPoolExecutor(max_workers=self.AGENT_WORKERS) as executor:
+            return dict(zip(machine_names, executor.map(self.get_machine_private_ip, machine_names)))
+
+    def get_machines_ip_in_services_network(self, machine_names):
+        with ThreadPoolExecutor(max_workers=self.AGENT_WORKERS) as executor:
+            return dict(zip(machine_names, executor.map(self.get_machine_ip_in_services_network, machine_names)))
         
     def get_machine_status(self, machine_name):
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             return "NOT FOUND"
         try:
@@ -102,8 +283,10 @@ class ClientLibvirt(Client):
             raise ClientLibvirtException(f"{exception}") from exception
         
     def get_machine_private_ip(self, machine_name):
+        if "private_ip" in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)["private_ip"]
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             return None
         try:
@@ -124,8 +307,10 @@ class ClientLibvirt(Client):
             raise ClientLibvirtException(f"{exception}") from exception
         
     def get_machine_ip_in_services_network(self, machine_name):
+        if "services_ip" in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)["services_ip"]
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             return None
         try:
@@ -143,78 +328,176 @@ class ClientLibvirt(Client):
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}") from exception
                  
+    def _get_volumes_in_use(self):
+        """
+        Return the domains using each volume, parsing the XML of each domain once.
+        Both disk sources and their backing stores are considered.
+
+        Return:
+            dict: names of the domains using each volume name.
+        """
+        usage = {}
+        domains = [domain for connection, _ in self._all_connections() for domain in connection.listAllDomains()]
+        for domain in domains:
+            root = ET.fromstring(domain.XMLDesc())
+            for source in root.findall(".//devices/disk//source"):
+                image_path = source.get("file")
+                if image_path is not None:
+                    usage.setdefault(image_path.split("/")[-1], set()).add(domain.name())
+        return usage
+
+    @contextmanager
+    def image_usage_index(self, image_names):
+        """
+        Share image usage information between the image operations of a batch.
+        Domains are inspected once for the whole batch. If agent events are enabled,
+        the index is rebuilt when a domain is defined or undefined during the batch.
+
+        Parameters:
+            image_names (list(str)): names of the images of the batch.
+        """
+        try:
+            self._image_usage = self._get_volumes_in_use()
+            self._image_usage_stale = False
+        except Exception as exception:
+            raise ClientLibvirtException(f"{exception}")
+        try:
+            yield
+        finally:
+            self._image_usage = None
+
     def is_image_in_use(self, image_name):
         try:
-            domains = self.connection.listAllDomains()
-            for domain in domains:
-                xml_desc = domain.XMLDesc()
-                root = ET.fromstring(xml_desc)
-                for backingStore in root.findall(".//devices/disk/backingStore"): #Check backing stores
-                    source = backingStore.find("source")
-                    if source is not None:
-                        image_path = source.get("file")
-                        if image_path is not None:
-                            image_used = image_path.split("/")[-1]
-                            if image_used == image_name:
-                                return True
-                for disk in root.findall(".//devices/disk"): #Check disks
-                    source = disk.find("source")
-                    if source is not None:
-                        image_path = source.get("file")
-                        if image_path is not None:
-                            image_used = image_path.split("/")[-1]
-                            if image_used == image_name:
-                                return True
-            return False
+            if self._image_usage is None:
+                return image_name in self._get_volumes_in_use()
+            if self._image_usage_stale:
+                self._image_usage = self._get_volumes_in_use()
+                self._image_usage_stale = False
+            return image_name in self._image_usage
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}")
         
-    def delete_image(self, image_name):
-        try:
-            if self.is_image_in_use(image_name):
-                raise ClientLibvirtException(f"Error deleting image {image_name}: in use")
-            pool = self.connection.storagePoolLookupByName(self.config.libvirt.storage_pool)
-        except libvirt.libvirtError:
-            raise ClientLibvirtException(f"Failed to locate {self.config.libvirt.storage_pool} storage pool.")
-        vol = None
+    def _read_volume(self, connection, volume):
+        """
+        Download the contents of a small volume.
+
+        Parameters:
+            connection (libvirt.virConnect): connection to the host of the volume.
+            volume (libvirt.virStorageVol): volume to read.
+
+        Return:
+            bytes: contents of the volume.
+        """
+        size = volume.info()[1]
+        stream = connection.newStream(0)
+        volume.download(stream, 0, size, 0)
+        data = b""
+        while len(data) < size:
+            chunk = stream.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        stream.finish()
+        return data
+
+    def _write_volume(self, connection, pool, volume_name, data):
+        """
+        Create a raw volume with the given contents, replacing any
+        existing volume with the same name.
+
+        Parameters:
+            connection (libvirt.virConnect): connection to the host of the pool.
+            pool (libvirt.virStoragePool): storage pool of the volume.
+            volume_name (str): name of the volume.
+            data (bytes): contents of the volume.
+        """
         try:
-            vol = pool.storageVolLookupByName(image_name)
+            pool.storageVolLookupByName(volume_name).delete()
         except libvirt.libvirtError:
             pass
-        if vol:
-            vol.delete()
+        volume = pool.createXML(
+            f"<volume><name>{volume_name}</name><capacity unit='bytes'>{len(data)}</capacity>"
+            "<target><format type='raw'/></target></volume>", 0)
+        stream = connection.newStream(0)
+        volume.upload(stream, 0, len(data), 0)
+        stream.send(data)
+        stream.finish()
+
+    def get_image_fingerprint(self, image_name):
+        try:
+            fingerprints = set()
+            for connection, storage_pool in self._all_connections():
+                pool = connection.storagePoolLookupByName(storage_pool)
+                try:
+                    pool.storageVolLookupByName(image_name)
+                    metadata = pool.storageVolLookupByName(image_name + self.IMAGE_METADATA_SUFFIX)
+                except libvirt.libvirtError:
+                    return None
+                fingerprints.add(json.loads(self._read_volume(connection, metadata)).get("fingerprint"))
+            # In cluster mode, every host must have the same image
+            return fingerprints.pop() if len(fingerprints) == 1 else None
+        except Exception as exception:
+            raise ClientLibvirtException(f"Error getting image fingerprint: {exception}") from exception
+
+    def set_image_fingerprint(self, image_name, fingerprint):
+        try:
+            data = json.dumps({"fingerprint": fingerprint}).encode()
+            for connection, storage_pool in self._all_connections():
+                self._write_volume(connection, connection.storagePoolLookupByName(storage_pool), image_name + self.IMAGE_METADATA_SUFFIX, data)
+        except Exception as exception:
+            raise ClientLibvirtException(f"Error setting image fingerprint: {exception}") from exception
+
+    def delete_image(self, image_name):
+        if self.is_image_in_use(image_name):
+            raise ClientLibvirtException(f"Error deleting image {image_name}: in use")
+        for connection, storage_pool in self._all_connections():
+            try:
+                pool = connection.storagePoolLookupByName(storage_pool)
+            except libvirt.libvirtError:
+                raise ClientLibvirtException(f"Failed to locate {storage_pool} storage pool.")
+            for volume_name in [image_name, image_name + self.IMAGE_METADATA_SUFFIX]:
+                vol = None
+                try:
+                    vol = pool.storageVolLookupByName(volume_name)
+                except libvirt.libvirtError:
+                    pass
+                if vol:
+                    vol.delete()
         
     def start_machine(self, machine_name):
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             raise ClientLibvirtException(f"Domain {machine_name} not found.")
         try:
             state, _ = domain.state()
             if state != libvirt.VIR_DOMAIN_RUNNING:
+                self._forget_agent(machine_name)
                 domain.create()
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}") from exception
         
     def stop_machine(self, machine_name):
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             raise ClientLibvirtException(f"Domain {machine_name} not found.")
         try:
             state, _ = domain.state()
             if state != libvirt.VIR_DOMAIN_SHUTOFF:
+                self._forget_agent(machine_name)
                 domain.shutdown()
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}") from exception
         
     def restart_machine(self, machine_name):
         try:
-            domain = self.connection.lookupByName(machine_name)
+            domain = self._lookup_domain(machine_name)
         except libvirt.libvirtError:
             raise ClientLibvirtException(f"Domain {machine_name} not found.")
         try:
             state, _ = domain.state()
+            self._forget_agent(machine_name)
             if state == libvirt.VIR_DOMAIN_RUNNING:
                 domain.reboot()
             elif state == libvirt.VIR_DOMAIN_SHUTOFF:
@@ -254,23 +537,138 @@ class ClientLibvirt(Client):
                 traffic_elem.set("dstipaddr", dest_ip)
                 traffic_elem.set("dstipmask", "32")
 
+    def _build_nwfilter(self, nwfilter_name, interface_ip, rules):
+        """
+        Build the XML of a network filter.
+
+        Parameters:
+            nwfilter_name (str): name of the network filter.
+            interface_ip (str): IP address of the filtered interface, or $IP for a filter shared between interfaces.
+            rules (list(TrafficRule)): inbound traffic rules to allow.
+
+        Return:
+            Element: root of the network filter XML.
+        """
+        root = ET.Element('filter', name=nwfilter_name, chain='root')
+        ET.SubElement(root, 'uuid').text = str(uuid.uuid5(uuid.NAMESPACE_URL, nwfilter_name))
+        filterref_elem = ET.SubElement(root, "filterref")
+        filterref_elem.set("filter", "qemu-announce-self") #Necessary to assign IP address to vms
+        self._add_rule_to_nwfilter(root, "all", None, None, None, None, 100, "out", "accept", None) #Allow all outbound traffic
+        priority = 500
+        # Inblund rules
+        for rule in rules:
+            self._add_rule_to_nwfilter(root, rule.protocol, rule.source_cidr, interface_ip, rule.from_port, rule.to_port, priority, "in", "accept", None)
+            priority = priority + 1
+        self._add_rule_to_nwfilter(root, "all", None, None, None, None, 1000, "in", "drop", None) #Drop all other inbound traffic
+        return root
+
+    def _nwfilter_hash(self, root):
+        """
+        Return a hash of the content of a network filter.
+        Only rules and filter references are considered, so the hash of a desired filter
+        can be compared with the hash of the XML returned by libvirt.
+
+        Parameters:
+            root (Element): root of the network filter XML.
+
+        Return:
+            str: content hash.
+        """
+        content = [(element.tag, sorted(element.attrib.items())) for element in root.iter() if element is not root and element.tag != "uuid"]
+        return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
     def create_nwfilter(self, nwfilter_name, interface_ip, rules):
         try:
-            root = ET.Element('filter', name=nwfilter_name, chain='root')
-            ET.SubElement(root, 'uuid').text = str(uuid.uuid5(uuid.NAMESPACE_URL, nwfilter_name))
-            filterref_elem = ET.SubElement(root, "filterref")
-            filterref_elem.set("filter", "qemu-announce-self") #Necessary to assign IP address to vms
-            self._add_rule_to_nwfilter(root, "all", None, None, None, None, 100, "out", "accept", None) #Allow all outbound traffic
-            priority = 500
-            # Inblund rules
-            for rule in rules:
-                self._add_rule_to_nwfilter(root, rule.protocol, rule.source_cidr, interface_ip, rule.from_port, rule.to_port, priority, "in", "accept", None)
-                priority = priority + 1
-            self._add_rule_to_nwfilter(root, "all", None, None, None, None, 1000, "in", "drop", None) #Drop all other inbound traffic
+            root = self._build_nwfilter(nwfilter_name, interface_ip, rules)
             self.connection.nwfilterDefineXML(ET.tostring(root, encoding='unicode'))
         except Exception as exception:
             raise ClientLibvirtException(f"{exception}") from exception
 
+    def _run_nwfilter_operations(self, operation, items):
+        """
+        Apply an operation to several network filters, in parallel if configured.
+
+        Parameters:
+            operation (function): operation to apply.
+            items (list): arguments of each operation call.
+        """
+        workers = int(self.config.libvirt.nwfilter_workers)
+        if workers > 1 and len(items) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(operation, items))
+        else:
+            for item in items:
+                operation(item)
+
+    def _undefine_stale_nwfilter(self, nwfilter):
+        """
+        Undefine a network filter that is no longer needed, unless a running domain still uses it.
+
+        Parameters:
+            nwfilter (virNWFilter): network filter.
+        """
+        try:
+            nwfilter.undefine()
+        except libvirt.libvirtError as exception:
+            if "in use" not in str(exception):
+                raise
+
+    def sync_nwfilters(self, nwfilters, prefix=None, keep=None):
+        """
+        Define the network filters that are missing or whose content changed, in every
+        libvirt server of the lab. Filters that are already defined with the same content
+        are not redefined, so libvirt does not rebuild the firewall rules of the domains
+        that use them.
+
+        If prefix is given, the defined filters whose name starts with it and that are not
+        in nwfilters nor in keep are stale (for example, shared filters of rules that
+        changed), and are undefined. Stale filters still used by a running domain are left
+        for the next sync.
+
+        Parameters:
+            nwfilters (dict): interface IP and traffic rules for each network filter name.
+            prefix (str): name prefix of the network filters of the lab. Default: None.
+            keep (list(str)): names of other network filters of the lab to keep. Default: None.
+
+        Return:
+            list(str): names of the network filters defined.
+        """
+        try:
+            roots = {nwfilter_name: self._build_nwfilter(nwfilter_name, interface_ip, rules) for nwfilter_name, (interface_ip, rules) in nwfilters.items()}
+            keep = set(keep or [])
+            result = set()
+            for connection, _ in self._all_connections():
+                defined = {nwfilter.name(): nwfilter for nwfilter in connection.listAllNWFilters()}
+                to_define = []
+                for nwfilter_name, root in roots.items():
+                    current = defined.get(nwfilter_name)
+                    if current is None or self._nwfilter_hash(ET.fromstring(current.XMLDesc())) != self._nwfilter_hash(root):
+                        to_define.append(ET.tostring(root, encoding='unicode'))
+                self._run_nwfilter_operations(connection.nwfilterDefineXML, to_define)
+                result.update(ET.fromstring(xml).get("name") for xml in to_define)
+                if prefix:
+                    stale = [nwfilter for nwfilter_name, nwfilter in defined.items()
+                             if nwfilter_name.startswith(prefix) and nwfilter_name not in roots and nwfilter_name not in keep]
+                    self._run_nwfilter_operations(self._undefine_stale_nwfilter, stale)
+            return sorted(result)
+        except Exception as exception:
+            raise ClientLibvirtException(f"{exception}") from exception
+
+    def destroy_nwfilters(self, nwfilter_names):
+        """
+        Undefine the network filters that are defined among the given ones.
+
+        Parameters:
+            nwfilter_names (list(str)): names of the network filters.
+        """
+        try:
+            names = set(nwfilter_names)
+            for connection, _ in self._all_connections():
+                to_undefine = [nwfilter for nwfilter in connection.listAllNWFilters() if nwfilter.name() in names]
+                self._run_nwfilter_operations(lambda nwfilter: nwfilter.undefine(), to_undefine)
+        except Exception as exception:
+            raise ClientLibvirtException(f"{exception}") from exception
+
     def destroy_nwfilter(self, nwfilter_name):
         try:
             nwfilter = self.connection.nwfilterLookupByName(nwfilter_name)
@@ -0,0 +1,120 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+from tectonic.client import Client, ClientException
+from tectonic.platform_simulated import SimulatedPlatform
+
+class ClientSimulatedException(ClientException):
+    pass
+
+class ClientSimulated(Client):
+    """
+    ClientSimulated class.
+
+    Description: Implement Client for the simulated platform. Machines are kept in memory.
+    """
+
+    def __init__(self, config, description):
+        """
+        Init method.
+
+        Parameters:
+            config (Config): Tectonic config object.
+            description (Description): Tectonic description object.
+        """
+        super().__init__(config, description)
+        self.platform = SimulatedPlatform.get(config, description)
+
+    def get_machine_status(self, machine_name):
+        try:
+            self.platform.request("get_machine_status")
+            machine = self.platform.get_machine(machine_name)
+            return machine["status"] if machine else "NOT FOUND"
+        except Exception as e:
+            raise ClientSimulatedException(f"Error getting machine status: {e}") from e
+
+    def get_machine_private_ip(self, machine_name):
+        if "private_ip" in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)["private_ip"]
+        try:
+            self.platform.request("get_machine_private_ip")
+            machine = self.platform.get_machine(machine_name)
+            return machine["ip"] if machine else None
+        except Exception as e:
+            raise ClientSimulatedException(f"Error getting machine private ip: {e}") from e
+
+    def get_machine_ip_in_services_network(self, machine_name):
+        if "services_ip" in self._get_machine_info(machine_name):
+            return self._get_machine_info(machine_name)["services_ip"]
+        try:
+            self.platform.request("get_machine_ip_in_services_network")
+            machine = self.platform.get_machine(machine_name)
+            return machine["services_ip"] if machine else None
+        except Exception as e:
+            raise ClientSimulatedException(f"Error getting machine ip in services network: {e}") from e
+
+    def is_image_in_use(self, image_name):
+        try:
+            self.platform.request("is_image_in_use")
+            return self.platform.is_image_in_use(image_name)
+        except Exception as e:
+            raise ClientSimulatedException(f"Error determining if image is in use: {e}") from e
+
+    def get_image_fingerprint(self, image_name):
+        try:
+            self.platform.request("get_image_fingerprint")
+            return self.platform.get_image_fingerprint(image_name)
+        except Exception as e:
+            raise ClientSimulatedException(f"Error getting image fingerprint: {e}") from e
+
+    def set_image_fingerprint(self, image_name, fingerprint):
+        try:
+            self.platform.request("set_image_fingerprint")
+            self.platform.set_image_fingerprint(image_name, fingerprint)
+        except Exception as e:
+            raise ClientSimulatedException(f"Error setting image fingerprint: {e}") from e
+
+    def delete_image(self, image_name):
+        if self.is_image_in_use(image_name):
+            raise ClientSimulatedException(f"Error deleting image {image_name}: in use")
+        try:
+            self.platform.request("delete_image")
+            self.platform.delete_image(image_name)
+        except Exception as e:
+            raise ClientSimulatedException(f"Error deleting image {image_name}: {e}") from e
+
+    def _set_machine_status(self, machine_name, status):
+        try:
+            self.platform.request("set_machine_status")
+            self.platform.set_machine_status(machine_name, status)
+        except Exception as e:
+            raise ClientSimulatedException(f"Error changing machine {machine_name} status: {e}") from e
+
+    def start_machine(self, machine_name):
+        self._set_machine_status(machine_name, "RUNNING")
+
+    def stop_machine(self, machine_name):
+        self._set_machine_status(machine_name, "STOPPED")
+
+    def restart_machine(self, machine_name):
+        self._set_machine_status(machine_name, "RUNNING")
+
+    def console(self, machine_name, username):
+        raise ClientSimulatedException("Console is not available in the simulated platform.")
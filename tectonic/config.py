@@ -27,6 +27,7 @@ from tectonic.config_ansible import TectonicConfigAnsible
 from tectonic.config_aws import TectonicConfigAWS
 from tectonic.config_libvirt import TectonicConfigLibvirt
 from tectonic.config_docker import TectonicConfigDocker
+from tectonic.config_simulated import TectonicConfigSimulated
 from tectonic.config_elastic import TectonicConfigElastic
 from tectonic.config_caldera import TectonicConfigCaldera
 from tectonic.config_guacamole import TectonicConfigGuacamole
@@ -37,7 +38,8 @@ from tectonic.config_bastion_host import TectonicConfigBastionHost
 class TectonicConfig(object):
     """Class to store Tectonic configuration."""
 
-    supported_platforms = ["docker", "aws", "libvirt"]
+    supported_platforms = ["docker", "aws", "libvirt", "simulated"]
+    supported_packer_build_splits = ["none", "guest", "os"]
 
     def __init__(self, lab_repo_uri):
         self._tectonic_dir = os.path.realpath(
@@ -61,11 +63,23 @@ class TectonicConfig(object):
         self.gitlab_backend_username = None
         self.gitlab_backend_access_token = None
         self.packer_executable_path = "packer"
+        self.packer_build_split = "none"
+        self.packer_build_concurrency = 4
+        self.packer_parallel_builds = 0
+        self.packer_build_retries = 0
+        self.client_concurrency = 10
+        self.metrics_file = None
+        self.terraform_plugin_cache_dir = "~/.terraform.d/plugin-cache"
+        self.terraform_data_dir = "~/.local/share/tectonic/terraform"
+        self.terraform_shard_size = 0
+        self.terraform_shard_concurrency = 4
+        self.terraform_parallelism = 0
 
         self._ansible = TectonicConfigAnsible(self.tectonic_dir)
         self._aws = TectonicConfigAWS()
         self._libvirt = TectonicConfigLibvirt()
         self._docker = TectonicConfigDocker()
+        self._simulated = TectonicConfigSimulated()
         self._elastic = TectonicConfigElastic()
         self._caldera = TectonicConfigCaldera()
         self._guacamole = TectonicConfigGuacamole()
@@ -131,6 +145,50 @@ class TectonicConfig(object):
     def packer_executable_path(self):
         return self._packer_executable_path
 
+    @property
+    def packer_build_split(self):
+        return self._packer_build_split
+
+    @property
+    def packer_build_concurrency(self):
+        return self._packer_build_concurrency
+
+    @property
+    def packer_parallel_builds(self):
+        return self._packer_parallel_builds
+
+    @property
+    def packer_build_retries(self):
+        return self._packer_build_retries
+
+    @property
+    def client_concurrency(self):
+        return self._client_concurrency
+
+    @property
+    def metrics_file(self):
+        return self._metrics_file
+
+    @property
+    def terraform_plugin_cache_dir(self):
+        return self._terraform_plugin_cache_dir
+
+    @property
+    def terraform_data_dir(self):
+        return self._terraform_data_dir
+
+    @property
+    def terraform_shard_size(self):
+        return self._terraform_shard_size
+
+    @property
+    def terraform_shard_concurrency(self):
+        return self._terraform_shard_concurrency
+
+    @property
+    def terraform_parallelism(self):
+        return self._terraform_parallelism
+
     @property
     def ansible(self):
         return self._ansible
@@ -147,6 +205,10 @@ class TectonicConfig(object):
     def docker(self):
         return self._docker
 
+    @property
+    def simulated(self):
+        return self._simulated
+
     @property
     def elastic(self):
         return self._elastic
@@ -239,6 +301,66 @@ class TectonicConfig(object):
     def packer_executable_path(self, value):
         self._packer_executable_path = value
 
+    @packer_build_split.setter
+    def packer_build_split(self, value):
+        validate.supported_value("packer_build_split", value, self.supported_packer_build_splits)
+        self._packer_build_split = value
+
+    @packer_build_concurrency.setter
+    def packer_build_concurrency(self, value):
+        validate.number("packer_build_concurrency", value, min_value=1)
+        self._packer_build_concurrency = value
+
+    @packer_parallel_builds.setter
+    def packer_parallel_builds(self, value):
+        validate.number("packer_parallel_builds", value, min_value=0)
+        self._packer_parallel_builds = value
+
+    @packer_build_retries.setter
+    def packer_build_retries(self, value):
+        validate.number("packer_build_retries", value, min_value=0)
+        self._packer_build_retries = value
+
+    @client_concurrency.setter
+    def client_concurrency(self, value):
+        validate.number("client_concurrency", value, min_value=1)
+        self._client_concurrency = value
+
+    @metrics_file.setter
+    def metrics_file(self, value):
+        if value:
+            value = absolute_path(value, base_dir=self.tectonic_dir)
+        else:
+            value = None
+        self._metrics_file = value
+
+    @terraform_plugin_cache_dir.setter
+    def terraform_plugin_cache_dir(self, value):
+        if value:
+            value = absolute_path(value, base_dir=self.tectonic_dir)
+        else:
+            value = None
+        self._terraform_plugin_cache_dir = value
+
+    @terraform_data_dir.setter
+    def terraform_data_dir(self, value):
+        self._terraform_data_dir = absolute_path(value, base_dir=self.tectonic_dir)
+
+    @terraform_shard_size.setter
+    def terraform_shard_size(self, value):
+        validate.number("terraform_shard_size", value, min_value=0)
+        self._terraform_shard_size = value
+
+    @terraform_shard_concurrency.setter
+    def terraform_shard_concurrency(self, value):
+        validate.number("terraform_shard_concurrency", value, min_value=1)
+        self._terraform_shard_concurrency = value
+
+    @terraform_parallelism.setter
+    def terraform_parallelism(self, value):
+        validate.number("terraform_parallelism", value, min_value=0)
+        self._terraform_parallelism = value
+
     @classmethod
     def _assign_attributes(cls, config_obj, config_parser, section):
         """Assign the values of all parameters in the parser object in
@@ -273,6 +395,7 @@ class TectonicConfig(object):
         TectonicConfig._assign_attributes(config.aws, parser, 'aws')
         TectonicConfig._assign_attributes(config.libvirt, parser, 'libvirt')
         TectonicConfig._assign_attributes(config.docker, parser, 'docker')
+        TectonicConfig._assign_attributes(config.simulated, parser, 'simulated')
         TectonicConfig._assign_attributes(config.elastic, parser, 'elastic')
         TectonicConfig._assign_attributes(config.caldera, parser, 'caldera')
         TectonicConfig._assign_attributes(config.guacamole, parser, 'guacamole')
@@ -28,6 +28,10 @@ class TectonicConfigAWS(object):
         self.teacher_access = "host"
         self.access_host_instance_type = "t2.micro"
         self.packetbeat_vlan_id = 1
+        self.max_pool_connections = 50
+        self.max_attempts = 10
+        self.retry_mode = "adaptive"
+        self.requests_per_second = 0
 
     #----------- Getters ----------
     @property
@@ -46,6 +50,22 @@ class TectonicConfigAWS(object):
     def packetbeat_vlan_id(self):
         return self._packetbeat_vlan_id
 
+    @property
+    def max_pool_connections(self):
+        return self._max_pool_connections
+
+    @property
+    def max_attempts(self):
+        return self._max_attempts
+
+    @property
+    def retry_mode(self):
+        return self._retry_mode
+
+    @property
+    def requests_per_second(self):
+        return self._requests_per_second
+
     #----------- Setters ----------
     @region.setter
     def region(self, value):
@@ -68,10 +88,34 @@ class TectonicConfigAWS(object):
         validate.number("packetbeat_vlan_id", value, min_value=1, max_value=4094)
         self._packetbeat_vlan_id = value
 
+    @max_pool_connections.setter
+    def max_pool_connections(self, value):
+        validate.number("max_pool_connections", value, min_value=1)
+        self._max_pool_connections = value
+
+    @max_attempts.setter
+    def max_attempts(self, value):
+        validate.number("max_attempts", value, min_value=1)
+        self._max_attempts = value
+
+    @retry_mode.setter
+    def retry_mode(self, value):
+        validate.supported_value("retry_mode", value, ["legacy", "standard", "adaptive"])
+        self._retry_mode = value
+
+    @requests_per_second.setter
+    def requests_per_second(self, value):
+        validate.number("requests_per_second", value, min_value=0)
+        self._requests_per_second = value
+
     def to_dict(self):
         return {
             "region": self.region,
             "teacher_access": self.teacher_access,
             "access_host_instance_type": self.access_host_instance_type,
             "packetbeat_vlan_id": self.packetbeat_vlan_id,
+            "max_pool_connections": self.max_pool_connections,
+            "max_attempts": self.max_attempts,
+            "retry_mode": self.retry_mode,
+            "requests_per_second": self.requests_per_second,
         }
\ No newline at end of file
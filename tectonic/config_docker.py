@@ -19,6 +19,7 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 import tectonic.validate as validate
+from tectonic.utils import parse_hosts
 
 class TectonicConfigDocker(object):
     """Class to store Tectonic docker configuration."""
@@ -26,6 +27,8 @@ class TectonicConfigDocker(object):
     def __init__(self):
         self.uri = "unix:///var/run/docker.sock"
         self.dns = "8.8.8.8"
+        self.hosts = []
+        self.inventory_ttl = 5
 
 
     #----------- Getters ----------
@@ -37,6 +40,14 @@ class TectonicConfigDocker(object):
     def dns(self):
         return self._dns
 
+    @property
+    def hosts(self):
+        return self._hosts
+
+    @property
+    def inventory_ttl(self):
+        return self._inventory_ttl
+
 
     #----------- Setters ----------
     @uri.setter
@@ -48,8 +59,23 @@ class TectonicConfigDocker(object):
         validate.ip_address_or_hostname("dns", value)
         self._dns = value
 
+    @hosts.setter
+    def hosts(self, value):
+        if isinstance(value, str):
+            value = parse_hosts(value)
+        validate.hosts("hosts", value, [])
+        for index, host in enumerate(value):
+            host.setdefault("name", f"host{index+1}")
+        self._hosts = value
+
+    @inventory_ttl.setter
+    def inventory_ttl(self, value):
+        validate.number("inventory_ttl", value, min_value=0)
+        self._inventory_ttl = value
+
     def to_dict(self):
         return {
             "dns": self.dns,
             "uri": self.uri,
+            "hosts": self.hosts,
         }
\ No newline at end of file
@@ -19,6 +19,7 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 import tectonic.validate as validate
+from tectonic.utils import parse_hosts
 
 class TectonicConfigLibvirt(object):
     """Class to store Tectonic libvirt configuration."""
@@ -35,6 +36,10 @@ class TectonicConfigLibvirt(object):
         self.bridge_base_ip = 10
         self.connection_network = "192.168.1.3/32"
         self.routing = False
+        self.agent_events = False
+        self.nwfilter_workers = 1
+        self.nwfilter_templates = False
+        self.hosts = []
 
 
     #----------- Getters ----------
@@ -70,6 +75,22 @@ class TectonicConfigLibvirt(object):
     def routing(self):
         return self._routing
 
+    @property
+    def agent_events(self):
+        return self._agent_events
+
+    @property
+    def nwfilter_workers(self):
+        return self._nwfilter_workers
+
+    @property
+    def nwfilter_templates(self):
+        return self._nwfilter_templates
+
+    @property
+    def hosts(self):
+        return self._hosts
+
     #----------- Setters ----------
     @uri.setter
     def uri(self, value):
@@ -108,6 +129,30 @@ class TectonicConfigLibvirt(object):
         validate.boolean("routing", value)
         self._routing = value
 
+    @agent_events.setter
+    def agent_events(self, value):
+        validate.boolean("agent_events", value)
+        self._agent_events = value
+
+    @nwfilter_workers.setter
+    def nwfilter_workers(self, value):
+        validate.number("nwfilter_workers", value, min_value=1)
+        self._nwfilter_workers = value
+
+    @nwfilter_templates.setter
+    def nwfilter_templates(self, value):
+        validate.boolean("nwfilter_templates", value)
+        self._nwfilter_templates = value
+
+    @hosts.setter
+    def hosts(self, value):
+        if isinstance(value, str):
+            value = parse_hosts(value)
+        validate.hosts("hosts", value, ["storage_pool", "address"])
+        for index, host in enumerate(value):
+            host.setdefault("name", f"host{index+1}")
+        self._hosts = value
+
     def to_dict(self):
         return {
             "uri": self.uri,
@@ -116,5 +161,7 @@ class TectonicConfigLibvirt(object):
             "connection_network": self.connection_network,
             "bridge": self.bridge,
             "bridge_base_ip": self.bridge_base_ip,
-            "routing": self.routing
+            "routing": self.routing,
+            "nwfilter_templates": self.nwfilter_templates,
+            "hosts": self.hosts,
         }
@@ -0,0 +1,80 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import tectonic.validate as validate
+
+class TectonicConfigSimulated(object):
+    """Class to store Tectonic simulated platform configuration."""
+
+    def __init__(self):
+        self.api_latency = 0
+        self.failure_rate = 0
+        self.boot_time = 0
+        self.seed = 0
+        self.api_rate_limit = 0
+
+
+    #----------- Getters ----------
+    @property
+    def api_latency(self):
+        return self._api_latency
+
+    @property
+    def failure_rate(self):
+        return self._failure_rate
+
+    @property
+    def boot_time(self):
+        return self._boot_time
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @property
+    def api_rate_limit(self):
+        return self._api_rate_limit
+
+
+    #----------- Setters ----------
+    @api_latency.setter
+    def api_latency(self, value):
+        validate.number("api_latency", value, min_value=0)
+        self._api_latency = value
+
+    @failure_rate.setter
+    def failure_rate(self, value):
+        validate.number("failure_rate", value, min_value=0, max_value=100)
+        self._failure_rate = value
+
+    @boot_time.setter
+    def boot_time(self, value):
+        validate.number("boot_time", value, min_value=0)
+        self._boot_time = value
+
+    @seed.setter
+    def seed(self, value):
+        validate.number("seed", value, min_value=0)
+        self._seed = value
+
+    @api_rate_limit.setter
+    def api_rate_limit(self, value):
+        validate.number("api_rate_limit", value, min_value=0)
+        self._api_rate_limit = value
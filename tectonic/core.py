@@ -24,22 +24,32 @@ import json
 import time
 import datetime
 import logging
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 
 from tectonic.ansible import Ansible
+from tectonic.ansible_simulated import AnsibleSimulated
 from tectonic.constants import OS_DATA
 import importlib.resources as tectonic_resources
 from tectonic.client_aws import ClientAWS
 from tectonic.client_libvirt import ClientLibvirt
 from tectonic.client_docker import ClientDocker
+from tectonic.client_simulated import ClientSimulated
+from tectonic.client_async import AsyncClient
+from tectonic.instrumentation import Instrumentation
+import tectonic.utils as utils
 from tectonic.packer_aws import PackerAWS
 from tectonic.packer_libvirt import PackerLibvirt
 from tectonic.packer_docker import PackerDocker
+from tectonic.packer_simulated import PackerSimulated
 from tectonic.terraform_aws import TerraformAWS
 from tectonic.terraform_libvirt import TerraformLibvirt
 from tectonic.terraform_docker import TerraformDocker
+from tectonic.terraform_simulated import TerraformSimulated
 from tectonic.terraform_service_aws import TerraformServiceAWS
 from tectonic.terraform_service_docker import TerraformServiceDocker
 from tectonic.terraform_service_libvirt import TerraformServiceLibvirt
+from tectonic.terraform_service_simulated import TerraformServiceSimulated
 
 logger = logging.getLogger()
 
@@ -78,9 +88,27 @@ class Core:
             self.client = ClientDocker(self.config, self.description)
             self.packer = PackerDocker(self.config, self.description, self.client)
             self.terraform_service = TerraformServiceDocker(self.config, self.description, self.client)
+        elif self.config.platform == "simulated":
+            self.terraform = TerraformSimulated(self.config, self.description)
+            self.client = ClientSimulated(self.config, self.description)
+            self.packer = PackerSimulated(self.config, self.description, self.client)
+            self.terraform_service = TerraformServiceSimulated(self.config, self.description, self.client)
         else:
             raise CoreException("Unknown platform.")
-        self.ansible = Ansible(self.config, self.description, self.client)
+        if self.config.platform == "simulated":
+            self.ansible = AnsibleSimulated(self.config, self.description, self.client)
+        else:
+            self.ansible = Ansible(self.config, self.description, self.client)
+        self.instrumentation = Instrumentation(self.config.metrics_file is not None)
+        self.instrumentation.instrument_client(self.client)
+        self.instrumentation.instrument_terraform(self.terraform)
+        self.instrumentation.instrument_terraform(self.terraform_service)
+        self.instrumentation.instrument_packer(self.packer)
+        concurrency = int(self.config.client_concurrency)
+        if self.config.platform == "aws":
+            # Do not queue requests behind the connection pool of the AWS clients
+            concurrency = min(concurrency, int(self.config.aws.max_pool_connections))
+        self.async_client = AsyncClient(self.client, concurrency)
 
         
     # def __del__(self):
@@ -91,14 +119,62 @@ class Core:
     #     del self.ansible
     #     del self.description
 
-    def create_instances_images(self, guests=None):
+    def report_metrics(self):
         """
-        Create base images.
+        Export the client call metrics if a metrics file is configured,
+        and show them in debug mode.
+        """
+        if not self.instrumentation.enabled:
+            return
+        headers, rows = self.instrumentation.summary()
+        if rows:
+            logger.debug(utils.create_table(headers, rows))
+        if self.config.metrics_file:
+            self.instrumentation.export(self.config.metrics_file)
+
+    def _refresh_client_cache(self):
+        """
+        Discard the information kept by the client after Terraform
+        changed the machines, and load the machine information that
+        Terraform already reported.
+        """
+        self.client.invalidate_cache()
+        self.client.seed_machine_info(self.terraform_service.machine_info)
+        self.client.seed_machine_info(self.terraform.machine_info)
+
+    def _wait_for_new_machines(self, terraform):
+        """
+        Wait until the platform reports that the machines created or
+        replaced by a Terraform module are ready, and report the ones
+        that are not.
+
+        Parameters:
+            terraform (Terraform): Terraform object that applied the changes.
+        """
+        machine_names = terraform.pop_created_machines()
+        if not machine_names:
+            return
+        ready = self.client.wait_for_machines(machine_names)
+        stragglers = [machine_name for machine_name in machine_names if not ready.get(machine_name)]
+        if stragglers:
+            logger.warning(f"Machines not ready yet: {', '.join(stragglers)}.")
+
+    def create_instances_images(self, guests=None, rebuild=False):
+        """
+        Create base images. Images built from the same inputs as the
+        current ones are kept, unless rebuild is set.
 
         Parameters:
             guests (list(str)): names of the guests for which to create images. A None value creates all guest images.
+            rebuild (bool): whether to also rebuild the images that are up to date. Default: False.
         """
         if guests is None or len(guests) > 0:
+            if not rebuild:
+                guests = self.packer.get_outdated_instance_images(guests)
+                if not guests:
+                    logger.info("Scenario base images are up to date.")
+                    return
+
             logger.info("Destroying scenario base images...")
             self.packer.destroy_instance_image(guests)
 
@@ -133,6 +209,10 @@ class Core:
             instances (list(int)): numbers of the instances to deploy.
             create_guest_images (bool): whether to create instances images.
             service_image_list (list(str)): list of service images to create.
+
+        Return:
+            list(dict): in libvirt cluster mode, the routes between the hosts
+              that the operator must add on them, as returned by get_cluster_routes.
         """
         if create_guest_images:
             self.create_instances_images()
@@ -140,19 +220,36 @@ class Core:
             self.create_services_images(service_image_list)
 
         if self.config.platform == "libvirt" and self.config.libvirt.routing:
+            nwfilters = {}
             for _, service in self.description.services_guests.items():
                 for _, interface in service.interfaces.items():
-                    self.client.create_nwfilter(f"{service.name}-{interface.network.name}", interface.private_ip, interface.traffic_rules)
+                    nwfilters[interface.nwfilter_name] = (interface.private_ip, interface.traffic_rules)
             machines_to_create_nwfilter = self.description.parse_machines(instances)
+            # Filters of the machines not deployed now are not stale
+            nwfilters_to_keep = []
             for _, guest in self.description.scenario_guests.items():
-                if guest.name in machines_to_create_nwfilter:
-                    for _, interface in guest.interfaces.items():
-                        self.client.create_nwfilter(f"{guest.name}-{interface.network.name}", interface.private_ip, interface.traffic_rules)
+                for _, interface in guest.interfaces.items():
+                    if guest.name not in machines_to_create_nwfilter:
+                        nwfilters_to_keep.append(interface.nwfilter_name)
+                        if self.config.libvirt.nwfilter_templates:
+                            nwfilters_to_keep.append(interface.nwfilter_template_name)
+                    elif self.config.libvirt.nwfilter_templates:
+                        nwfilters[interface.nwfilter_template_name] = ("$IP", interface.nwfilter_rules)
+                    else:
+                        nwfilters[interface.nwfilter_name] = (interface.private_ip, interface.traffic_rules)
+            self.client.sync_nwfilters(nwfilters, prefix=f"{self.description.institution}-{self.description.lab_name}-", keep=nwfilters_to_keep)
+
+        routes = []
+        if self.config.platform == "libvirt" and self.client.placement is not None:
+            # Tectonic does not configure the hosts, so the routes must be added by hand
+            routes = self.get_cluster_routes()
 
         # Invoke the services terraform module even if no services are enabled, 
         # as this terraform creates networks that the instances terraform module can then use.
         logger.info("Deploying service machines...")
         self.terraform_service.deploy(instances) 
+        self._refresh_client_cache()
+        self._wait_for_new_machines(self.terraform_service)
 
         if len(self.description.services_guests) > 0:
             logger.info("Configuring services...")
@@ -160,6 +257,8 @@ class Core:
 
         logger.info("Deploying scenario machines...")
         self.terraform.deploy(instances)
+        self._refresh_client_cache()
+        self._wait_for_new_machines(self.terraform)
 
         logger.info("Waiting for machines to boot up...")
         self.ansible.wait_for_connections(instances=instances)
@@ -184,6 +283,52 @@ class Core:
             logger.info("Installing caldera agents...")
             self.terraform_service.install_caldera_agent(self.ansible, instances)
 
+        return routes
+
+    def get_cluster_routes(self):
+        """
+        Get the routes between libvirt hosts that connect the instances with the services.
+
+        Return:
+            list(dict): host, destination network and gateway of each route.
+        """
+        placement = self.client.placement
+        if placement.services_host is not None:
+            services_address = placement.address(placement.host(placement.services_host))
+        else:
+            services_address = urlparse(self.config.libvirt.uri).hostname
+        return placement.routes(services_address, [self.config.services_network_cidr_block])
+
+    def check(self, instances):
+        """
+        Look for scenario and service resources that changed outside of Terraform.
+
+        The instances and services modules are checked at the same time.
+
+        Parameters:
+            instances (list(int)): numbers of the instances to check, if None check all.
+
+        Return:
+            dict: addresses of the drifted resources of each instance
+                (None for resources shared by the instances), and of the services.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            instances_drift = executor.submit(self.terraform.check, instances)
+            services_drift = executor.submit(self.terraform_service.check, instances)
+        return {
+            "instances": instances_drift.result(),
+            "services": services_drift.result(),
+        }
+
+    def migrate_terraform_states(self):
+        """
+        Move the scenario instances from a single Terraform state to sharded states.
+
+        Return:
+            dict: number of resources moved to each state.
+        """
+        return self.terraform.migrate_states()
+
     def destroy(self, instances, images, services, service_image_list):
         """
         Destroy scenario.
@@ -197,17 +342,26 @@ class Core:
         logger.info("Destroying scenario machines...")
         self.terraform.destroy(instances)
         self.terraform_service.destroy(instances)
+        self._refresh_client_cache()
 
         if self.config.platform == "libvirt" and self.config.libvirt.routing:
+            nwfilters = []
             if instances == None:
                 for _, service in self.description.services_guests.items():
                     for _, interface in service.interfaces.items():
-                        self.client.destroy_nwfilter(f"{service.name}-{interface.network.name}")
+                        nwfilters.append(interface.nwfilter_name)
             machines_to_delete_nwfilter = self.description.parse_machines(instances)
+            nwfilters_in_use = set()
             for _, guest in self.description.scenario_guests.items():
-                if guest.name in machines_to_delete_nwfilter:
-                    for _, interface in guest.interfaces.items():
-                        self.client.destroy_nwfilter(f"{guest.name}-{interface.network.name}")
+                for _, interface in guest.interfaces.items():
+                    if guest.name in machines_to_delete_nwfilter:
+                        nwfilters.append(interface.nwfilter_name)
+                        if self.config.libvirt.nwfilter_templates:
+                            nwfilters.append(interface.nwfilter_template_name)
+                    elif self.config.libvirt.nwfilter_templates:
+                        # Shared filters are kept while a remaining machine uses them
+                        nwfilters_in_use.add(interface.nwfilter_template_name)
+            self.client.destroy_nwfilters([nwfilter for nwfilter in nwfilters if nwfilter not in nwfilters_in_use])
         
         if instances is None:
             if services:
@@ -219,6 +373,7 @@ class Core:
                 # as this terraform creates networks that the instances terraform module can then use.
                 logger.info("Destroying service machines...")
                 self.terraform_service.destroy(instances)
+                self._refresh_client_cache()
 
             # Destroy images
             if images:
@@ -239,6 +394,8 @@ class Core:
         """
         logger.info("Recreating machines...")
         self.terraform.recreate(instances, guests, copies)
+        self._refresh_client_cache()
+        self._wait_for_new_machines(self.terraform)
 
         logger.info("Waiting for machines to boot up...")
         self.ansible.wait_for_connections(instances, guests, copies, True)
@@ -270,8 +427,7 @@ class Core:
         """
         logger.info("Starting machines...")
         machines_to_start = self.description.parse_machines(instances, guests, copies, False)
-        for machine in machines_to_start:
-            self.client.start_machine(machine)
+        self.async_client.run("start_machine", machines_to_start)
         if 'elastic' in machines_to_start and self.description.elastic.enable and self.description.elastic.monitor_type == "traffic":
             # TODO: verify what happens in AWS with start, stop and
             # restart of the packetbeat service, since the vm will be
@@ -290,8 +446,7 @@ class Core:
         """
         logger.info("Stopping machines...")
         machines_to_stop = self.description.parse_machines(instances, guests, copies, False)
-        for machine in machines_to_stop:
-            self.client.stop_machine(machine)
+        self.async_client.run("stop_machine", machines_to_stop)
 
         if 'elastic' in machines_to_stop and self.description.elastic.enable and self.description.elastic.monitor_type == "traffic":
             self.terraform_service.manage_packetbeat(self.ansible, "stopped")
@@ -307,8 +462,7 @@ class Core:
         """
         logger.info("Rebooting machines...")
         machines_to_restart = self.description.parse_machines(instances, guests, copies, False, [service.base_name for _, service in self.description.services_guests.items()])
-        for machine in machines_to_restart:
-            self.client.restart_machine(machine)
+        self.async_client.run("restart_machine", machines_to_restart)
 
         if 'elastic' in machines_to_restart and self.description.elastic.enable and self.description.elastic.monitor_type == "traffic":
             self.terraform_service.manage_packetbeat(self.ansible, "restarted")
@@ -365,20 +519,17 @@ class Core:
         """
         instances_info = {}
         machines_to_list = self.description.parse_machines(instances, guests, copies, False, [service.base_name for _, service in self.description.services_guests.items()])
-        for machine in machines_to_list:
-            status = self.client.get_machine_status(machine)
-            ip = "-"
-            if status == "RUNNING":
-                ip = self.client.get_machine_private_ip(machine)
-            instances_info[machine] = [ip, status]
+        machines_status = self.async_client.run("get_machine_status", machines_to_list)
+        services_machines_status = self.async_client.run("get_machine_status", self.description.services_guests.keys())
+        running_machines = [machine for machine, status in list(machines_status.items()) + list(services_machines_status.items()) if status == "RUNNING"]
+        machines_ip = self.client.get_machines_private_ip(running_machines)
+
+        for machine, status in machines_status.items():
+            instances_info[machine] = [machines_ip.get(machine, "-"), status]
 
         services_status = {}
-        for service_name in self.description.services_guests.keys():
-            status = self.client.get_machine_status(service_name)
-            ip = "-"
-            if status == "RUNNING":
-                ip = self.client.get_machine_private_ip(service_name)
-            services_status[service_name] = [ip, status]
+        for service_name, status in services_machines_status.items():
+            services_status[service_name] = [machines_ip.get(service_name, "-"), status]
 
         if self.description.elastic.enable and services_status[self.description.elastic.name] == "RUNNING":
             if self.description.elastic.monitor_type == "traffic":
@@ -526,17 +677,18 @@ class Core:
             )
 
             machines_data = {}
+            guest_names = list(self.description.scenario_guests.keys())
+            if self.config.platform == "aws" or (self.config.platform == "libvirt" and self.config.libvirt.routing):
+                connection_ips = self.client.get_machines_private_ip(guest_names)
+            else: 
+                connection_ips = self.client.get_machines_ip_in_services_network(guest_names)
             for _, guest in self.description.scenario_guests.items():
                 machine_name = f"{guest.base_name}-{guest.instance}" if guest.copy == 1 else f"{guest.base_name}-{guest.instance}-{guest.copy}"
-                if self.config.platform == "aws" or (self.config.platform == "libvirt" and self.config.libvirt.routing):
-                    connection_ip = self.client.get_machine_private_ip(guest.name) 
-                else: 
-                    connection_ip = self.client.get_machine_ip_in_services_network(guest.name)
                 machines_data[machine_name] = {
                     "instance": guest.instance,
                     "access_protocols": guest.access_protocols,
                     "entry_point": guest.entry_point,
-                    "ip": connection_ip,
+                    "ip": connection_ips[guest.name],
                 }
             extra_vars = {
                 "machines_data": machines_data, 
@@ -19,6 +19,7 @@
 # along with Tectonic. If not, see <http://www.gnu.org/licenses/>.
 
 import ipaddress
+import hashlib
 import math
 import tempfile
 import random
@@ -427,6 +428,8 @@ class NetworkInterface():
         self.private_ip = self._get_guest_ip_address(guest, network) if private_ip is None else private_ip
         self.mask = ipaddress.ip_network(network.ip_network).prefixlen
         self._traffic_rules = []
+        self._nwfilter_prefix = f"{description.institution}-{description.lab_name}-{guest.base_name}-{network.base_name}"
+        self._nwfilter_templates = description.config.platform == "libvirt" and description.config.libvirt.routing and description.config.libvirt.nwfilter_templates
     
     @property
     def name(self):
@@ -456,6 +459,75 @@ class NetworkInterface():
     def traffic_rules(self):
         return self._traffic_rules
 
+    @property
+    def nwfilter_name(self):
+        """Name of the libvirt network filter used only by this interface."""
+        return f"{self.guest_name}-{self.network.name}"
+
+    def _nwfilter_sources(self):
+        """
+        Compute the nwfilter parameters of the interface and the
+        parameterised source of each of its traffic rules.
+
+        The network of the interface and its gateway are given by the
+        SRC, SRCMASK and GATEWAY parameters. Every other source address,
+        such as a guest in another network of the same instance, gets
+        its own SRC<n> parameter, so that the addresses that change
+        between instances do not change the filter.
+
+        Returns:
+            (dict, dict): parameter values and parameterised source of each source CIDR.
+        """
+        ip_network = ipaddress.ip_network(self.network.ip_network)
+        parameters = {
+            "IP": self.private_ip,
+            "SRC": str(ip_network.network_address),
+            "SRCMASK": str(ip_network.prefixlen),
+            "GATEWAY": str(next(ip_network.hosts())),
+        }
+        sources = {
+            self.network.ip_network: "$SRC/$SRCMASK",
+            f"{parameters['SRC']}/{parameters['SRCMASK']}": "$SRC/$SRCMASK",
+            f"{parameters['GATEWAY']}/32": "$GATEWAY/32",
+        }
+        for rule in self.traffic_rules:
+            if rule.source_cidr in sources:
+                continue
+            try:
+                source = ipaddress.ip_network(rule.source_cidr, strict=False)
+            except ValueError:
+                continue
+            parameter_name = f"SRC{len(parameters) - 3}"
+            parameters[parameter_name] = str(source.network_address)
+            sources[rule.source_cidr] = f"${parameter_name}/{source.prefixlen}"
+        return parameters, sources
+
+    @property
+    def nwfilter_parameters(self):
+        """Values of the parameters of the shared libvirt network filter for this interface."""
+        return self._nwfilter_sources()[0]
+
+    @property
+    def nwfilter_rules(self):
+        """Traffic rules of the interface, with their source addresses replaced by nwfilter parameters."""
+        _, sources = self._nwfilter_sources()
+        rules = []
+        for rule in self.traffic_rules:
+            template_rule = TrafficRule(rule.base_traffic_rule, sources.get(rule.source_cidr, rule.source_cidr), rule.copy)
+            template_rule.interface_attached = rule.interface_attached
+            rules.append(template_rule)
+        return rules
+
+    @property
+    def nwfilter_template_name(self):
+        """
+        Name of the libvirt network filter shared by all the interfaces of the
+        same base guest in the same network that have the same traffic rules.
+        """
+        content = [(rule.protocol, rule.source_cidr, rule.from_port, rule.to_port) for rule in self.nwfilter_rules]
+        digest = hashlib.sha256(json.dumps(content).encode()).hexdigest()[:12]
+        return f"{self._nwfilter_prefix}-{digest}"
+
     @name.setter
     def name(self, value):
         self._name = value
@@ -482,7 +554,7 @@ class NetworkInterface():
 
     def to_dict(self):
         """Convert a NetworkInterface object to the dictionary expected by terraform."""
-        return {
+        result = {
             "name" : self.name,
             "private_ip" : self.private_ip,
             "subnetwork_name" : self.network.name,
@@ -493,6 +565,12 @@ class NetworkInterface():
             "guest_name": self.guest_name,
             "traffic_rules": [traffic_rule.to_dict() for traffic_rule in self.traffic_rules]
         }
+        if self._nwfilter_templates:
+            result["nwfilter"] = {
+                "name": self.nwfilter_template_name,
+                "parameters": self.nwfilter_parameters,
+            }
+        return result
         
     def _get_interface_index_to_sum(self, description, guest):
         """Returns number to be added to interface index.
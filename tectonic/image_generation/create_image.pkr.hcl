@@ -175,6 +175,7 @@ build {
       }
       tags = {
 	      "Name" = "${local.tectonic["institution"]}-${local.tectonic["lab_name"]}-${source.key}"
+	      "TectonicFingerprint" = lookup(source.value, "image_fingerprint", "")
       }
     }
   }
@@ -222,6 +223,7 @@ build {
       image = local.os_data[source.value["base_os"]]["docker_base_image"]
       exec_user = local.os_data[source.value["base_os"]]["username"]
       run_command = ["-d", "-i", "-t", "--name", "${local.tectonic["institution"]}-${local.tectonic["lab_name"]}-${source.key}", "--entrypoint=${local.os_data[source.value["base_os"]]["entrypoint"]}", "--", "{{.Image}}"]
+      changes = ["LABEL tectonic.fingerprint=${lookup(source.value, "image_fingerprint", "")}"]
     }
   }
 
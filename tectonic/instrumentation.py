@@ -0,0 +1,285 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import inspect
+import threading
+import functools
+from urllib.parse import urlparse
+
+class InstrumentationException(Exception):
+    pass
+
+class Instrumentation:
+    """
+    Instrumentation class.
+
+    Description: records call counts, latency histograms, retries and errors of
+    the client operations, per operation and per machine. Clients are only
+    wrapped when instrumentation is enabled, so it costs nothing otherwise.
+    """
+
+    # Upper bounds (in milliseconds) of the latency histogram buckets
+    LATENCY_BUCKETS = [1, 5, 10, 50, 100, 500, 1000, 5000, 30000]
+    # Client methods that are not timed: image_usage_index returns a context
+    # manager, and seed_machine_info only stores information that is already known
+    EXCLUDED_METHODS = ["image_usage_index", "seed_machine_info"]
+
+    def __init__(self, enabled=False):
+        """
+        Init method.
+
+        Parameters:
+            enabled (bool): whether to instrument clients. Default: False
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._operations = {}
+        self._machines = {}
+        self._terraform = {}
+        self._packer = {}
+
+    def record(self, operation, elapsed, error=False, machine_name=None):
+        """
+        Record a call.
+
+        Parameters:
+            operation (str): name of the operation.
+            elapsed (float): duration of the call in seconds.
+            error (bool): whether the call failed. Default: False
+            machine_name (str): name of the machine the call refers to. Default: None
+        """
+        milliseconds = elapsed * 1000
+        bucket = next((f"<={bound}ms" for bound in self.LATENCY_BUCKETS if milliseconds <= bound), "inf")
+        with self._lock:
+            stats = self._operations.get(operation)
+            if stats is None:
+                stats = self._operations[operation] = {"calls": 0, "errors": 0, "retries": 0, "total_time": 0.0, "max_time": 0.0, "histogram": {}}
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["total_time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+            stats["histogram"][bucket] = stats["histogram"].get(bucket, 0) + 1
+            if machine_name is not None:
+                machine = self._machines.setdefault(machine_name, {})
+                machine_stats = machine.setdefault(operation, {"calls": 0, "errors": 0, "total_time": 0.0})
+                machine_stats["calls"] += 1
+                machine_stats["errors"] += int(error)
+                machine_stats["total_time"] += elapsed
+
+    def record_retry(self, operation):
+        """
+        Record a retried request.
+
+        Parameters:
+            operation (str): name of the operation.
+        """
+        with self._lock:
+            stats = self._operations.setdefault(operation, {"calls": 0, "errors": 0, "retries": 0, "total_time": 0.0, "max_time": 0.0, "histogram": {}})
+            stats["retries"] += 1
+
+    def record_terraform(self, state, operation, parallelism, resources, elapsed, error=False):
+        """
+        Record a Terraform run.
+
+        Parameters:
+            state (str): name of the Terraform state.
+            operation (str): Terraform command (plan, apply or destroy).
+            parallelism (int): parallelism of the run.
+            resources (int): number of resources of the state.
+            elapsed (float): duration of the run in seconds.
+            error (bool): whether the run failed. Default: False
+        """
+        self.record(f"terraform.{operation}", elapsed, error)
+        with self._lock:
+            self._terraform.setdefault(state, []).append({
+                "operation": operation,
+                "parallelism": parallelism,
+                "resources": resources,
+                "time": elapsed,
+                "error": error,
+            })
+
+    def record_packer(self, build, attempt, machines, elapsed, error=False):
+        """
+        Record a Packer build.
+
+        Parameters:
+            build (str): name of the build.
+            attempt (int): number of previous attempts of the build.
+            machines (list(str)): machines of the build.
+            elapsed (float): duration of the build in seconds.
+            error (bool): whether the build failed. Default: False
+        """
+        self.record("packer.build", elapsed, error)
+        with self._lock:
+            self._packer.setdefault(build, []).append({
+                "attempt": attempt,
+                "machines": machines,
+                "time": elapsed,
+                "error": error,
+            })
+
+    def _wrap(self, operation, method, machine_argument):
+        """
+        Return a wrapper of method that records its calls.
+
+        Parameters:
+            operation (str): name of the operation.
+            method (callable): method to wrap.
+            machine_argument (bool): whether the first argument is a machine name.
+
+        Return:
+            callable: the wrapper.
+        """
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            machine_name = args[0] if machine_argument and args and isinstance(args[0], str) else None
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                self.record(operation, time.perf_counter() - start, True, machine_name)
+                raise
+            self.record(operation, time.perf_counter() - start, False, machine_name)
+            return result
+        return wrapper
+
+    def instrument_client(self, client):
+        """
+        Time every public method of a client, and the requests it sends to
+        AWS, to the docker servers or to the libvirt servers.
+
+        Parameters:
+            client (Client): Tectonic client object.
+        """
+        if not self.enabled:
+            return
+        prefix = type(client).__name__
+        for name, member in inspect.getmembers(type(client), inspect.isfunction):
+            if name.startswith("_") or name in self.EXCLUDED_METHODS:
+                continue
+            machine_argument = "machine_name" in list(inspect.signature(member).parameters)[1:2]
+            setattr(client, name, self._wrap(f"{prefix}.{name}", getattr(client, name), machine_argument))
+        client_factory = getattr(client, "client_factory", None)
+        if client_factory is not None:
+            client_factory.instrument(self)
+        for connection in [getattr(client, "connection", None)] + list((getattr(client, "connections", None) or {}).values()):
+            self.instrument_docker(connection)
+            self.instrument_libvirt(connection)
+
+    def instrument_terraform(self, terraform):
+        """
+        Record the duration and parallelism of the Terraform runs.
+
+        Parameters:
+            terraform (Terraform): Tectonic terraform object.
+        """
+        if self.enabled:
+            terraform.instrumentation = self
+
+    def instrument_packer(self, packer):
+        """
+        Record the duration of the Packer builds.
+
+        Parameters:
+            packer (Packer): Tectonic packer object.
+        """
+        if self.enabled:
+            packer.instrumentation = self
+
+    def instrument_docker(self, connection):
+        """
+        Time the HTTP requests sent to a docker server.
+
+        Parameters:
+            connection (DockerClient): docker client.
+        """
+        api = getattr(connection, "api", None)
+        hooks = getattr(api, "hooks", None)
+        if not self.enabled or not isinstance(hooks, dict) or self._docker_hook in hooks.get("response", []):
+            return
+        hooks.setdefault("response", []).append(self._docker_hook)
+
+    def instrument_libvirt(self, connection):
+        """
+        Time the calls to a libvirt server connection. Calls to the
+        objects it returns, such as domains, are not timed.
+
+        Parameters:
+            connection (virConnect): libvirt connection.
+        """
+        if not self.enabled or type(connection).__module__ != "libvirt":
+            return
+        for name, member in inspect.getmembers(type(connection), inspect.isfunction):
+            if name.startswith("_") or name in vars(connection):
+                continue
+            setattr(connection, name, self._wrap(f"libvirt.{name}", getattr(connection, name), False))
+
+    def _docker_hook(self, response, *args, **kwargs):
+        """
+        Record a docker API response. Names and ids in the path are replaced
+        so that requests to different containers share the same operation.
+        """
+        parts = urlparse(response.url).path.strip("/").split("/")
+        if parts and parts[0].startswith("v1."):
+            parts = parts[1:]
+        if len(parts) > 2:
+            parts[1] = "{id}"
+        operation = f"docker.{response.request.method} /{'/'.join(parts)}"
+        self.record(operation, response.elapsed.total_seconds(), response.status_code >= 500)
+
+    def snapshot(self):
+        """
+        Return the recorded metrics.
+
+        Return:
+            dict: statistics per operation and per machine, Terraform runs per state and Packer builds.
+        """
+        with self._lock:
+            return json.loads(json.dumps({"operations": self._operations, "machines": self._machines, "terraform": self._terraform, "packer": self._packer}))
+
+    def summary(self):
+        """
+        Return a table with the statistics of each operation.
+
+        Return:
+            tuple(list(str), list(list)): headers and rows of the table.
+        """
+        headers = ["Operation", "Calls", "Errors", "Retries", "Avg (ms)", "Max (ms)"]
+        rows = []
+        for operation, stats in sorted(self.snapshot()["operations"].items()):
+            average = stats["total_time"] / stats["calls"] * 1000 if stats["calls"] else 0
+            rows.append([operation, stats["calls"], stats["errors"], stats["retries"], f"{average:.1f}", f"{stats['max_time'] * 1000:.1f}"])
+        return headers, rows
+
+    def export(self, filename):
+        """
+        Write the recorded metrics to a JSON file.
+
+        Parameters:
+            filename (str): path of the file.
+        """
+        try:
+            with open(filename, "w") as f:
+                json.dump(self.snapshot(), f, indent=2)
+        except Exception as e:
+            raise InstrumentationException(f"Error exporting metrics to {filename}: {e}") from e
@@ -21,11 +21,22 @@
 import packerpy
 from abc import ABC
 import json
+import hashlib
+import logging
+import re
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import importlib.resources as tectonic_resources
 from tectonic.ssh import ssh_version
 from tectonic.constants import OS_DATA
 
+logger = logging.getLogger(__name__)
+
 class PackerException(Exception):
     pass
 
@@ -38,6 +49,8 @@ class Packer(ABC):
 
     INSTANCES_PACKER_MODULE = tectonic_resources.files('tectonic') / 'image_generation' / 'create_image.pkr.hcl'
     SERVICES_PACKER_MODULE = tectonic_resources.files('tectonic') / 'services' / 'image_generation' / 'create_image.pkr.hcl'
+    # Machine of a failed build in the output of packer build
+    FAILED_BUILD = re.compile(r"Build '[^'.]+\.([^']+)' errored")
 
     def __init__(self, config, description, client):
         """
@@ -51,11 +64,18 @@ class Packer(ABC):
         self.config = config
         self.description = description
         self.client = client
+        # Set by Instrumentation.instrument_packer to profile the Packer builds
+        self.instrumentation = None
     
     def _invoke_packer(self, packer_module, variables):
         """
         Create images using Packer.
 
+        The machines are split in several builds according to the
+        packer_build_split option, and up to packer_build_concurrency
+        builds run at the same time. The machines whose build fails are
+        built again, up to packer_build_retries times.
+
         Parameters: 
             packer_module (str): path to the Packer module.
             variables (dict): variables of the Packer module.
@@ -64,10 +84,91 @@ class Packer(ABC):
         return_code, stdout, _ = p.execute_cmd("init", str(packer_module))
         if return_code != 0:
             raise PackerException(f"Packer init returned an error:\n{stdout.decode()}")
-        return_code, stdout, _ = p.build(str(packer_module), var=variables)
-        # return_code, stdout, _ = p.build(str(packer_module), var=variables, on_error="abort")
-        if return_code != 0:
-            raise PackerException(f"Packer build returned an error:\n{stdout.decode()}")
+        machines = json.loads(variables["machines_json"])
+        errors = {}
+        for attempt in range(int(self.config.packer_build_retries) + 1):
+            if attempt > 0:
+                logger.warning(f"Retrying the Packer builds of {', '.join(sorted(errors))}...")
+                machines = {name: machines[name] for name in errors}
+            builds = self._split_builds(machines)
+            with ThreadPoolExecutor(max_workers=max(1, min(int(self.config.packer_build_concurrency), len(builds)))) as executor:
+                results = list(executor.map(lambda build: self._run_build(packer_module, variables, build[0], build[1], attempt), builds.items()))
+            errors = {name: output for failed, output in results for name in failed}
+            if not errors:
+                return
+        raise PackerException(f"Packer build returned an error:\n{''.join(dict.fromkeys(errors.values()))}")
+
+    def _split_builds(self, machines):
+        """
+        Split the machines in the builds given by the packer_build_split
+        option: a single build, a build per machine or a build per
+        operating system.
+
+        Parameters:
+            machines (dict): variables of each machine, as in machines_json.
+
+        Returns:
+            dict: machines of each build, by build name.
+        """
+        if self.config.packer_build_split == "guest":
+            return {name: {name: machine} for name, machine in machines.items()}
+        if self.config.packer_build_split == "os":
+            builds = {}
+            for name, machine in machines.items():
+                builds.setdefault(machine["base_os"], {})[name] = machine
+            return builds
+        return {"all": machines}
+
+    def _run_build(self, packer_module, variables, build_name, machines, attempt=0):
+        """
+        Run packer build for some of the machines, logging its output
+        as it is produced, prefixed by the build name.
+
+        The variables are passed in a temporary var file, only readable by
+        the user, since they can be too large for the command line and may
+        contain credentials. The file is removed when the build ends.
+
+        Parameters:
+            packer_module (str): path to the Packer module.
+            variables (dict): variables of the Packer module.
+            build_name (str): name of the build.
+            machines (dict): variables of the machines of the build.
+            attempt (int): number of previous attempts of the build. Default: 0.
+
+        Returns:
+            tuple(list(str), str): machines whose build failed and output of the build.
+        """
+        fd, variables_file = tempfile.mkstemp(prefix="tectonic-", suffix=".pkrvars.json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({**variables, "machines_json": json.dumps(machines)}, f)
+            args = [self.config.packer_executable_path, "build"]
+            if int(self.config.packer_parallel_builds):
+                args.append(f"-parallel-builds={int(self.config.packer_parallel_builds)}")
+            args += [f"-var-file={variables_file}", str(packer_module)]
+
+            start = time.perf_counter()
+            try:
+                process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace")
+            except OSError as e:
+                raise PackerException(f"Cannot run packer: {e}") from e
+            output = []
+            for line in process.stdout:
+                output.append(line)
+                logger.info(f"[{build_name}] {line.rstrip()}")
+            process.wait()
+            elapsed = time.perf_counter() - start
+        finally:
+            os.unlink(variables_file)
+
+        failed = []
+        if process.returncode != 0:
+            # Errors that are not reported for a build (for example, in the template) fail all the machines
+            failed = sorted({name for name in self.FAILED_BUILD.findall("".join(output)) if name in machines}) or sorted(machines)
+        logger.info(f"Packer build {build_name} {'failed' if failed else 'finished'} in {elapsed:.1f}s.")
+        if self.instrumentation is not None:
+            self.instrumentation.record_packer(build_name, attempt, sorted(machines), elapsed, bool(failed))
+        return failed, "".join(output)
         
     def create_instance_image(self, guests):
         """
@@ -76,7 +177,72 @@ class Packer(ABC):
         Parameters:
             guests (list(str)): names of the guests for which to create images. 
         """
-        self._invoke_packer(self.INSTANCES_PACKER_MODULE, self._get_instance_variables(guests))
+        variables = self._get_instance_variables(guests)
+        self._invoke_packer(self.INSTANCES_PACKER_MODULE, variables)
+        self._save_image_fingerprints(variables)
+
+    def get_outdated_instance_images(self, guests):
+        """
+        Get the guests whose image does not exist or was built from
+        different inputs than the current ones.
+
+        Parameters:
+            guests (list(str)): names of the guests to check. A None value checks all guests.
+
+        Returns:
+            list(str): names of the guests whose image must be built.
+        """
+        machines = [guest for _, guest in self.description.base_guests.items() if guests is None or guest.base_name in guests]
+        fingerprints = self._get_image_fingerprints(machines)
+        image_fingerprints = self.client.get_image_fingerprints([machine.image_name for machine in machines])
+        return [machine.base_name for machine in machines
+                if image_fingerprints[machine.image_name] != fingerprints[machine.base_name]]
+
+    def _get_image_fingerprints(self, machines, variables=None):
+        """
+        Compute the fingerprint of the inputs of the images of the machines:
+        the machine definition, the variables of the Packer module shared by
+        all the machines (the lab description and configuration, operating
+        system data and networks), the Packer module and its playbooks, and
+        the ansible directory of the scenario.
+
+        Parameters:
+            machines (list(MachineDescription)): machines whose images to fingerprint.
+            variables (dict): shared variables of the Packer module, as returned by _get_shared_instance_variables. Computed if not given.
+
+        Returns:
+            dict: fingerprint of the image of each machine.
+        """
+        if variables is None:
+            variables = self._get_shared_instance_variables()
+        # The definition of each guest is part of its own fingerprint, so a
+        # change in a guest does not make the images of the others outdated
+        variables = {key: value for key, value in variables.items() if key != "guests_json"}
+        files = hashlib.sha256()
+        for directory in [Path(str(self.INSTANCES_PACKER_MODULE)).parent, Path(self.description.ansible_dir)]:
+            if directory.is_dir():
+                for path in sorted(p for p in directory.rglob("*") if p.is_file()):
+                    files.update(path.relative_to(directory).as_posix().encode())
+                    files.update(path.read_bytes())
+        return {
+            machine.base_name: hashlib.sha256(json.dumps({
+                "platform": self.config.platform,
+                "machine": machine.to_dict(),
+                "variables": variables,
+                "files": files.hexdigest(),
+            }, sort_keys=True).encode()).hexdigest()
+            for machine in machines
+        }
+
+    def _save_image_fingerprints(self, variables):
+        """
+        Record the fingerprints of the images built with the given variables.
+
+        Parameters:
+            variables (dict): variables of the Packer module.
+        """
+        for base_name, machine in json.loads(variables["machines_json"]).items():
+            self.client.set_image_fingerprint(self.description.base_guests[base_name].image_name, machine["image_fingerprint"])
 
     def create_service_image(self, services):
         """
@@ -96,13 +262,8 @@ class Packer(ABC):
         Parameters:
             guests (list(str)): names of the guests for which to destroy images.
         """
-        machines = []
         machines = [guest for _, guest in self.description.base_guests.items() if guests is None or guest.base_name in guests]
-        for machine in machines:
-            if self.client.is_image_in_use(machine.image_name):
-                raise PackerException(f"Unable to delete image {machine.base_name} because it is being used.")
-        for machine in machines:
-            self.client.delete_image(machine.image_name)
+        self._destroy_images(machines)
 
     def destroy_service_image(self, services):
         """
@@ -111,13 +272,23 @@ class Packer(ABC):
         Parameters:
             services (list(str)): names of the services for which to destroy images.
         """
-        machines = []
         machines = [guest for _, guest in self.description.services_guests.items() if services is None or guest.base_name in services]
-        for machine in machines:
-            if self.client.is_image_in_use(machine.image_name):
-                raise PackerException(f"Unable to delete image {machine.base_name} because it is being used.")
-        for machine in machines:
-            self.client.delete_image(machine.image_name)
+        self._destroy_images(machines)
+
+    def _destroy_images(self, machines):
+        """
+        Destroy the images of the machines if none of them is being used.
+        Image usage is resolved once for the whole batch.
+
+        Parameters:
+            machines (list(MachineDescription)): machines whose images to destroy.
+        """
+        with self.client.image_usage_index([machine.image_name for machine in machines]):
+            for machine in machines:
+                if self.client.is_image_in_use(machine.image_name):
+                    raise PackerException(f"Unable to delete image {machine.base_name} because it is being used.")
+            for machine in machines:
+                self.client.delete_image(machine.image_name)
 
     def _get_instance_variables(self, guests):
         """
@@ -130,10 +301,24 @@ class Packer(ABC):
             dict: variables of the Packer module.
         """
         machines = [guest for _, guest in self.description.base_guests.items() if not guests or guest.base_name in guests]
-        networks = [network for _ , network in self.description.topology.items()]
+        variables = self._get_shared_instance_variables()
+        fingerprints = self._get_image_fingerprints(machines, variables)
         return {
             "ansible_scp_extra_args": "'-O'" if ssh_version() >= 9 and self.config.platform != "docker" else "",
-            "machines_json": json.dumps({guest.base_name: guest.to_dict() for guest in machines}),
+            "machines_json": json.dumps({guest.base_name: {**guest.to_dict(), "image_fingerprint": fingerprints[guest.base_name]} for guest in machines}),
+            **variables,
+        }
+
+    def _get_shared_instance_variables(self):
+        """
+        Return the variables for creating instances images that are the
+        same for every machine.
+
+        Returns:
+            dict: variables of the Packer module.
+        """
+        networks = [network for _ , network in self.description.topology.items()]
+        return {
             "os_data_json": json.dumps(OS_DATA),
             "tectonic_json": json.dumps(self.description.to_dict()),
             "networks_json": json.dumps({"networks":{network.base_name: network.to_dict() for network in networks}}),
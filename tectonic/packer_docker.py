@@ -42,3 +42,18 @@ class PackerDocker(Packer):
             client (Client): Tectonic client object
         """
         super().__init__(config, description, client)
+
+    def create_instance_image(self, guests):
+        """
+        Create instances images. In cluster mode, images are built in the
+        docker server in uri and then copied to every other host.
+
+        Parameters:
+            guests (list(str)): names of the guests for which to create images.
+        """
+        super().create_instance_image(guests)
+        if not self.config.docker.hosts:
+            return
+        for _, guest in self.description.base_guests.items():
+            if not guests or guest.base_name in guests:
+                self.client.copy_image(guest.image_name)
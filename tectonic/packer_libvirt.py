@@ -18,6 +18,8 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
+
 from tectonic.packer import Packer
 
 class PackerLibvirtException(Exception):
@@ -40,3 +42,22 @@ class PackerLibvirt(Packer):
             client (Client): Tectonic client object
         """
         super().__init__(config, description, client)
+
+    def create_instance_image(self, guests):
+        """
+        Create instances images. In cluster mode, images are created in the
+        storage pool of every host, since volumes are cloned locally.
+
+        Parameters:
+            guests (list(str)): names of the guests for which to create images.
+        """
+        if not self.config.libvirt.hosts:
+            return super().create_instance_image(guests)
+        # The variables and fingerprints are the same for every host, except for its libvirt server
+        variables = self._get_instance_variables(guests)
+        tectonic = json.loads(variables["tectonic_json"])
+        for host in self.config.libvirt.hosts:
+            tectonic["config"]["platforms"]["libvirt"]["uri"] = host["uri"]
+            tectonic["config"]["platforms"]["libvirt"]["storage_pool"] = host.get("storage_pool", self.config.libvirt.storage_pool)
+            self._invoke_packer(self.INSTANCES_PACKER_MODULE, {**variables, "tectonic_json": json.dumps(tectonic)})
+        self._save_image_fingerprints(variables)
@@ -0,0 +1,62 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from tectonic.packer import Packer, PackerException
+from tectonic.platform_simulated import SimulatedPlatform
+
+class PackerSimulated(Packer):
+    """
+    PackerSimulated class.
+
+    Description: simulates the creation of images in memory.
+    """
+
+    def __init__(self, config, description, client):
+        """
+        Initialize the packer object.
+
+        Parameters:
+            config (Config): Tectonic config object.
+            description (Description): Tectonic description object.
+            client (Client): Tectonic client object
+        """
+        super().__init__(config, description, client)
+        self.platform = SimulatedPlatform.get(config, description)
+
+    def _invoke_packer(self, packer_module, variables):
+        """
+        Register the images of the machines in the simulated platform.
+
+        Parameters:
+            packer_module (str): path to the Packer module.
+            variables (dict): variables of the Packer module.
+        """
+        machines = json.loads(variables["machines_json"])
+        if packer_module == self.INSTANCES_PACKER_MODULE:
+            images = [self.description.base_guests[base_name].image_name for base_name in machines]
+        else:
+            images = [service.image_name for _, service in self.description.services_guests.items() if service.base_name in machines]
+        try:
+            self.platform.request("build_image")
+        except Exception as e:
+            raise PackerException(f"Packer build returned an error:\n{e}") from e
+        self.platform.add_images(images)
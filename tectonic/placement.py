@@ -0,0 +1,197 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+from urllib.parse import urlparse
+
+class PlacementException(Exception):
+    pass
+
+class Placement:
+    """
+    Placement class.
+
+    Description: assigns whole scenario instances to the hosts of a cluster,
+    according to the memory and vCPUs of their guests and the capacity of each host.
+    """
+
+    def __init__(self, description, hosts, services_host=None):
+        """
+        Initialize the placement object.
+
+        Parameters:
+            description (Description): Tectonic description object.
+            hosts (list(dict)): name, uri, memory (MB) and vcpu capacity of each host.
+            services_host (str): name of the host where service machines run, if it
+              is part of the cluster. Default: None.
+        """
+        self.description = description
+        self.hosts = hosts
+        self.services_host = services_host
+        self._assignments = None
+        self._machines = None
+
+    def _demand(self, machines):
+        """
+        Return the memory and vCPUs required by the machines.
+
+        Parameters:
+            machines (list(MachineDescription)): machines to run.
+
+        Return:
+            tuple(int, int): memory (MB) and vcpus.
+        """
+        memory = sum(int(machine.memory) * int(getattr(machine, "copies", 1)) for machine in machines)
+        vcpu = sum(int(machine.vcpu) * int(getattr(machine, "copies", 1)) for machine in machines)
+        return memory, vcpu
+
+    def _assign(self):
+        """
+        Assign each instance to the least loaded host that can hold it.
+        Instances are assigned in order, so the result only depends on the description
+        and the hosts.
+
+        Return:
+            dict: host name of each instance number.
+        """
+        if not self.hosts:
+            raise PlacementException("No hosts configured.")
+        free = {host["name"]: [int(host["memory"]), int(host["vcpu"])] for host in self.hosts}
+        if self.services_host is not None:
+            memory, vcpu = self._demand([service for _, service in self.description.services_guests.items()])
+            free[self.services_host][0] -= memory
+            free[self.services_host][1] -= vcpu
+            if free[self.services_host][0] < 0 or free[self.services_host][1] < 0:
+                raise PlacementException(f"Not enough capacity in host {self.services_host} for the services.")
+
+        memory, vcpu = self._demand([guest for _, guest in self.description.base_guests.items()])
+        assignments = {}
+        for instance in range(1, self.description.instance_number + 1):
+            candidates = [host for host in self.hosts if free[host["name"]][0] >= memory and free[host["name"]][1] >= vcpu]
+            if not candidates:
+                raise PlacementException(f"Not enough capacity in the cluster for instance {instance}: "
+                                         f"{memory} MB of memory and {vcpu} vCPUs are required.")
+            host = max(candidates, key=lambda host: free[host["name"]][0] / int(host["memory"]))
+            free[host["name"]][0] -= memory
+            free[host["name"]][1] -= vcpu
+            assignments[instance] = host["name"]
+        return assignments
+
+    @property
+    def assignments(self):
+        """Host name of each instance number."""
+        if self._assignments is None:
+            self._assignments = self._assign()
+        return self._assignments
+
+    def host(self, host_name):
+        """
+        Return a host by name.
+
+        Parameters:
+            host_name (str): name of the host.
+
+        Return:
+            dict: the host.
+        """
+        for host in self.hosts:
+            if host["name"] == host_name:
+                return host
+        raise PlacementException(f"Unknown host {host_name}.")
+
+    def host_of_instance(self, instance):
+        """
+        Return the host assigned to an instance.
+
+        Parameters:
+            instance (int): instance number.
+
+        Return:
+            dict: the host.
+        """
+        if instance not in self.assignments:
+            raise PlacementException(f"Invalid instance {instance}.")
+        return self.host(self.assignments[instance])
+
+    def host_of_machine(self, machine_name):
+        """
+        Return the host of a scenario machine.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            dict: the host, or None if it is not a scenario machine.
+        """
+        if self._machines is None:
+            self._machines = {name: guest.instance for name, guest in self.description.scenario_guests.items()}
+        instance = self._machines.get(machine_name)
+        if instance is None:
+            return None
+        return self.host_of_instance(instance)
+
+    def instances_of_host(self, host_name):
+        """
+        Return the instances assigned to a host.
+
+        Parameters:
+            host_name (str): name of the host.
+
+        Return:
+            list(int): instance numbers.
+        """
+        return [instance for instance, name in self.assignments.items() if name == host_name]
+
+    def address(self, host):
+        """
+        Return the address of a host, used as gateway of the routes to its instances.
+
+        Parameters:
+            host (dict): the host.
+
+        Return:
+            str: the configured address, or the host name of its URI.
+        """
+        return host.get("address") or urlparse(host["uri"]).hostname
+
+    def routes(self, services_address, services_cidrs):
+        """
+        Return the routes between hosts that connect the instances of every host with
+        the services, so that each instance subnetwork is reachable from the services host.
+
+        Parameters:
+            services_address (str): address of the services host.
+            services_cidrs (list(str)): networks of the services host.
+
+        Return:
+            list(dict): host, destination network and gateway address of each route.
+        """
+        routes = []
+        for host in self.hosts:
+            if host["name"] == self.services_host:
+                continue
+            instances = self.instances_of_host(host["name"])
+            if not instances:
+                continue
+            for _, network in self.description.scenario_networks.items():
+                if network.instance in instances:
+                    routes.append({"host": self.services_host or "services", "destination": network.ip_network, "gateway": self.address(host)})
+            for cidr in services_cidrs:
+                routes.append({"host": host["name"], "destination": cidr, "gateway": services_address})
+        return routes
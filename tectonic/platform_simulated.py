@@ -0,0 +1,342 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import random
+import re
+import threading
+import time
+
+class SimulatedPlatformException(Exception):
+    pass
+
+class SimulatedPlatform:
+    """
+    SimulatedPlatform class.
+
+    Description: in-memory state of the machines, networks and images of a lab in the
+    simulated platform, shared by all the simulated components. Every request waits
+    the configured API latency and fails with the configured probability, and machines
+    take the configured boot time to accept connections after they are started.
+    """
+
+    RESOURCE_ADDRESS = re.compile(r'^simulated_(machine|network)\.\w+(?:\["(.+)"\])?$')
+
+    _platforms = {}
+    _platforms_lock = threading.Lock()
+
+    def __init__(self, api_latency=0, failure_rate=0, boot_time=0, seed=0, api_rate_limit=0):
+        """
+        Init method.
+
+        Parameters:
+            api_latency (int): milliseconds that each request takes. Default: 0
+            failure_rate (int): percentage of requests that fail. Default: 0
+            boot_time (int): milliseconds that machines take to boot. Default: 0
+            seed (int): seed of the failure generator. Default: 0
+            api_rate_limit (int): concurrent requests accepted before throttling, 0 for no limit. Default: 0
+        """
+        self.api_latency = int(api_latency)
+        self.failure_rate = int(failure_rate)
+        self.boot_time = int(boot_time)
+        self.api_rate_limit = int(api_rate_limit)
+        self.machines = {}
+        self.networks = {}
+        self.images = set()
+        self.image_fingerprints = {}
+        self.requests = 0
+        self._random = random.Random(int(seed))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, config, description):
+        """
+        Return the state shared by every component working on the lab of the description.
+
+        Parameters:
+            config (Config): Tectonic config object.
+            description (Description): Tectonic description object.
+
+        Return:
+            SimulatedPlatform: the shared state.
+        """
+        key = (description.institution, description.lab_name)
+        with cls._platforms_lock:
+            if key not in cls._platforms:
+                cls._platforms[key] = SimulatedPlatform(
+                    config.simulated.api_latency,
+                    config.simulated.failure_rate,
+                    config.simulated.boot_time,
+                    config.simulated.seed,
+                    config.simulated.api_rate_limit,
+                )
+            return cls._platforms[key]
+
+    @classmethod
+    def reset(cls):
+        """
+        Discard the state of every simulated lab.
+        """
+        with cls._platforms_lock:
+            cls._platforms.clear()
+
+    @classmethod
+    def resource_names(cls, resources, machines=(), networks=()):
+        """
+        Return the machine and network names of Terraform resource addresses.
+
+        Parameters:
+            resources (list(str)): resource addresses, or None for all resources.
+            machines (list(str)): names of the machines of the module, targeted by a whole resource address.
+            networks (list(str)): names of the networks of the module, targeted by a whole resource address.
+
+        Return:
+            set(str): names, or None for all resources.
+        """
+        if resources is None:
+            return None
+        names = set()
+        for resource in resources:
+            match = cls.RESOURCE_ADDRESS.match(resource)
+            if match is None:
+                raise SimulatedPlatformException(f"Invalid resource address {resource}.")
+            if match.group(2) is not None:
+                names.add(match.group(2))
+            else:
+                names.update(machines if match.group(1) == "machine" else networks)
+        return names
+
+    def request(self, operation):
+        """
+        Simulate a request to the platform API.
+
+        Parameters:
+            operation (str): name of the operation, used in the error message.
+        """
+        if self.api_latency > 0:
+            time.sleep(self.api_latency / 1000)
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() * 100 < self.failure_rate
+        if failed:
+            raise SimulatedPlatformException(f"Simulated failure of {operation}.")
+
+    def resource_requests(self, count, parallelism):
+        """
+        Simulate the requests that Terraform sends to change resources,
+        one per resource and up to parallelism of them at the same time.
+        Requests above the rate limit are throttled and take twice as long.
+
+        Parameters:
+            count (int): number of resources.
+            parallelism (int): number of requests sent at the same time.
+
+        Return:
+            float: seconds taken by the requests.
+        """
+        if count == 0 or self.api_latency <= 0:
+            return 0
+        concurrency = min(parallelism, self.api_rate_limit) if self.api_rate_limit else parallelism
+        rounds = math.ceil(count / concurrency)
+        if concurrency < parallelism:
+            rounds *= 2
+        seconds = rounds * self.api_latency / 1000
+        time.sleep(seconds)
+        return seconds
+
+    def get_machine(self, machine_name):
+        """
+        Return the state of a machine.
+
+        Parameters:
+            machine_name (str): name of the machine.
+
+        Return:
+            dict: status, addresses and image of the machine, or None if it does not exist.
+        """
+        with self._lock:
+            machine = self.machines.get(machine_name)
+            return dict(machine) if machine else None
+
+    def get_outputs(self, machine_names):
+        """
+        Return the addresses of existing machines, as the Terraform
+        modules output them.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+
+        Return:
+            dict: private_ip and services_ip of each existing machine, if known.
+        """
+        result = {}
+        with self._lock:
+            for machine_name in machine_names:
+                machine = self.machines.get(machine_name)
+                if machine:
+                    info = {"private_ip": machine["ip"], "services_ip": machine["services_ip"]}
+                    result[machine_name] = {key: value for key, value in info.items() if value is not None}
+        return result
+
+    def apply(self, machines, networks, names=None, recreate=False, parallelism=None):
+        """
+        Create the machines and networks that do not exist yet.
+
+        Parameters:
+            machines (dict): image, ip and services_ip of each machine.
+            networks (dict): data of each network.
+            names (set(str)): names of the machines and networks to apply. Default: None (all of them).
+            recreate (bool): whether to also recreate the existing machines. Default: False
+            parallelism (int): simulate one request per created resource, parallelism at the same time. Default: None (a single request).
+        """
+        self.request("apply")
+        ready_at = time.monotonic() + self.boot_time / 1000
+        created = 0
+        with self._lock:
+            for name, network in networks.items():
+                if names is None or name in names:
+                    created += int(name not in self.networks)
+                    self.networks[name] = network
+            for name, machine in machines.items():
+                if names is not None and name not in names:
+                    continue
+                if name in self.machines and not recreate:
+                    continue
+                created += 1
+                self.machines[name] = dict(machine, status="RUNNING", ready_at=ready_at)
+        if parallelism:
+            self.resource_requests(created, parallelism)
+
+    def destroy(self, machines, networks, names=None, parallelism=None):
+        """
+        Delete machines and networks.
+
+        Parameters:
+            machines (list(str)): names of the machines of the module.
+            networks (list(str)): names of the networks of the module.
+            names (set(str)): names of the machines and networks to delete. Default: None (all of them).
+            parallelism (int): simulate one request per deleted resource, parallelism at the same time. Default: None (a single request).
+        """
+        self.request("destroy")
+        deleted = 0
+        with self._lock:
+            for name in list(machines) + list(networks):
+                if names is None or name in names:
+                    deleted += int(self.machines.pop(name, None) is not None)
+                    deleted += int(self.networks.pop(name, None) is not None)
+        if parallelism:
+            self.resource_requests(deleted, parallelism)
+
+    def set_machine_status(self, machine_name, status):
+        """
+        Change the status of a machine. Machines that are started again have to boot.
+
+        Parameters:
+            machine_name (str): name of the machine.
+            status (str): RUNNING or STOPPED.
+        """
+        with self._lock:
+            machine = self.machines.get(machine_name)
+            if machine is None:
+                raise SimulatedPlatformException(f"Machine {machine_name} not found.")
+            if status == "RUNNING":
+                machine["ready_at"] = time.monotonic() + self.boot_time / 1000
+            machine["status"] = status
+
+    def add_images(self, image_names):
+        """
+        Register images as built.
+
+        Parameters:
+            image_names (list(str)): names of the images.
+        """
+        with self._lock:
+            self.images.update(image_names)
+            for image_name in image_names:
+                self.image_fingerprints.pop(image_name, None)
+
+    def get_image_fingerprint(self, image_name):
+        """
+        Return the fingerprint of the inputs of an image.
+
+        Parameters:
+            image_name (str): name of the image.
+
+        Return:
+            str: fingerprint of the image, or None if the image does not exist or has no fingerprint.
+        """
+        with self._lock:
+            return self.image_fingerprints.get(image_name) if image_name in self.images else None
+
+    def set_image_fingerprint(self, image_name, fingerprint):
+        """
+        Record the fingerprint of the inputs of an image.
+
+        Parameters:
+            image_name (str): name of the image.
+            fingerprint (str): fingerprint of the image.
+        """
+        with self._lock:
+            self.image_fingerprints[image_name] = fingerprint
+
+    def is_image_in_use(self, image_name):
+        """
+        Return whether any machine uses an image.
+
+        Parameters:
+            image_name (str): name of the image.
+
+        Return:
+            bool: True if the image is in use.
+        """
+        with self._lock:
+            return any(machine["image"] == image_name for machine in self.machines.values())
+
+    def delete_image(self, image_name):
+        """
+        Delete an image.
+
+        Parameters:
+            image_name (str): name of the image.
+        """
+        with self._lock:
+            self.images.discard(image_name)
+            self.image_fingerprints.pop(image_name, None)
+
+    def wait_for_boot(self, machine_names):
+        """
+        Wait until the machines have booted. Names that are not machines of the lab
+        (such as localhost) are ignored.
+
+        Parameters:
+            machine_names (list(str)): names of the machines.
+        """
+        ready_at = 0
+        with self._lock:
+            for machine_name in machine_names:
+                machine = self.machines.get(machine_name)
+                if machine is None:
+                    continue
+                if machine["status"] != "RUNNING":
+                    raise SimulatedPlatformException(f"Machine {machine_name} is unreachable.")
+                ready_at = max(ready_at, machine["ready_at"])
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
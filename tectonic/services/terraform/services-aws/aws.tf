@@ -144,17 +144,6 @@ resource "aws_eip_association" "eip_assoc_bastion_host" {
   allocation_id = aws_eip.bastion_host.id
 }
 
-resource "null_resource" "wait_for_machines" {
-  # Wait for instances to become ready.
-  for_each = local.guest_data
-  triggers = {
-    guest_id = aws_instance.machines[each.key].id
-  }
-  provisioner "local-exec" {
-    command = "aws --region=${local.tectonic.config.platforms.aws.region} ec2 wait instance-status-ok --instance-ids ${aws_instance.machines[each.key].id}"
-  }
-}
-
 # DNS Configuration
 resource "aws_route53_zone" "zones" {
   for_each = toset(local.tectonic.config.configure_dns ? local.network_names : [])
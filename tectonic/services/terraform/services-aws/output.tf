@@ -0,0 +1,32 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+output "machines" {
+  description = "Identifier and IP addresses of each machine. Unknown values are null."
+  value = {
+    for name, machine in aws_instance.machines : name => {
+      id          = machine.id
+      private_ip  = machine.private_ip
+      # The bastion host is reached through its elastic IP
+      public_ip   = name == format("%s-%s-bastion_host", local.tectonic.institution, local.tectonic.lab_name) ? aws_eip.bastion_host.public_ip : (machine.public_ip != "" ? machine.public_ip : null)
+      services_ip = null
+    }
+  }
+}
@@ -18,16 +18,16 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
-variable "subnets_json" {
-  type        = string
-  default     = "{}"
-  description = "A JOSN map from subnetwork names to cidr blocks."
+variable "subnets" {
+  type        = any
+  default     = {}
+  description = "A map from subnetwork names to cidr blocks."
 }
 
-variable "guest_data_json" {
-  type        = string
-  default     = "{}"
-  description = "The map with all guest data, in JSON format."
+variable "guest_data" {
+  type        = any
+  default     = {}
+  description = "The map with all guest data."
 }
 
 variable "default_os" {
@@ -36,14 +36,14 @@ variable "default_os" {
   default     = "ubuntu22"
 }
 
-variable "os_data_json" {
-  type        = string
-  description = "A JSON encoded map of operating system information."
+variable "os_data" {
+  type        = any
+  description = "A map of operating system information."
 }
 
-variable "tectonic_json" {
-  type        = string
-  description = "A JSON encoded map of tectonic configuration."
+variable "tectonic" {
+  type        = any
+  description = "A map of tectonic configuration."
 }
 
 variable "teacher_access_type" {
@@ -26,7 +26,9 @@ resource "docker_network" "subnets" {
   for_each = local.subnetworks
 
   name = "${each.key}"
-  driver = "bridge"
+  # In cluster mode, the instances in other docker servers attach to these networks through a swarm overlay
+  driver = length(local.tectonic.config.platforms.docker.hosts) > 1 ? "overlay" : "bridge"
+  attachable = length(local.tectonic.config.platforms.docker.hosts) > 1
   internal = false # The correct approach would be to use the following: "${lookup(each.value, "mode")}" != "nat" so that only the internet network has internet access. But port forwarding does not work with internal networks. Therefore, the service network cannot be internal.
   ipam_config {
     subnet = lookup(each.value, "cidr")
@@ -19,9 +19,9 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 locals {
-  guest_data  = jsondecode(var.guest_data_json)
-  subnetworks = jsondecode(var.subnets_json)
-  os_data = jsondecode(var.os_data_json)
+  guest_data  = var.guest_data
+  subnetworks = var.subnets
+  os_data = var.os_data
   guest_basenames = distinct([for g in local.guest_data : g.base_name])
-  tectonic = jsondecode(var.tectonic_json)
+  tectonic = var.tectonic
 }
@@ -22,12 +22,27 @@ import importlib.resources as tectonic_resources
 from tectonic.constants import OS_DATA
 import python_terraform
 import os
+import re
 import json
+import hashlib
+import tempfile
+import shutil
+import fcntl
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from abc import ABC, abstractmethod
 
 class TerraformException(Exception):
     pass
 
+# Index or key of an instance of a resource in a Terraform address
+RESOURCE_INSTANCE_KEY = re.compile(r'\[[^\[\]]*\]$')
+# Address of a machine in the instances and services modules
+MACHINE_ADDRESS = re.compile(r'^\w+\.machines\["(.+)"\]$')
+
 class Terraform(ABC):
     """
     Terraform class.
@@ -39,6 +54,20 @@ class Terraform(ABC):
 
     #BACKEND_TYPE = "FILE" # Possible values: FILE (for local files as backend), GITLAB (use gitlab as backend. You must change backend.tf of each terraform module).
 
+    # Stored inside the .terraform directory, so that it is removed with it.
+    INIT_FINGERPRINT_FILE = "tectonic_init_fingerprint"
+    # Loaded automatically by terraform from the working directory.
+    VARIABLES_FILE = "tectonic.auto.tfvars.json"
+    # Number of operations that Terraform runs at the same time by default
+    DEFAULT_PARALLELISM = 10
+    # Limits of the automatic parallelism of each platform
+    PARALLELISM_LIMITS = {
+        "aws": (10, 64),
+        "simulated": (10, 64),
+        "libvirt": (2, 16),
+        "docker": (4, 32),
+    }
+
     def __init__(self, config, description):
         """
         Initialize the Terraform object.
@@ -50,8 +79,38 @@ class Terraform(ABC):
         self.config = config
         self.description = description
         self.terraform_instances_module = tectonic_resources.files('tectonic') / 'terraform' / 'modules' / f"gsi-lab-{self.config.platform}"
+        # Machines output of each applied state
+        self._machine_outputs = {}
+        # Machines created or replaced by the last apply of each state
+        self._created_machines = {}
+        # Set by Instrumentation.instrument_terraform to profile the Terraform runs
+        self.instrumentation = None
+
+    @property
+    def machine_info(self):
+        """
+        Information about the machines reported by Terraform in the last apply of each state.
+
+        Return:
+            dict: id, private_ip, public_ip and services_ip of each machine, if known.
+        """
+        result = {}
+        for machines in list(self._machine_outputs.values()):
+            result.update(machines)
+        return result
+
+    def pop_created_machines(self):
+        """
+        Get the machines created or replaced by the applies since the
+        last call, and forget them.
+
+        Return:
+            list(str): names of the machines.
+        """
+        created_machines, self._created_machines = self._created_machines, {}
+        return sorted({name for names in created_machines.values() for name in names})
 
-    def _run_terraform_cmd(self, t, cmd, variables, **args):
+    def _run_terraform_cmd(self, t, cmd, variables, *cmd_args, **args):
         """
         Run terraform command.
 
@@ -59,30 +118,150 @@ class Terraform(ABC):
             t (terraform): terraform object.
             cmd (str): terraform command to apply.
             variables (dict): variabls to use terraform invocation.
+            *cmd_args (args): positional arguments of the command (for example, a plan file).
             **args (args): other arguments to use in terraform invocation.
         
         Return:
             str: output of the action (stdout)
         """
-        return_code, stdout, stderr = t.cmd(cmd, no_color=python_terraform.IsFlagged, var=variables, **args)
+        return_code, stdout, stderr = t.cmd(cmd, *cmd_args, no_color=python_terraform.IsFlagged, var=variables, **args)
         if return_code != 0:
             raise TerraformException(f"ERROR: terraform {cmd} returned an error: {stderr}")
         return stdout
     
-    def _generate_backend_config(self, terraform_dir):
+    def _count_resources(self, variables):
         """
-        Generate Terraform backend configuration.
+        Estimate the number of resources of a state from its variables:
+        its machines, their interfaces and its networks.
+
+        Parameters:
+            variables (dict): variables of the terraform module.
+
+        Return:
+            int: number of resources.
+        """
+        guests = (variables or {}).get("guest_data") or {}
+        interfaces = sum(len(guest.get("interfaces") or {}) for guest in guests.values())
+        return len(guests) + interfaces + len((variables or {}).get("subnets") or {})
+
+    def _get_host_cpus(self, variables):
+        """
+        Get the number of CPUs of the host where the machines of a state are created.
+
+        The host is the server of the uri in the variables of the state.
+        In cluster mode, the vcpu of that host is used. Otherwise, the CPUs
+        of this machine are used for docker and local libvirt servers.
+
+        Parameters:
+            variables (dict): variables of the terraform module.
+
+        Return:
+            int: number of CPUs, or None if they are not known.
+        """
+        platform = self.config.platform
+        if platform in ["libvirt", "docker"]:
+            platform_config = getattr(self.config, platform)
+            platforms = ((variables or {}).get("tectonic") or {}).get("config", {}).get("platforms", {})
+            uri = platforms.get(platform, {}).get("uri", platform_config.uri)
+            host = next((host for host in platform_config.hosts if host["uri"] == uri), None)
+            if host is not None and host.get("vcpu"):
+                return int(host["vcpu"])
+            if platform == "libvirt" and urlparse(uri).hostname not in [None, "", "localhost", "127.0.0.1"]:
+                return None
+        return os.cpu_count() or 1
+
+    def _get_parallelism(self, variables):
+        """
+        Get the number of operations that Terraform runs at the same
+        time in a state. Unless terraform_parallelism is set, it depends
+        on the platform: AWS (and the simulated platform) is bound by the
+        API rate limits, so it grows with the resources of the state;
+        libvirt is bound by the disk of the host cloning volumes and
+        docker by the CPUs of the docker server. If the CPUs of a remote
+        libvirt server are not known, the lowest parallelism is used.
+
+        Parameters:
+            variables (dict): variables of the terraform module.
+
+        Return:
+            int: parallelism.
+        """
+        if int(self.config.terraform_parallelism):
+            return int(self.config.terraform_parallelism)
+        platform = self.config.platform
+        if platform not in self.PARALLELISM_LIMITS:
+            return self.DEFAULT_PARALLELISM
+        low, high = self.PARALLELISM_LIMITS[platform]
+        if platform in ["aws", "simulated"]:
+            parallelism = self._count_resources(variables) // 4
+        else:
+            cpus = self._get_host_cpus(variables)
+            if cpus is None:
+                return low
+            parallelism = cpus // 2 if platform == "libvirt" else cpus * 2
+        return max(low, min(parallelism, high))
+
+    @contextmanager
+    def _profile(self, operation, terraform_dir, state_name, parallelism, variables):
+        """
+        Record the duration and parallelism of a Terraform operation,
+        if the Terraform runs are instrumented.
+
+        Parameters:
+            operation (str): name of the operation.
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name.
+            parallelism (int): parallelism of the operation.
+            variables (dict): variables of the terraform module.
+        """
+        if self.instrumentation is None:
+            yield
+            return
+        state = self._get_state_name(terraform_dir, state_name)
+        resources = self._count_resources(variables)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.instrumentation.record_terraform(state, operation, parallelism, resources, time.perf_counter() - start, True)
+            raise
+        self.instrumentation.record_terraform(state, operation, parallelism, resources, time.perf_counter() - start)
+
+    def _get_state_name(self, terraform_dir, state_name=None):
+        """
+        Get the full name of a Terraform state of the lab.
 
         Parameters:
             terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name, to keep several states of the same module. Default: None.
+
+        Return:
+            str: name of the state.
         """
         terraform_module_name = os.path.basename(os.path.normpath(terraform_dir))
+        if state_name is not None:
+            terraform_module_name = f"{terraform_module_name}-{state_name}"
+        return f"{self.description.institution}-{self.description.lab_name}-{terraform_module_name}"
+
+    def _generate_backend_config(self, terraform_dir, state_name=None):
+        """
+        Generate Terraform backend configuration.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name, to keep several states of the same module. Default: None.
+        """
         if self.BACKEND_TYPE == "FILE":
-            return [
-                f"path=terraform-states/{self.description.institution}-{self.description.lab_name}-{terraform_module_name}"
-            ]
+            state_name = self._get_state_name(terraform_dir, state_name)
+            state_file = self._get_data_dir(terraform_dir, "terraform-states") / state_name
+            # States kept in the module directory by previous versions
+            legacy_state_file = Path(terraform_dir).absolute() / "terraform-states" / state_name
+            if legacy_state_file.is_file() and not state_file.exists():
+                shutil.move(legacy_state_file, state_file)
+            # Absolute, so that states are found from any working directory
+            return [f"path={state_file}"]
         elif self.BACKEND_TYPE == "GITLAB":
-            address = f"{self.config.gitlab_backend_url}/{self.description.institution}-{self.description.lab_name}-{terraform_module_name}"
+            address = f"{self.config.gitlab_backend_url}/{self._get_state_name(terraform_dir, state_name)}"
             return [
                 f"address={address}",
                 f"lock_address={address}/lock",
@@ -94,7 +273,154 @@ class Terraform(ABC):
                 "retry_wait_min=5",
             ]
         
-    def _apply(self, terraform_dir, variables, resources=None, recreate=False):
+    def _get_data_dir(self, terraform_dir, name):
+        """
+        Get a directory for the files Terraform generates for a module.
+
+        Generated files are kept under the configured Terraform data
+        directory, outside of the module directory, in a subdirectory
+        for each module.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            name (str): name of the directory.
+
+        Return:
+            Path: path to the directory, created if it does not exist.
+        """
+        data_dir = Path(self.config.terraform_data_dir) / Path(terraform_dir).absolute().name / name
+        data_dir.mkdir(parents=True, exist_ok=True)
+        return data_dir
+
+    def _get_working_dir(self, terraform_dir, state_name=None):
+        """
+        Get the working directory to run Terraform on a state.
+
+        Each state of each lab edition gets its own working directory,
+        with links to the module files, so that Terraform never writes
+        to the module directory and several states (of the same or of
+        different editions) can be planned and applied at the same time.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name. Default: None.
+
+        Return:
+            str: path to the working directory.
+        """
+        module_dir = Path(terraform_dir).absolute()
+        working_dir = self._get_data_dir(terraform_dir, "terraform-workdirs") / self._get_state_name(terraform_dir, state_name)
+        working_dir.mkdir(parents=True, exist_ok=True)
+        module_files = set()
+        for path in module_dir.iterdir():
+            if path.name in (".terraform", self.VARIABLES_FILE) or path.name.startswith(("terraform-", f".{self.VARIABLES_FILE}")):
+                continue
+            module_files.add(path.name)
+            link = working_dir / path.name
+            if link.is_symlink() and os.readlink(link) == str(path):
+                continue
+            link.unlink(missing_ok=True)
+            link.symlink_to(path)
+        # Forget files removed from the module
+        for link in working_dir.iterdir():
+            if link.is_symlink() and link.name not in module_files:
+                link.unlink()
+        return str(working_dir)
+
+    @contextmanager
+    def _plugin_cache_lock(self):
+        """
+        Hold an exclusive lock on the shared plugin cache directory, if
+        configured, since terraform init is not safe to run concurrently
+        on the same plugin cache.
+        """
+        if not self.config.terraform_plugin_cache_dir:
+            yield
+            return
+        os.makedirs(self.config.terraform_plugin_cache_dir, exist_ok=True)
+        with open(f"{self.config.terraform_plugin_cache_dir}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _init_fingerprint(self, terraform_dir, backend_config):
+        """
+        Compute the fingerprint of a terraform init.
+
+        The fingerprint covers the backend configuration, the provider
+        lock file and the module files.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            backend_config (list(str)): backend configuration used in the init.
+
+        Return:
+            str: fingerprint of the init.
+        """
+        fingerprint = hashlib.sha256(json.dumps(backend_config).encode())
+        module_dir = Path(terraform_dir)
+        for path in sorted(module_dir.glob("*.tf")) + [module_dir / ".terraform.lock.hcl"]:
+            if path.is_file():
+                fingerprint.update(path.name.encode())
+                fingerprint.update(path.read_bytes())
+        return fingerprint.hexdigest()
+
+    def _init(self, t, terraform_dir, state_name=None):
+        """
+        Execute terraform init command, unless nothing changed since the last init.
+
+        Providers are downloaded to the shared plugin cache directory, if configured.
+
+        Parameters:
+            t (terraform): terraform object, in the working directory of the state.
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name. Default: None.
+        """
+        backend_config = self._generate_backend_config(terraform_dir, state_name)
+        fingerprint_file = Path(t.working_dir) / ".terraform" / self.INIT_FINGERPRINT_FILE
+        if fingerprint_file.is_file() and fingerprint_file.read_text() == self._init_fingerprint(t.working_dir, backend_config):
+            return
+
+        if self.config.terraform_plugin_cache_dir:
+            os.environ.setdefault("TF_PLUGIN_CACHE_DIR", self.config.terraform_plugin_cache_dir)
+        # Forget the previous init in case this one fails halfway
+        fingerprint_file.unlink(missing_ok=True)
+        with self._plugin_cache_lock():
+            self._run_terraform_cmd(t, "init", [], reconfigure=python_terraform.IsFlagged, backend_config=backend_config)
+        if fingerprint_file.parent.is_dir():
+            fingerprint_file.write_text(self._init_fingerprint(t.working_dir, backend_config))
+
+    @contextmanager
+    def _variables_file(self, t, variables):
+        """
+        Write the variables of the module to a tfvars file in the working directory.
+
+        The file is written once and used by every terraform command
+        run inside the context. It is only readable by the user, since
+        it may contain credentials, and it is removed on exit.
+
+        Parameters:
+            t (terraform): terraform object, in the working directory of the state.
+            variables (dict): variables of the terraform module.
+        """
+        variables_file = os.path.join(t.working_dir, self.VARIABLES_FILE)
+        fd, tmp_file = tempfile.mkstemp(prefix=f".{self.VARIABLES_FILE}.", dir=t.working_dir)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(variables, f)
+            # Atomic, so that terraform never reads a partial file
+            os.replace(tmp_file, variables_file)
+            yield variables_file
+        finally:
+            for path in [tmp_file, variables_file]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _apply(self, terraform_dir, variables, resources=None, recreate=False, state_name=None):
         """
         Execute terraform apply command.
 
@@ -102,17 +428,150 @@ class Terraform(ABC):
             terraform_dir (str): path to the terraform module.
             variables (dict): variables of the terraform module.
             resources (list(str)): name of terraform resources for target apply. Default: None.
+            state_name (str): suffix of the state name. Default: None.
         """
-        t = python_terraform.Terraform(working_dir=terraform_dir)
-        self._run_terraform_cmd(t, "init", [], reconfigure=python_terraform.IsFlagged, backend_config=self._generate_backend_config(terraform_dir))
-        if recreate:
-            self._run_terraform_cmd(t, "plan", variables, input=False, replace=resources)
-            self._run_terraform_cmd(t, "apply", variables, auto_approve=True, input=False, replace=resources)
-        else:
-            self._run_terraform_cmd(t, "plan", variables, input=False, target=resources)
-            self._run_terraform_cmd(t, "apply", variables, auto_approve=True, input=False, target=resources)
+        t = python_terraform.Terraform(working_dir=self._get_working_dir(terraform_dir, state_name))
+        plan_file = self._get_plan_file(terraform_dir, state_name)
+        parallelism = self._get_parallelism(variables)
+        with self._variables_file(t, variables):
+            self._init(t, terraform_dir, state_name)
+            with self._profile("plan", terraform_dir, state_name, parallelism, variables):
+                if recreate:
+                    self._run_terraform_cmd(t, "plan", None, input=False, out=plan_file, replace=resources, parallelism=parallelism)
+                else:
+                    self._run_terraform_cmd(t, "plan", None, input=False, out=plan_file, target=resources, parallelism=parallelism)
+        summary = self._summarize_plan(t, plan_file)
+        self._created_machines[self._get_state_name(terraform_dir, state_name)] = [
+            match.group(1) for match in map(MACHINE_ADDRESS.match, summary["create"] + summary["replace"]) if match
+        ]
+        if summary["changes"]:
+            # The saved plan already has the variables and targets
+            with self._profile("apply", terraform_dir, state_name, parallelism, variables):
+                self._run_terraform_cmd(t, "apply", None, plan_file, input=False, parallelism=parallelism)
+        self._harvest_outputs(t, terraform_dir, state_name)
+
+    def _harvest_outputs(self, t, terraform_dir, state_name=None):
+        """
+        Keep the machines output of a Terraform state, so that clients
+        do not need to ask the platform for it again.
+
+        Null values are unknown to Terraform and are left out.
+
+        Parameters:
+            t (terraform): terraform object, in the working directory of the state.
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name. Default: None.
+        """
+        try:
+            outputs = json.loads(self._run_terraform_cmd(t, "output", None, json=python_terraform.IsFlagged))
+        except json.JSONDecodeError as e:
+            raise TerraformException(f"ERROR: cannot parse terraform outputs: {e}") from e
+        machines = (outputs.get("machines") or {}).get("value") or {}
+        self._machine_outputs[self._get_state_name(terraform_dir, state_name)] = {
+            name: {key: value for key, value in info.items() if value is not None} for name, info in machines.items()
+        }
+
+    def _get_plan_file(self, terraform_dir, state_name=None):
+        """
+        Get the path of the saved plan of a Terraform state.
+
+        Plans are kept after being applied, together with their
+        summary, in the terraform-plans directory of the module.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            state_name (str): suffix of the state name. Default: None.
 
-    def _destroy(self, terraform_dir, variables, resources=None):
+        Return:
+            str: path of the plan file.
+        """
+        plans_dir = self._get_data_dir(terraform_dir, "terraform-plans")
+        return str(plans_dir / f"{self._get_state_name(terraform_dir, state_name)}.tfplan")
+
+    def _summarize_plan(self, t, plan_file):
+        """
+        Summarize the changes of a saved plan.
+
+        The summary is also saved next to the plan, with a .json extension.
+
+        Parameters:
+            t (terraform): terraform object.
+            plan_file (str): path of the plan file.
+
+        Return:
+            dict: addresses of the resources to create, update, replace
+                and delete, and whether the plan has any change to apply.
+                Also the addresses of the resources that changed outside
+                of Terraform (drift).
+        """
+        try:
+            plan = json.loads(self._run_terraform_cmd(t, "show", None, plan_file, json=python_terraform.IsFlagged))
+        except json.JSONDecodeError as e:
+            raise TerraformException(f"ERROR: cannot parse terraform plan {plan_file}: {e}") from e
+
+        summary = {"create": [], "update": [], "replace": [], "delete": []}
+        for resource in plan.get("resource_changes", []):
+            actions = resource["change"]["actions"]
+            if "create" in actions and "delete" in actions:
+                summary["replace"].append(resource["address"])
+            elif actions[0] in summary:
+                summary[actions[0]].append(resource["address"])
+        outputs_changed = any(output["actions"] != ["no-op"] for output in plan.get("output_changes", {}).values())
+        summary["changes"] = outputs_changed or any(summary[action] for action in ["create", "update", "replace", "delete"])
+        summary["drift"] = [resource["address"] for resource in plan.get("resource_drift", [])]
+
+        with open(f"{os.path.splitext(plan_file)[0]}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def _check(self, terraform_dir, variables, resources=None, state_name=None):
+        """
+        Look for resources of a Terraform state that changed outside of Terraform.
+
+        A refresh-only plan is saved next to the plans of the state,
+        with a .check.tfplan extension, and summarized only if terraform
+        reports drift.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources to check. Default: None (checks everything).
+            state_name (str): suffix of the state name. Default: None.
+
+        Return:
+            list(str): addresses of the drifted resources.
+        """
+        t = python_terraform.Terraform(working_dir=self._get_working_dir(terraform_dir, state_name))
+        plan_file = f"{os.path.splitext(self._get_plan_file(terraform_dir, state_name))[0]}.check.tfplan"
+        with self._variables_file(t, variables):
+            self._init(t, terraform_dir, state_name)
+            drift = self._refresh_plan(t, plan_file, resources, self._get_parallelism(variables))
+        if not drift:
+            return []
+        return self._summarize_plan(t, plan_file)["drift"]
+
+    def _refresh_plan(self, t, plan_file, resources=None, parallelism=None):
+        """
+        Save a refresh-only plan.
+
+        Parameters:
+            t (terraform): terraform object, in the working directory of the state.
+            plan_file (str): path of the plan file.
+            resources (list(str)): name of terraform resources to refresh. Default: None.
+            parallelism (int): number of resources refreshed at the same time. Default: None (Terraform default).
+
+        Return:
+            bool: whether the resources changed outside of Terraform.
+        """
+        return_code, _, stderr = t.cmd("plan", no_color=python_terraform.IsFlagged, input=False,
+                                       refresh_only=python_terraform.IsFlagged, detailed_exitcode=python_terraform.IsFlagged,
+                                       out=plan_file, target=resources, parallelism=parallelism)
+        # With -detailed-exitcode, 2 means that the plan has changes
+        if return_code not in [0, 2]:
+            raise TerraformException(f"ERROR: terraform plan returned an error: {stderr}")
+        return return_code == 2
+
+    def _destroy(self, terraform_dir, variables, resources=None, state_name=None):
         """
         Execute terraform destroy command.
 
@@ -120,14 +579,22 @@ class Terraform(ABC):
             terraform_dir (str): path to the terraform module.
             variables (dict): variables of the terraform module.
             resources (list(str)): name of terraform resources for target destroy. Default: None (deletes everything). 
+            state_name (str): suffix of the state name. Default: None.
         """
         if resources is not None and len(resources) == 0:
             # Do nothing
             return
 
-        t = python_terraform.Terraform(working_dir=terraform_dir)
-        self._run_terraform_cmd(t, "init", [], reconfigure=python_terraform.IsFlagged, backend_config=self._generate_backend_config(terraform_dir))
-        self._run_terraform_cmd(t, "destroy", variables, auto_approve=True, input=False, target=resources)
+        t = python_terraform.Terraform(working_dir=self._get_working_dir(terraform_dir, state_name))
+        with self._variables_file(t, variables):
+            self._init(t, terraform_dir, state_name)
+            parallelism = self._get_parallelism(variables)
+            with self._profile("destroy", terraform_dir, state_name, parallelism, variables):
+                self._run_terraform_cmd(t, "destroy", None, auto_approve=True, input=False, target=resources, parallelism=parallelism)
+        if resources is None:
+            self._machine_outputs.pop(self._get_state_name(terraform_dir, state_name), None)
+        else:
+            self._harvest_outputs(t, terraform_dir, state_name)
 
     def _get_machine_resources_name(self, instances, guests, copies):
         """
@@ -156,15 +623,17 @@ class Terraform(ABC):
         pass
 
     @abstractmethod
-    def _get_resources_to_target_apply(self, instances):
+    def _get_resources_to_target_apply(self, instances, guests=None):
         """
         Get resources name for target apply.
 
         Parameters:
             instances (list(int)): number of the instances to target apply.
+            guests (dict): scenario guests of the instances, as returned by
+              _get_scenario_guests. Default: None (computed from instances).
         
         Return:
-            list(str): names of resources.
+            list(str): names of resources, without duplicates.
         """
         pass
 
@@ -195,6 +664,183 @@ class Terraform(ABC):
         """
         pass
 
+    def _get_scenario_guests(self, instances):
+        """
+        Get the scenario guests of the instances in a single pass over the scenario.
+
+        Parameters:
+            instances (list(int)): numbers of the instances, all of them if None or empty.
+
+        Return:
+            dict: guests of each instance, in scenario order.
+        """
+        selected = set(instances or range(1, self.description.instance_number + 1))
+        guests = {}
+        for guest in self.description.scenario_guests.values():
+            if guest.instance in selected:
+                guests.setdefault(guest.instance, []).append(guest)
+        return guests
+
+    def _get_resources_by_instance(self, instances):
+        """
+        Get the resources to target apply of each instance.
+
+        Parameters:
+            instances (list(int)): numbers of the instances.
+
+        Return:
+            dict: names of resources of each instance.
+        """
+        return {instance: self._get_resources_to_target_apply([instance], {instance: guests})
+                for instance, guests in self._get_scenario_guests(instances).items()}
+
+    @staticmethod
+    def _unique_resources(resources):
+        """
+        Remove duplicated resource addresses, keeping the first occurrence.
+
+        Parameters:
+            resources (list(str)): resource addresses.
+
+        Return:
+            list(str): resource addresses without duplicates.
+        """
+        return list(dict.fromkeys(resources))
+
+    @staticmethod
+    def _collapse_resources(resources):
+        """
+        Replace the addresses of the instances of each resource by the
+        address of the whole resource. Only valid when all the instances
+        of the state are targeted.
+
+        Parameters:
+            resources (list(str)): resource addresses.
+
+        Return:
+            list(str): whole resource addresses without duplicates.
+        """
+        return list(dict.fromkeys(RESOURCE_INSTANCE_KEY.sub("", resource) for resource in resources))
+
+    def _get_targets(self, get_resources, instances, state_instances):
+        """
+        Get the resources to target in a state. If all the instances of
+        the state are selected, whole resources are targeted.
+
+        Parameters:
+            get_resources (function): returns the resources of the instances.
+            instances (list(int)): selected instances of the state.
+            state_instances (list(int)): instances of the state.
+
+        Return:
+            list(str): names of resources.
+        """
+        resources = get_resources(instances)
+        if set(instances) >= set(state_instances):
+            resources = self._collapse_resources(resources)
+        return resources
+
+    def _shard_states(self, prefix, host, instances, shard_size=None):
+        """
+        Split instances into Terraform states of terraform_shard_size instances each.
+
+        Parameters:
+            prefix (str): prefix of the state names, or None.
+            host (dict): host of the instances in cluster mode, or None.
+            instances (list(int)): numbers of the instances.
+            shard_size (int): number of instances of each state, 0 for a single state. Default: terraform_shard_size.
+
+        Return:
+            list(tuple(str, dict, list(int))): name, host and instances of each state.
+        """
+        if shard_size is None:
+            shard_size = self.config.terraform_shard_size
+        shard_size = int(shard_size)
+        if not shard_size:
+            return [(prefix, host, instances)]
+        shards = {}
+        for instance in instances:
+            shards.setdefault((instance - 1) // shard_size + 1, []).append(instance)
+        return [(f"{prefix}-shard{shard}" if prefix else f"shard{shard}", host, shard_instances)
+                for shard, shard_instances in shards.items()]
+
+    def _get_instance_states(self, shard_size=None):
+        """
+        Get the Terraform states of the instances module.
+
+        Parameters:
+            shard_size (int): number of instances of each state, 0 for a single state. Default: terraform_shard_size.
+
+        Return:
+            list(tuple(str, dict, list(int))): name (None for the default state), host and instances of each state.
+        """
+        return self._shard_states(None, None, list(range(1, self.description.instance_number + 1)), shard_size)
+
+    def _get_shared_states(self):
+        """
+        Get the Terraform states with the resources of the instances
+        module that are shared by all the instances, in sharded mode.
+
+        Return:
+            list(tuple(str, dict)): name and variables of each state.
+        """
+        return []
+
+    def _select_states(self, instances):
+        """
+        Get the Terraform states of the instances module that contain any of the instances.
+
+        Parameters:
+            instances (list(int)): numbers of the instances, or None for all of them.
+
+        Return:
+            list(tuple(str, dict, list(int), list(int))): name, host, instances
+              and selected instances of each state.
+        """
+        result = []
+        for state_name, host, state_instances in self._get_instance_states():
+            selected = [instance for instance in state_instances if instances is None or instance in instances]
+            if selected:
+                result.append((state_name, host, state_instances, selected))
+        return result
+
+    def _run_states(self, operation, states):
+        """
+        Run an operation on several Terraform states, up to
+        terraform_shard_concurrency of them at the same time.
+
+        Every state is processed even if the operation fails on some of them.
+
+        Parameters:
+            operation (function): operation to run, receives the items of each state as arguments.
+            states (list(tuple)): states to run the operation on.
+
+        Return:
+            list: result of the operation on each state.
+        """
+        workers = min(int(self.config.terraform_shard_concurrency), len(states))
+        results = []
+        errors = []
+        if workers <= 1:
+            for state in states:
+                try:
+                    results.append(operation(*state))
+                except Exception as exception:
+                    errors.append((state[0], exception))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [(state[0], executor.submit(operation, *state)) for state in states]
+            for state_name, future in futures:
+                if future.exception() is not None:
+                    errors.append((state_name, future.exception()))
+                else:
+                    results.append(future.result())
+        if len(errors) == 1:
+            raise errors[0][1]
+        if errors:
+            raise TerraformException("ERROR: terraform failed on several states: " + "; ".join(f"{state_name}: {e}" for state_name, e in errors))
+        return results
+
     def deploy(self, instances):
         """
         Deploy scenario instances.
@@ -202,10 +848,15 @@ class Terraform(ABC):
         Parameters:
             instances (list(int)): number of the instances to recreate.
         """
-        resources_to_create = None
-        if instances is not None:
-            resources_to_create = self._get_resources_to_target_apply(instances)
-        self._apply(self.terraform_instances_module, self._get_terraform_variables(), resources_to_create)
+        def deploy_state(state_name, host, state_instances, selected):
+            resources_to_create = None
+            if instances is not None:
+                resources_to_create = self._get_targets(self._get_resources_to_target_apply, selected, state_instances)
+            self._apply(self.terraform_instances_module, self._get_state_variables(state_name, host, state_instances), resources_to_create, state_name=state_name)
+
+        self._run_states(lambda state_name, variables: self._apply(self.terraform_instances_module, variables, state_name=state_name),
+                         self._get_shared_states())
+        self._run_states(deploy_state, self._select_states(instances))
 
     def destroy(self, instances):
         """
@@ -214,10 +865,16 @@ class Terraform(ABC):
         Parameters:
             instances (list(int)): number of the instances to recreate.
         """
-        resources_to_destroy = None
-        if instances is not None:
-            resources_to_destroy = self._get_resources_to_target_destroy(instances)
-        self._destroy(self.terraform_instances_module, self._get_terraform_variables(), resources_to_destroy)
+        def destroy_state(state_name, host, state_instances, selected):
+            resources_to_destroy = None
+            if instances is not None:
+                resources_to_destroy = self._get_targets(self._get_resources_to_target_destroy, selected, state_instances)
+            self._destroy(self.terraform_instances_module, self._get_state_variables(state_name, host, state_instances), resources_to_destroy, state_name=state_name)
+
+        self._run_states(destroy_state, self._select_states(instances))
+        if instances is None:
+            self._run_states(lambda state_name, variables: self._destroy(self.terraform_instances_module, variables, state_name=state_name),
+                             self._get_shared_states())
 
     def recreate(self, instances, guests, copies): 
         """
@@ -228,8 +885,131 @@ class Terraform(ABC):
             guests (list(str)): name of the guests to recreate.
             copies (list(int)): number of the copies to recreate.
         """
-        resources_to_recreate = self._get_resources_to_recreate(instances, guests, copies)
-        self._apply(self.terraform_instances_module, self._get_terraform_variables(), resources_to_recreate, True)
+        def recreate_state(state_name, host, state_instances, selected):
+            resources_to_recreate = self._get_resources_to_recreate(selected, guests, copies)
+            self._apply(self.terraform_instances_module, self._get_state_variables(state_name, host, state_instances), resources_to_recreate, True, state_name=state_name)
+
+        self._run_states(recreate_state, self._select_states(instances or None))
+
+    def check(self, instances):
+        """
+        Look for resources of the scenario instances that changed outside of Terraform.
+
+        The states are checked in parallel. Resources shared by all the
+        instances are only checked if all instances are selected.
+
+        Parameters:
+            instances (list(int)): number of the instances to check, if None check all.
+
+        Return:
+            dict: addresses of the drifted resources of each instance. Drifted
+                resources that are not of a single instance are under None.
+        """
+        def check_state(state_name, host, state_instances, selected):
+            resources = None
+            if selected != state_instances:
+                resources = self._get_resources_to_target_apply(selected)
+            return self._check(self.terraform_instances_module, self._get_state_variables(state_name, host, state_instances), resources, state_name=state_name)
+
+        states = self._select_states(instances)
+        drift = [address for addresses in self._run_states(check_state, states) for address in addresses]
+        if instances is None:
+            results = self._run_states(lambda state_name, variables: self._check(self.terraform_instances_module, variables, state_name=state_name),
+                                       self._get_shared_states())
+            drift += [address for addresses in results for address in addresses]
+
+        instance_of = {}
+        selected = [instance for _, _, _, state_selected in states for instance in state_selected]
+        for instance, addresses in self._get_resources_by_instance(selected).items():
+            for address in addresses:
+                # Resources of several instances are reported as shared
+                instance_of[address] = instance if instance_of.get(address, instance) == instance else None
+        result = {}
+        for address in drift:
+            result.setdefault(instance_of.get(address), []).append(address)
+        return result
+
+    def migrate_states(self):
+        """
+        Move the resources of the instances module from a single state
+        (one for each host in cluster mode) to the sharded states.
+
+        The previous state is pulled, its resources are moved to the
+        state of their shard (or to the shared state, if not specific
+        to an instance), and the new states are pushed to the backend.
+        A backup of the previous state is kept in the terraform-states
+        directory of the module, under the Terraform data directory.
+
+        Return:
+            dict: number of resources moved to each state.
+        """
+        if not int(self.config.terraform_shard_size):
+            raise TerraformException("ERROR: terraform_shard_size must be set to migrate to sharded states.")
+
+        module_dir = self.terraform_instances_module
+        shared_states = [state_name for state_name, _ in self._get_shared_states()]
+        sharded = self._get_instance_states()
+        moved = {}
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            scratch = python_terraform.Terraform(working_dir=scratch_dir)
+            for source_name, host, _ in self._get_instance_states(shard_size=0):
+                source = python_terraform.Terraform(working_dir=self._get_working_dir(module_dir, source_name))
+                self._init(source, module_dir, source_name)
+                content = self._run_terraform_cmd(source, "state pull", None)
+                if not content.strip():
+                    continue
+                backup = self._get_data_dir(module_dir, "terraform-states") / f"{self._get_state_name(module_dir, source_name)}.unsharded.backup"
+                with open(backup, "w") as f:
+                    f.write(content)
+                source_file = os.path.join(scratch_dir, "source.tfstate")
+                with open(source_file, "w") as f:
+                    f.write(content)
+                addresses = [address for address in self._run_terraform_cmd(scratch, "state list", None, state=source_file).splitlines()
+                             if address and not address.startswith("data.")]
+
+                targets = []
+                for state_name, state_host, state_instances in sharded:
+                    if state_host == host:
+                        resources = set(self._get_resources_to_target_apply(state_instances))
+                        targets.append((state_name, [address for address in addresses if address in resources]))
+                assigned = set(address for _, state_addresses in targets for address in state_addresses)
+                shared_state = f"{source_name}-shared" if source_name else "shared"
+                if shared_state in shared_states:
+                    targets.append((shared_state, [address for address in addresses if address not in assigned]))
+
+                for state_name, state_addresses in targets:
+                    if not state_addresses:
+                        continue
+                    state_file = os.path.join(scratch_dir, f"{state_name}.tfstate")
+                    for address in state_addresses:
+                        self._run_terraform_cmd(scratch, "state mv", None, address, address, state=source_file, state_out=state_file)
+                    t = python_terraform.Terraform(working_dir=self._get_working_dir(module_dir, state_name))
+                    self._init(t, module_dir, state_name)
+                    self._run_terraform_cmd(t, "state push", None, state_file)
+                    moved[state_name] = len(state_addresses)
+
+                # Only remove the resources from the previous state once they are in the new ones
+                self._run_terraform_cmd(source, "state push", None, source_file)
+        return moved
+
+    def _get_state_variables(self, state_name, host, instances):
+        """
+        Get variables to use in Terraform for a state of the instances module.
+
+        Parameters:
+            state_name (str): suffix of the state name, or None for the default state.
+            host (dict): host of the state in cluster mode, or None.
+            instances (list(int)): instances of the state.
+
+        Return:
+            dict: variables.
+        """
+        if state_name is None:
+            return self._get_terraform_variables()
+        variables = self._get_terraform_variables()
+        variables["subnets"] = {network.name: network.to_dict() for network in self.description.scenario_networks.values() if network.instance in instances}
+        variables["guest_data"] = {guest.name: guest.to_dict() for guest in self.description.scenario_guests.values() if guest.instance in instances}
+        return variables
 
     def _get_terraform_variables(self):
         """
@@ -239,8 +1019,8 @@ class Terraform(ABC):
             dict: variables.
         """
         return {
-            "tectonic_json": json.dumps(self.description.to_dict()),
-            "subnets_json": json.dumps({network.name: network.to_dict() for network in self.description.scenario_networks.values()}),
-            "guest_data_json": json.dumps({guest.name: guest.to_dict() for guest in self.description.scenario_guests.values()}),
-            "os_data_json": json.dumps(OS_DATA),
+            "tectonic": self.description.to_dict(),
+            "subnets": {network.name: network.to_dict() for network in self.description.scenario_networks.values()},
+            "guest_data": {guest.name: guest.to_dict() for guest in self.description.scenario_guests.values()},
+            "os_data": OS_DATA,
         }
@@ -174,21 +174,6 @@ resource "aws_instance" "machines" {
   }
 }
 
-resource "null_resource" "wait_for_machines" {
-  # Wait for instances to become ready. This is specially necessary
-  # for windows machines that require a reboot in user-data due to
-  # hostname change.
-  for_each = local.guest_data
-
-  triggers = {
-    guest_id = aws_instance.machines[each.key].id
-  }
-
-  provisioner "local-exec" {
-    command = "aws --region=${local.tectonic.config.platforms.aws.region} ec2 wait instance-status-ok --instance-ids ${aws_instance.machines[each.key].id}"
-  }
-}
-
 # DNS Configuration
 
 resource "aws_route53_zone" "zones" {
@@ -19,24 +19,24 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 
-variable "subnets_json" {
-  type        = string
-  default     = "{}"
-  description = "A JOSN map from subnetwork names to cidr blocks."
+variable "subnets" {
+  type        = any
+  default     = {}
+  description = "A map from subnetwork names to cidr blocks."
 }
 
-variable "guest_data_json" {
-  type        = string
-  default     = "{}"
-  description = "The map with all guest data, in JSON format."
+variable "guest_data" {
+  type        = any
+  default     = {}
+  description = "The map with all guest data."
 }
 
-variable "os_data_json" {
-  type        = string
-  description = "A JSON encoded map of operating system information."
+variable "os_data" {
+  type        = any
+  description = "A map of operating system information."
 }
 
-variable "tectonic_json" {
-  type        = string
-  description = "A JSON encoded map of tectonic configuration."
+variable "tectonic" {
+  type        = any
+  description = "A map of tectonic configuration."
 }
\ No newline at end of file
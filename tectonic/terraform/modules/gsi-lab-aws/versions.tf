@@ -26,6 +26,8 @@ terraform {
       source  = "hashicorp/aws"
       version = "~> 6.0"
     }
+    # Not used anymore, but needed to destroy the wait_for_machines
+    # resources of states created by older versions.
     null = {
       source  = "hashicorp/null"
       version = "~> 3.0"
@@ -0,0 +1,41 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+locals {
+  # The scenario interface with the lowest index is the primary one
+  primary_private_ip = {
+    for name, guest in local.guest_data : name => try(
+      [for interface in values(guest.interfaces) : interface.private_ip if interface.index == min([for i in values(guest.interfaces) : i.index]...)][0],
+      null
+    )
+  }
+}
+
+output "machines" {
+  description = "Identifier and IP addresses of each machine. Unknown values are null."
+  value = {
+    for name, machine in docker_container.machines : name => {
+      id          = machine.id
+      private_ip  = local.primary_private_ip[name]
+      public_ip   = null
+      services_ip = try([for network in machine.network_data : network.ip_address if network.network_name == "${local.tectonic.institution}-${local.tectonic.lab_name}-services"][0], null)
+    }
+  }
+}
@@ -43,11 +43,29 @@ resource "libvirt_cloudinit_disk" "commoninit" {
 
 # External network for student access
 resource "libvirt_network" "external" {
+  count = local.shared_networks ? 1 : 0
+
   name = "${local.tectonic.institution}-${local.tectonic.lab_name}-external"
   mode = "bridge"
   bridge = local.tectonic.config.platforms.libvirt.bridge
 }
 
+moved {
+  from = libvirt_network.external
+  to   = libvirt_network.external[0]
+}
+
+# In cluster mode, hosts other than the services host need their own
+# internet network, since the services module only creates it there.
+resource "libvirt_network" "internet" {
+  count = local.shared_networks && lookup(local.tectonic.config.platforms.libvirt, "local_internet_network", false) && local.internet_access ? 1 : 0
+
+  name = "${local.tectonic.institution}-${local.tectonic.lab_name}-internet"
+  addresses = [local.tectonic.config.internet_network_cidr_block]
+  mode = "nat"
+  autostart = true
+}
+
 resource "libvirt_network" "subnets" {
   for_each = local.subnetworks
 
@@ -71,10 +89,13 @@ resource "libvirt_domain" "machines" {
 
   cloudinit = libvirt_cloudinit_disk.commoninit[each.key].id
 
+  depends_on = [libvirt_network.internet]
+
   dynamic "network_interface" { 
     for_each = each.value.entry_point && local.tectonic.enable_ssh_access ? ["external-nic"] : []
     content { 
-      network_id = libvirt_network.external.id
+      network_id = local.shared_networks ? libvirt_network.external[0].id : null
+      network_name = local.shared_networks ? null : "${local.tectonic.institution}-${local.tectonic.lab_name}-external"
     }
   }
 
@@ -130,7 +151,9 @@ resource "libvirt_domain" "machines" {
   xml {
     xslt = templatefile("${path.module}/xslt/main.xslt.tpl", {
       enable_filters = local.tectonic.config.platforms.libvirt.routing
-      nw_filter_path = "${abspath("${path.module}/xslt/nw_filter.xslt")}"
+      nw_filter = templatefile("${path.module}/xslt/nw_filter.xslt.tpl", {
+        nwfilters = { for interface in each.value.interfaces : interface.subnetwork_name => interface.nwfilter if lookup(interface, "nwfilter", null) != null }
+      })
       custom_path = "${abspath(lookup(each.value, "advanced_options_file", "/dev/null"))}"
     })
   }
@@ -19,11 +19,11 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 locals {
-  tectonic = jsondecode(var.tectonic_json)
-  guest_data  = jsondecode(var.guest_data_json)
-  subnetworks = jsondecode(var.subnets_json)
+  tectonic = var.tectonic
+  guest_data  = var.guest_data
+  subnetworks = var.subnets
 
-  os_data = jsondecode(var.os_data_json)
+  os_data = var.os_data
 
   guest_basenames = distinct([for g in local.guest_data : g.base_name])
 
@@ -101,7 +101,11 @@ locals {
   }
 
 
-  internet_access = length([for g in local.guest_data : g if g.internet_access]) > 0
+  internet_access = lookup(local.tectonic.config.platforms.libvirt, "internet_access", length([for g in local.guest_data : g if g.internet_access]) > 0)
+
+  # With sharded states, the networks shared by all the instances are
+  # kept in a separate state, without guests.
+  shared_networks = lookup(local.tectonic.config.platforms.libvirt, "shared_networks", true)
 
   dns_data = { for record in flatten(
     [for guest in local.guest_data :
@@ -18,3 +18,25 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
+locals {
+  # The scenario interface with the lowest index is the primary one
+  primary_private_ip = {
+    for name, guest in local.guest_data : name => try(
+      [for interface in values(guest.interfaces) : interface.private_ip if interface.index == min([for i in values(guest.interfaces) : i.index]...)][0],
+      null
+    )
+  }
+}
+
+output "machines" {
+  description = "Identifier and IP addresses of each machine. Unknown values are null."
+  value = {
+    for name, machine in libvirt_domain.machines : name => {
+      id          = machine.id
+      private_ip  = local.primary_private_ip[name]
+      public_ip   = null
+      # Only known if terraform waited for the DHCP lease
+      services_ip = try([for nic in machine.network_interface : nic.addresses[0] if nic.network_name == "${local.tectonic.institution}-${local.tectonic.lab_name}-services" && length(nic.addresses) > 0][0], null)
+    }
+  }
+}
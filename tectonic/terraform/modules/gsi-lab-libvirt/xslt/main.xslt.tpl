@@ -7,7 +7,7 @@
     </xsl:template>
 
     %{ if enable_filters }
-    <xsl:include href="${nw_filter_path}"/>
+    ${nw_filter}
     %{ endif }
 
     %{ if custom_path != "/dev/null" }
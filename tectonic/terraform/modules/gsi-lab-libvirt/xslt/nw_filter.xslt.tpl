@@ -0,0 +1,29 @@
+%{ if length(nwfilters) > 0 }
+<!-- Attach the shared nw filter of each network, with the interface parameters -->
+%{ for network_name, nwfilter in nwfilters }
+<xsl:template match="interface[@type='network'][source/@network='${network_name}']">
+    <xsl:copy>
+        <xsl:apply-templates select="@*|node()"/>
+        <filterref filter="${nwfilter.name}">
+            %{ for parameter_name, parameter_value in nwfilter.parameters }
+            <parameter name="${parameter_name}" value="${parameter_value}"/>
+            %{ endfor }
+        </filterref>
+    </xsl:copy>
+</xsl:template>
+%{ endfor }
+%{ else }
+<xsl:template match="interface[@type='network']">
+    <xsl:copy>
+        <xsl:apply-templates select="@*|node()"/>
+        <!-- Get network name -->
+        <xsl:variable name="network_name" select="source/@network"/>
+        <!-- Get vm name -->
+        <xsl:variable name="vm_name" select="/domain/name"/>
+        <!-- Attach nw filter -->
+        <xsl:if test="not(contains($network_name, 'external') or contains($network_name, 'internet') or contains($network_name, 'services'))">
+            <filterref filter="{$vm_name}-{$network_name}"/>
+        </xsl:if>
+    </xsl:copy>
+</xsl:template>
+%{ endif }
@@ -39,6 +39,10 @@ class TerraformAWS(Terraform):
             description (Description): Tectonic description object.
         """
         super().__init__(config, description)
+        if int(self.config.terraform_shard_size):
+            # Security groups, route tables, DNS zones and traffic mirroring
+            # are shared by all the instances of the lab.
+            raise TerraformAWSException("Sharded Terraform states are not supported in AWS.")
 
     def _get_machine_resources_name(self, instances, guests, copies):
         """
@@ -58,21 +62,18 @@ class TerraformAWS(Terraform):
             resources.append('aws_instance.machines["' f"{machine}" '"]')
         return resources
 
-    def _get_route_table_resources_name(self, instances):
+    def _get_route_table_resources_name(self, guests):
         """
-        Returns the name of the aws_route_table resource of the AWS Terraform module for the instances.
+        Returns the name of the aws_route_table_association resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(int)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
-          list(str): resources name of the aws_route_table for the instances.
+          list(str): resources name of the aws_route_table_association for the instances.
         """
         resources = []
-        for instance in filter(
-            lambda i: i <= self.description.instance_number,
-            instances or range(1, self.description.instance_number + 1),
-        ):
+        for instance in guests:
             for network in self.description.topology.keys():
                 resources.append(
                     'aws_route_table_association.scenario_internet_access["'
@@ -81,92 +82,55 @@ class TerraformAWS(Terraform):
                 )
         return resources
 
-    def _get_dns_resources_name(self, instances):
+    def _get_dns_resources_name(self, guests):
         """
-        Returns the name of the aws dns resource of the AWS Terraform module for the instances.
+        Returns the name of the aws dns resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(str)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
           list(str): resources name of the aws dns resources for the instances.
         """
-        resources = ["aws_route53_zone.reverse[0]"]
-        for network in self.description.topology.keys():
-            resources.append(
-                'aws_route53_zone.zones["{name}"]'.format(name=network)
-            )
-        for instance in filter(
-            lambda i: i <= self.description.instance_number,
-            instances or range(1, self.description.instance_number + 1),
-        ):
-            for _, guest in self.description.scenario_guests.items():
+        zones = []
+        records = []
+        for instance_guests in guests.values():
+            for guest in instance_guests:
                 for _, interface in guest.interfaces.items():
-                    if guest.copies == 1:
-                        resources.append(
-                            'aws_route53_record.records["'
-                            f"{guest.name}-{str(instance)}-{interface.network.name}"
-                            '"]'
-                        )
-                        resources.append(
-                            'aws_route53_record.records_reverse["'
-                            f"{guest.name}-{str(instance)}-{interface.network.name}"
-                            '"]'
-                        )
-                    else:
-                        for copy in range(1, guest.copies + 1):
-                            resources.append(
-                                'aws_route53_record.records["'
-                                f"{guest.name}-{str(copy)}-{str(instance)}-{interface.network.name}"
-                                '"]'
-                            )
-                            resources.append(
-                                'aws_route53_record.records_reverse["'
-                                f"{guest.name}-{str(copy)}-{str(instance)}-{interface.network.name}"
-                                '"]'
-                            )
-        return resources
+                    zones.append(f'aws_route53_zone.zones["{interface.network.name}"]')
+                    records.append(f'aws_route53_record.records["{guest.hostname}-{interface.network.name}"]')
+                    records.append(f'aws_route53_record.records_reverse["{guest.hostname}-{interface.network.name}"]')
+        return zones + records
 
-    def _get_security_group_resources_name(self, instances):
+    def _get_security_group_resources_name(self, guests):
         """
-        Returns the name of the aws_security_group resource of the AWS Terraform module for the instances.
+        Returns the name of the aws_security_group resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(str)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
           list(str): resources name of the aws_security_group for the instances.
         """
         resources = []
-        instances = instances or range(1, self.description.instance_number + 1)
-        for _, guest in self.description.scenario_guests.items():
-            if guest.instance in instances:
+        for instance_guests in guests.values():
+            for guest in instance_guests:
                 for _, interface in guest.interfaces.items():
-                    resources.append(
-                        'aws_security_group.interface_traffic["'
-                        f"{interface.name}"
-                        '"]'
-                    )
-            # for network in self.description.topology.keys():
-            #     resources.append(
-            #         'aws_security_group.interface_traffic["'
-            #         f"{self.description.institution}-{self.description.lab_name}-{str(instance)}-{network}"
-            #         '"]'
-            #     )
+                    resources.append(f"aws_security_group.interface_traffic[\"{interface.name}\"]")
         return resources
 
-    def _get_subnet_resources_name(self, instances):
+    def _get_subnet_resources_name(self, guests):
         """
-        Returns the name of the aws_subnet resource of the AWS Terraform module for the instances.
+        Returns the name of the aws_subnet resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(str)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
           list(str): resources name of the aws_subnet for the instances.
         """
         resources = []
-        for instance in filter(lambda i: i <= self.description.instance_number, instances or range(1, self.description.instance_number + 1)):
+        for instance in guests:
             for network in self.description.topology.keys():
                 resources.append(
                     'aws_subnet.instance_subnets["'
@@ -175,65 +139,65 @@ class TerraformAWS(Terraform):
                 )
         return resources
 
-    def _get_interface_resources_name(self, instances):
+    def _get_interface_resources_name(self, guests):
         """
-        Returns the name of the aws_network_interface resource of the AWS Terraform module for the instances.
+        Returns the name of the aws_network_interface resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(str)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
           list(str): resources name of the aws_network_interface for the instances.
         """
         resources = []
-        for _, guest in self.description.scenario_guests.items():
-            if instances and guest.instance not in instances:
-                continue
-            for _, interface in guest.interfaces.items():
-                resources.append(f"aws_network_interface.interfaces[\"{interface.name}\"]")
-
+        for instance_guests in guests.values():
+            for guest in instance_guests:
+                for _, interface in guest.interfaces.items():
+                    resources.append(f"aws_network_interface.interfaces[\"{interface.name}\"]")
         return resources
     
-    def _get_session_resources_name(self, instances):
+    def _get_session_resources_name(self, guests):
         """
-        Returns the name of the aws_ec2_traffic_mirror_session resource of the AWS Terraform module.
+        Returns the name of the aws_ec2_traffic_mirror_session resource of the AWS Terraform module for the guests.
 
         Parameters:
-          instances (list(str)): instances to use.
+          guests (dict): scenario guests of each instance.
 
         Returns:
-          list(str): resources name of the aws_ec2_traffic_mirror_session for the services.
+          list(str): resources name of the aws_ec2_traffic_mirror_session for the instances.
         """
         resources = []
-        for _, guest in self.description.scenario_guests.items():
-            if instances and guest.instance not in instances:
-                continue
-            if guest.monitor:
-                for _, interface in guest.interfaces.items():
-                    resources.append(f"aws_ec2_traffic_mirror_session.session[\"{interface.name}\"]")
+        for instance_guests in guests.values():
+            for guest in instance_guests:
+                if guest.monitor:
+                    for _, interface in guest.interfaces.items():
+                        resources.append(f"aws_ec2_traffic_mirror_session.session[\"{interface.name}\"]")
         return resources
     
-    def _get_resources_to_target_apply(self, instances):
+    def _get_resources_to_target_apply(self, instances, guests=None):
         """
         Returns the name of the aws resource of the AWS Terraform module to target apply base on the instances number.
 
         Parameters:
             instances (list(int)): instances to use.
+            guests (dict): scenario guests of the instances. Default: None (computed from instances).
         
         Return:
             list(str): names of resources.
         """
+        if guests is None:
+            guests = self._get_scenario_guests(instances)
         resources = ["aws_security_group.entry_point_sg"]
-        resources = resources + self._get_interface_resources_name(instances)
-        resources = resources + self._get_subnet_resources_name(instances)
-        resources = resources + self._get_security_group_resources_name(instances)
-        resources = resources + self._get_machine_resources_name(instances, None, None)
+        resources = resources + self._get_interface_resources_name(guests)
+        resources = resources + self._get_subnet_resources_name(guests)
+        resources = resources + self._get_security_group_resources_name(guests)
+        resources = resources + [f'aws_instance.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
         if self.description.internet_access_required:
             resources.append("aws_route_table.scenario_internet_access[0]")
             resources.append("aws_security_group.internet_access_sg[0]")
-            resources = resources + self._get_route_table_resources_name(instances)
+            resources = resources + self._get_route_table_resources_name(guests)
         if self.config.configure_dns:
-            resources = resources + self._get_dns_resources_name(instances)
+            resources = resources + self._get_dns_resources_name(guests)
         if self.description.elastic.enable and self.description.elastic.monitor_type == "traffic":
             resources = resources + [
                 "aws_ec2_traffic_mirror_target.packetbeat[0]",
@@ -241,8 +205,8 @@ class TerraformAWS(Terraform):
                 "aws_ec2_traffic_mirror_filter_rule.filter_all_inbound[0]",
                 "aws_ec2_traffic_mirror_filter_rule.filter_all_outbound[0]",
             ]
-            resources = resources + self._get_session_resources_name(instances)
-        return resources
+            resources = resources + self._get_session_resources_name(guests)
+        return self._unique_resources(resources)
     
     def _get_resources_to_target_destroy(self, instances):
         """
@@ -254,13 +218,14 @@ class TerraformAWS(Terraform):
         Return:
             list(str): names of resources.
         """
-        resources = self._get_machine_resources_name(instances, None, None)
-        # resources = resources + self._get_interface_resources_name(instances) #TODO: fix this. If interfaces are added to be removed then all machines are removed.
+        guests = self._get_scenario_guests(instances)
+        resources = [f'aws_instance.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
+        # resources = resources + self._get_interface_resources_name(guests) #TODO: fix this. If interfaces are added to be removed then all machines are removed.
         if self.config.configure_dns:
-            resources = resources + self._get_dns_resources_name(instances)
+            resources = resources + self._get_dns_resources_name(guests)
         if self.description.elastic.enable and self.description.elastic.monitor_type == "traffic":
-            resources =  resources + self._get_session_resources_name(instances)
-        return resources
+            resources =  resources + self._get_session_resources_name(guests)
+        return self._unique_resources(resources)
 
     def _get_resources_to_recreate(self, instances, guests, copies):
         """
@@ -18,7 +18,9 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
+
 from tectonic.terraform import Terraform
+from tectonic.placement import Placement
 
 class TerraformDockerException(Exception):
     pass
@@ -39,6 +41,10 @@ class TerraformDocker(Terraform):
             description (Description): Tectonic description object.
         """
         super().__init__(config, description)
+        self.placement = None
+        if self.config.docker.hosts:
+            services_host = next((host["name"] for host in self.config.docker.hosts if host["uri"] == self.config.docker.uri), None)
+            self.placement = Placement(self.description, self.config.docker.hosts, services_host)
 
     def _get_machine_resources_name(self, instances, guests, copies):
         """
@@ -63,13 +69,13 @@ class TerraformDocker(Terraform):
         Returns the name of the docker_network resource of the Docker Terraform module for the instances.
 
         Parameters:
-          instances (list(str)): instances to use.
+          instances (iterable(int)): instances to use.
 
         Returns:
           list(str): resources name of the aws_subnet for the instances.
         """
         resources = []
-        for instance in filter(lambda i: i <= self.description.instance_number, instances or range(1, self.description.instance_number+1)):
+        for instance in instances:
             for network in self.description.topology.keys():
                 resources.append(
                     'docker_network.subnets["'
@@ -82,21 +88,24 @@ class TerraformDocker(Terraform):
         # TODO
         return []
 
-    def _get_resources_to_target_apply(self, instances):
+    def _get_resources_to_target_apply(self, instances, guests=None):
         """
         Returns the name of the docker resource of the Docker Terraform module to target apply base on the instances number.
 
         Parameters:
             instances (list(int)): instances to use.
+            guests (dict): scenario guests of the instances. Default: None (computed from instances).
         
         Return:
             list(str): names of resources.
         """
-        resources = self._get_machine_resources_name(instances, None, None)
-        resources = resources + self._get_subnet_resources_name(instances)
+        if guests is None:
+            guests = self._get_scenario_guests(instances)
+        resources = [f'docker_container.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
+        resources = resources + self._get_subnet_resources_name(guests.keys())
         if self.config.configure_dns:
-            resources = resources + self._get_dns_resources_name(instances)
-        return resources
+            resources = resources + self._get_dns_resources_name(guests.keys())
+        return self._unique_resources(resources)
 
     def _get_resources_to_target_destroy(self, instances):
         """
@@ -108,7 +117,8 @@ class TerraformDocker(Terraform):
         Return:
             list(str): names of resources.
         """
-        return self._get_machine_resources_name(instances, None, None)
+        guests = self._get_scenario_guests(instances)
+        return [f'docker_container.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
 
     def _get_resources_to_recreate(self, instances, guests, copies):
         """
@@ -123,3 +133,40 @@ class TerraformDocker(Terraform):
           list(str): resources name to recreate.
         """
         return self._get_machine_resources_name(instances, guests, copies)
+
+    def _get_instance_states(self, shard_size=None):
+        """
+        Get the Terraform states of the instances module. In cluster mode, each host has its own states.
+
+        Parameters:
+            shard_size (int): number of instances of each state, 0 for a single state. Default: terraform_shard_size.
+
+        Return:
+            list(tuple(str, dict, list(int))): name (None for the default state), host and instances of each state.
+        """
+        if self.placement is None:
+            return super()._get_instance_states(shard_size)
+        states = []
+        for host in self.placement.hosts:
+            host_instances = self.placement.instances_of_host(host["name"])
+            if host_instances:
+                states += self._shard_states(host["name"], host, host_instances, shard_size)
+        return states
+
+    def _get_state_variables(self, state_name, host, instances):
+        """
+        Get variables to use in Terraform for a state of the instances module.
+
+        Parameters:
+            state_name (str): suffix of the state name, or None for the default state.
+            host (dict): host of the state in cluster mode, whose docker server is used, or None.
+            instances (list(int)): instances of the state.
+
+        Return:
+            dict: variables.
+        """
+        variables = super()._get_state_variables(state_name, host, instances)
+        if host is None:
+            return variables
+        variables["tectonic"]["config"]["platforms"]["docker"]["uri"] = host["uri"]
+        return variables
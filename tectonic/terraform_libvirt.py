@@ -18,7 +18,9 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
+
 from tectonic.terraform import Terraform
+from tectonic.placement import Placement
 
 class TerraformLibvirtException(Exception):
     pass
@@ -39,6 +41,10 @@ class TerraformLibvirt(Terraform):
             description (Description): Tectonic description object.
         """
         super().__init__(config, description)
+        self.placement = None
+        if self.config.libvirt.hosts:
+            services_host = next((host["name"] for host in self.config.libvirt.hosts if host["uri"] == self.config.libvirt.uri), None)
+            self.placement = Placement(self.description, self.config.libvirt.hosts, services_host)
 
 
     def _get_machine_resources_name(self, instances, guests, copies):
@@ -66,13 +72,13 @@ class TerraformLibvirt(Terraform):
         Returns the name of the docker_network resource of the Docker Terraform module for the instances.
 
         Parameters:
-          instances (list(str)): instances to use.
+          instances (iterable(int)): instances to use.
 
         Returns:
           list(str): resources name of the aws_subnet for the instances.
         """
         resources = []
-        for instance in filter(lambda i: i <= self.description.instance_number, instances or range(1, self.description.instance_number+1)):
+        for instance in instances:
             for network in self.description.topology.keys():
                 resources.append(
                     'libvirt_network.subnets["'
@@ -85,21 +91,29 @@ class TerraformLibvirt(Terraform):
         # TODO
         return []
 
-    def _get_resources_to_target_apply(self, instances):
+    def _get_resources_to_target_apply(self, instances, guests=None):
         """
         Returns the name of the docker resource of the Docker Terraform module to target apply base on the instances number.
 
         Parameters:
             instances (list(int)): instances to use.
+            guests (dict): scenario guests of the instances. Default: None (computed from instances).
         
         Return:
             list(str): names of resources.
         """
-        resources = self._get_machine_resources_name(instances, None, None)
-        resources = resources + self._get_subnet_resources_name(instances)
+        if guests is None:
+            guests = self._get_scenario_guests(instances)
+        resources = []
+        for instance_guests in guests.values():
+            for guest in instance_guests:
+                resources.append('libvirt_domain.machines["' f"{guest.name}" '"]')
+                resources.append('libvirt_volume.cloned_image["' f"{guest.name}" '"]')
+                resources.append('libvirt_cloudinit_disk.commoninit["' f"{guest.name}" '"]')
+        resources = resources + self._get_subnet_resources_name(guests.keys())
         if self.config.configure_dns:
-            resources = resources + self._get_dns_resources_name(instances)
-        return resources
+            resources = resources + self._get_dns_resources_name(guests.keys())
+        return self._unique_resources(resources)
 
     def _get_resources_to_target_destroy(self, instances):
         """
@@ -111,13 +125,11 @@ class TerraformLibvirt(Terraform):
         Return:
             list(str): names of resources.
         """
-        machines = self.description.parse_machines(instances, None, None, True)
-        resources = []
-        for machine in machines:
-            resources.append('libvirt_domain.machines["' f"{machine}" '"]')
+        guests = self._get_scenario_guests(instances)
+        resources = [f'libvirt_domain.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
         if self.config.configure_dns:
-            resources = resources + self._get_dns_resources_name(instances)
-        return resources
+            resources = resources + self._get_dns_resources_name(guests.keys())
+        return self._unique_resources(resources)
 
     def _get_resources_to_recreate(self, instances, guests, copies):
         """
@@ -136,4 +148,77 @@ class TerraformLibvirt(Terraform):
         for machine in machines:
             resources.append('libvirt_domain.machines["' f"{machine}" '"]')
             resources.append('libvirt_volume.cloned_image["' f"{machine}" '"]')
-        return resources
\ No newline at end of file
+        return resources
+
+    def _get_instance_states(self, shard_size=None):
+        """
+        Get the Terraform states of the instances module. In cluster mode, each host has its own states.
+
+        Parameters:
+            shard_size (int): number of instances of each state, 0 for a single state. Default: terraform_shard_size.
+
+        Return:
+            list(tuple(str, dict, list(int))): name (None for the default state), host and instances of each state.
+        """
+        if self.placement is None:
+            return super()._get_instance_states(shard_size)
+        states = []
+        for host in self.placement.hosts:
+            host_instances = self.placement.instances_of_host(host["name"])
+            if host_instances:
+                states += self._shard_states(host["name"], host, host_instances, shard_size)
+        return states
+
+    def _get_state_variables(self, state_name, host, instances):
+        """
+        Get variables to use in Terraform for a state of the instances module.
+
+        Parameters:
+            state_name (str): suffix of the state name, or None for the default state.
+            host (dict): host of the state in cluster mode, whose libvirt server is used, or None.
+            instances (list(int)): instances of the state.
+
+        Return:
+            dict: variables.
+        """
+        variables = super()._get_state_variables(state_name, host, instances)
+        sharded = bool(int(self.config.terraform_shard_size))
+        if host is None and not sharded:
+            return variables
+        libvirt = variables["tectonic"]["config"]["platforms"]["libvirt"]
+        if host is not None:
+            libvirt["uri"] = host["uri"]
+            libvirt["storage_pool"] = host.get("storage_pool", self.config.libvirt.storage_pool)
+            # The internet network is created by the services module only in the services host
+            libvirt["local_internet_network"] = host["name"] != self.placement.services_host
+        if sharded:
+            # Networks shared by all the instances are kept in their own state
+            libvirt["shared_networks"] = False
+        return variables
+
+    def _get_shared_states(self):
+        """
+        Get the Terraform states with the networks shared by all the
+        instances in sharded mode (one for each host in cluster mode).
+
+        Return:
+            list(tuple(str, dict)): name and variables of each state.
+        """
+        if not int(self.config.terraform_shard_size):
+            return []
+        if self.placement is None:
+            hosts = [(None, "shared", list(range(1, self.description.instance_number + 1)))]
+        else:
+            hosts = [(host, f"{host['name']}-shared", self.placement.instances_of_host(host["name"])) for host in self.placement.hosts]
+        states = []
+        for host, state_name, instances in hosts:
+            if not instances:
+                continue
+            variables = self._get_state_variables(state_name, host, [])
+            libvirt = variables["tectonic"]["config"]["platforms"]["libvirt"]
+            libvirt["shared_networks"] = True
+            libvirt["internet_access"] = any(
+                guest.internet_access for guest in self.description.scenario_guests.values() if guest.instance in instances
+            )
+            states.append((state_name, variables))
+        return states
@@ -18,7 +18,6 @@
 # You should have received a copy of the GNU General Public License
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
 from abc import abstractmethod
 from tectonic.terraform import Terraform
 from tectonic.constants import OS_DATA
@@ -267,6 +266,21 @@ class TerraformService(Terraform):
         if resources_to_destroy is None or len(resources_to_destroy) > 0: 
             self._destroy(self.terraform_services_module, self._get_terraform_variables(), resources_to_destroy)
 
+    def check(self, instances):
+        """
+        Look for resources of the services that changed outside of Terraform.
+
+        Parameters:
+            instances (list(int)): number of the instances to check, if None check all.
+
+        Return:
+            list(str): addresses of the drifted resources.
+        """
+        resources_to_check = None
+        if instances is not None:
+            resources_to_check = self._get_resources_to_target_apply(instances)
+        return self._check(self.terraform_services_module, self._get_terraform_variables(), resources_to_check)
+
     def recreate(self, instances, guests, copies): 
         """
         Recreate scenario services.
@@ -287,8 +301,8 @@ class TerraformService(Terraform):
             dict: variables.
         """
         return {
-            "tectonic_json": json.dumps(self.description.to_dict()),
-            "subnets_json": json.dumps({network.name: network.to_dict() for network in self.description.auxiliary_networks.values()}),
-            "guest_data_json": json.dumps({service.name: service.to_dict() for service in self.description.services_guests.values()}),
-            "os_data_json": json.dumps(OS_DATA),
+            "tectonic": self.description.to_dict(),
+            "subnets": {network.name: network.to_dict() for network in self.description.auxiliary_networks.values()},
+            "guest_data": {service.name: service.to_dict() for service in self.description.services_guests.values()},
+            "os_data": OS_DATA,
         }
@@ -0,0 +1,137 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from tectonic.terraform_service import TerraformService
+from tectonic.platform_simulated import SimulatedPlatform
+
+class TerraformServiceSimulatedException(Exception):
+    pass
+
+class TerraformServiceSimulated(TerraformService):
+    """
+    TerraformServiceSimulated class.
+
+    Description: manages services instances for the simulated platform.
+    """
+
+    def __init__(self, config, description, client):
+        super().__init__(config, description, client)
+        self.platform = SimulatedPlatform.get(config, description)
+
+    def _apply(self, terraform_dir, variables, resources=None, recreate=False, state_name=None):
+        """
+        Create the service machines and networks in the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources for target apply. Default: None.
+            recreate (bool): whether to recreate the resources. Default: False.
+            state_name (str): suffix of the state name. Default: None.
+        """
+        services = variables["guest_data"]
+        parallelism = self._get_parallelism(variables)
+        try:
+            with self._profile("apply", terraform_dir, state_name, parallelism, variables):
+                self.platform.apply(
+                    {name: {"image": service["base_name"], "ip": service["ip"], "services_ip": service["ip"]}
+                     for name, service in services.items() if service["enable"]},
+                    variables["subnets"],
+                    self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys()),
+                    recreate,
+                    parallelism,
+                )
+        except Exception as e:
+            raise TerraformServiceSimulatedException(f"ERROR: terraform apply returned an error: {e}") from e
+        self._machine_outputs[self._get_state_name(terraform_dir, state_name)] = self.platform.get_outputs(variables["guest_data"].keys())
+
+    def _check(self, terraform_dir, variables, resources=None, state_name=None):
+        """
+        Look for machines that were deleted from the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources to check. Default: None (checks everything).
+            state_name (str): suffix of the state name. Default: None.
+
+        Return:
+            list(str): addresses of the drifted resources.
+        """
+        names = self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys())
+        outputs = self._machine_outputs.get(self._get_state_name(terraform_dir, state_name), {})
+        return [f'simulated_machine.machines["{name}"]' for name in outputs
+                if (names is None or name in names) and self.platform.get_machine(name) is None]
+
+    def _destroy(self, terraform_dir, variables, resources=None, state_name=None):
+        """
+        Delete the service machines and networks from the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources for target destroy. Default: None (deletes everything).
+            state_name (str): suffix of the state name. Default: None.
+        """
+        if resources is not None and len(resources) == 0:
+            return
+        parallelism = self._get_parallelism(variables)
+        try:
+            with self._profile("destroy", terraform_dir, state_name, parallelism, variables):
+                self.platform.destroy(
+                    variables["guest_data"].keys(),
+                    variables["subnets"].keys(),
+                    self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys()),
+                    parallelism,
+                )
+        except Exception as e:
+            raise TerraformServiceSimulatedException(f"ERROR: terraform destroy returned an error: {e}") from e
+        self._machine_outputs[self._get_state_name(terraform_dir, state_name)] = self.platform.get_outputs(variables["guest_data"].keys())
+
+    def _get_resources_to_target_apply(self, instances):
+        """
+        Get resources name for target apply.
+
+        Parameters:
+            instances (list(int)): number of the instances to target apply.
+
+        Return:
+            list(str): names of resources.
+        """
+        resources = []
+        for _, service in self.description.services_guests.items():
+            if service.enable:
+                resources.append('simulated_machine.machines["'f"{service.name}"'"]')
+        for network in self.description.auxiliary_networks:
+            resources.append('simulated_network.subnets["'f"{network}"'"]')
+        return resources
+
+    def _get_resources_to_target_destroy(self, instances):
+        """
+        Get resources name for target destroy.
+
+        Parameters:
+            instances (list(int)): number of the instances to target destroy.
+
+        Return:
+            list(str): names of resources.
+        """
+        return []
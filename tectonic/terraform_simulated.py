@@ -0,0 +1,215 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+from ipaddress import ip_address, ip_network
+
+from tectonic.terraform import Terraform
+from tectonic.platform_simulated import SimulatedPlatform
+
+class TerraformSimulatedException(Exception):
+    pass
+
+class TerraformSimulated(Terraform):
+    """
+    TerraformSimulated class.
+
+    Description: simulates the deployment of scenarios in memory. Resources are addressed
+    as in the other Terraform modules, but apply and destroy change the simulated platform.
+    """
+
+    def __init__(self, config, description):
+        """
+        Initialize the Terraform object.
+
+        Parameters:
+            config (Config): Tectonic config object.
+            description (Description): Tectonic description object.
+        """
+        super().__init__(config, description)
+        self.platform = SimulatedPlatform.get(config, description)
+
+    def _apply(self, terraform_dir, variables, resources=None, recreate=False, state_name=None):
+        """
+        Create the machines and networks in the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources for target apply. Default: None.
+            recreate (bool): whether to recreate the resources. Default: False.
+            state_name (str): suffix of the state name. Default: None.
+        """
+        guests = variables["guest_data"]
+        parallelism = self._get_parallelism(variables)
+        try:
+            with self._profile("apply", terraform_dir, state_name, parallelism, variables):
+                self.platform.apply(
+                    {name: self._get_simulated_machine(guest) for name, guest in guests.items()},
+                    variables["subnets"],
+                    self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys()),
+                    recreate,
+                    parallelism,
+                )
+        except Exception as e:
+            raise TerraformSimulatedException(f"ERROR: terraform apply returned an error: {e}") from e
+        self._machine_outputs[self._get_state_name(terraform_dir, state_name)] = self.platform.get_outputs(variables["guest_data"].keys())
+
+    def _check(self, terraform_dir, variables, resources=None, state_name=None):
+        """
+        Look for machines that were deleted from the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources to check. Default: None (checks everything).
+            state_name (str): suffix of the state name. Default: None.
+
+        Return:
+            list(str): addresses of the drifted resources.
+        """
+        names = self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys())
+        outputs = self._machine_outputs.get(self._get_state_name(terraform_dir, state_name), {})
+        return [f'simulated_machine.machines["{name}"]' for name in outputs
+                if (names is None or name in names) and self.platform.get_machine(name) is None]
+
+    def _destroy(self, terraform_dir, variables, resources=None, state_name=None):
+        """
+        Delete the machines and networks from the simulated platform.
+
+        Parameters:
+            terraform_dir (str): path to the terraform module.
+            variables (dict): variables of the terraform module.
+            resources (list(str)): name of terraform resources for target destroy. Default: None (deletes everything).
+            state_name (str): suffix of the state name. Default: None.
+        """
+        if resources is not None and len(resources) == 0:
+            return
+        parallelism = self._get_parallelism(variables)
+        try:
+            with self._profile("destroy", terraform_dir, state_name, parallelism, variables):
+                self.platform.destroy(
+                    variables["guest_data"].keys(),
+                    variables["subnets"].keys(),
+                    self.platform.resource_names(resources, variables["guest_data"].keys(), variables["subnets"].keys()),
+                    parallelism,
+                )
+        except Exception as e:
+            raise TerraformSimulatedException(f"ERROR: terraform destroy returned an error: {e}") from e
+        self._machine_outputs[self._get_state_name(terraform_dir, state_name)] = self.platform.get_outputs(variables["guest_data"].keys())
+
+    def _get_simulated_machine(self, guest):
+        """
+        Return the simulated machine of a guest.
+
+        Parameters:
+            guest (dict): guest data as passed to Terraform.
+
+        Return:
+            dict: image, ip and services_ip of the machine.
+        """
+        ip = None
+        services_ip = None
+        for interface in guest["interfaces"].values():
+            if interface["subnetwork_base_name"] == "services":
+                services_ip = interface["private_ip"]
+            elif ip is None and ip_address(interface["private_ip"]) in ip_network(self.config.network_cidr_block):
+                ip = interface["private_ip"]
+        return {
+            "image": self.description.base_guests[guest["base_name"]].image_name,
+            "ip": ip,
+            "services_ip": services_ip,
+        }
+
+    def _get_machine_resources_name(self, instances, guests, copies):
+        """
+        Returns the name of the simulated_machine resource of the instances.
+
+        Parameters:
+          instances (list(int)): instances number to use.
+          guests (list(str)): guests names to use.
+          copies (list(int)): copies numbers to use.
+
+        Returns:
+          list(str): resources name of the machines.
+        """
+        machines = self.description.parse_machines(instances, guests, copies, True)
+        return ['simulated_machine.machines["' f"{machine}" '"]' for machine in machines]
+
+    def _get_subnet_resources_name(self, instances):
+        """
+        Returns the name of the simulated_network resource of the instances.
+
+        Parameters:
+          instances (iterable(int)): instances to use.
+
+        Returns:
+          list(str): resources name of the networks.
+        """
+        resources = []
+        for instance in instances:
+            for network in self.description.topology.keys():
+                resources.append(
+                    'simulated_network.subnets["'
+                    f"{self.description.institution}-{self.description.lab_name}-{str(instance)}-{network}"
+                    '"]'
+                )
+        return resources
+
+    def _get_resources_to_target_apply(self, instances, guests=None):
+        """
+        Returns the resources to target apply based on the instances number.
+
+        Parameters:
+            instances (list(int)): instances to use.
+            guests (dict): scenario guests of the instances. Default: None (computed from instances).
+
+        Return:
+            list(str): names of resources.
+        """
+        if guests is None:
+            guests = self._get_scenario_guests(instances)
+        resources = [f'simulated_machine.machines["{guest.name}"]' for instance_guests in guests.values() for guest in instance_guests]
+        return self._unique_resources(resources + self._get_subnet_resources_name(guests.keys()))
+
+    def _get_resources_to_target_destroy(self, instances):
+        """
+        Returns the resources to target destroy based on the instances number.
+
+        Parameters:
+            instances (list(int)): instances to use.
+
+        Return:
+            list(str): names of resources.
+        """
+        return self._get_resources_to_target_apply(instances)
+
+    def _get_resources_to_recreate(self, instances, guests, copies):
+        """
+        Returns the resources to recreate based on the machines names.
+
+        Parameters:
+          instances (list(int)): instances number to use.
+          guests (list(str)): guests names to use.
+          copies (list(int)): copies numbers to use.
+
+        Returns:
+          list(str): resources name to recreate.
+        """
+        return self._get_machine_resources_name(instances, guests, copies)
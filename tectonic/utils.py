@@ -75,3 +75,27 @@ def read_files_in_dir(directory):
                     content += "\n"
                 contents += content
     return contents
+
+def parse_hosts(value):
+    """
+    Parse a list of hosts of the form "uri key=value ..., uri key=value ...".
+
+    Parameters:
+        value (str): comma separated host list.
+
+    Returns:
+        list(dict): the uri and options of each host.
+    """
+    hosts = []
+    for entry in (value or "").split(","):
+        fields = entry.split()
+        if not fields:
+            continue
+        host = {"uri": fields[0]}
+        for field in fields[1:]:
+            key, separator, option = field.partition("=")
+            if not separator:
+                raise ValueError(f"Invalid host option {field}. Must be of the form key=value.")
+            host[key] = option
+        hosts.append(host)
+    return hosts
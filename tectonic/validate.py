@@ -188,3 +188,21 @@ def times_compare(name, min_time, max_time):
     except ValueError:
         raise ValueError(f"Invalid {name}. Time {max_time} must be grater than {min_time}.")
     
+
+def hosts(name, value, supported_options):
+    """Validates that the value named name is a list of hosts with
+    a uri, a memory and vcpu capacity, and only supported options."""
+    names = set()
+    for index, host in enumerate(value):
+        if not host.get("uri"):
+            raise ValueError(f"Invalid {name}. Host {index+1} must have a uri.")
+        unsupported = set(host.keys()) - set(["uri", "name", "memory", "vcpu"] + supported_options)
+        if unsupported:
+            raise ValueError(f"Invalid {name}. Unsupported options {sorted(unsupported)} for host {host['uri']}.")
+        number(f"{name} memory", host.get("memory", ""), min_value=1)
+        number(f"{name} vcpu", host.get("vcpu", ""), min_value=1)
+        host_name = host.get("name", f"host{index+1}")
+        regex(f"{name} name", host_name, r"^[a-zA-Z0-9_]+$")
+        if host_name in names:
+            raise ValueError(f"Invalid {name}. Duplicated host name {host_name}.")
+        names.add(host_name)
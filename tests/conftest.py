@@ -19,6 +19,7 @@
 # along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import threading
 import boto3
 import pytest
 import docker
@@ -42,7 +43,7 @@ from tectonic.core import Core
 
 from pathlib import Path
 from moto import mock_aws
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, DEFAULT
 import libvirt_qemu
 
 
@@ -265,8 +266,9 @@ def tectonic_config_path(request, tmp_path_factory, test_data_path):
     return config_file.resolve().as_posix()
 
 @pytest.fixture()
-def tectonic_config(tectonic_config_path):
+def tectonic_config(tectonic_config_path, tmp_path):
     config = TectonicConfig.load(tectonic_config_path)
+    config.terraform_data_dir = (tmp_path / "terraform-data").as_posix()
 
     yield config
     
@@ -302,6 +304,7 @@ def mock_docker_client(monkeypatch):
     mock_container_1.image = MagicMock()
     mock_container_1.image.tags = ['udelar-lab01-attacker:latest']
     mock_container_1.attrs = {
+        "ImageID": "udelar-lab01-attacker",
         "NetworkSettings": {
             "Networks": {
                 "udelar-lab01-lan": {"IPAddress": "10.0.1.4"},
@@ -443,6 +446,13 @@ def mock_docker_client(monkeypatch):
         mock_container_11,
     ]
 
+    def list_containers(all=False, sparse=False, filters=None):
+        if filters and "ancestor" in filters:
+            return [container for container in mock_client.containers.list.return_value
+                    if isinstance(container.attrs, dict) and container.attrs.get("ImageID") == filters["ancestor"]]
+        return DEFAULT
+    mock_client.containers.list.side_effect = list_containers
+
     mock_client.images.get.side_effect = lambda image_id: {
         "udelar-lab01-attacker": MagicMock(id="udelar-lab01-attacker", tags=["udelar-lab01-attacker"]),
         "udelar-lab01-victim": MagicMock(id="udelar-lab01-victim", tags=["udelar-lab01-victim"]),
@@ -460,6 +470,7 @@ def mock_docker_client(monkeypatch):
         self.connection = mock_client
         self.config = config
         self.description = description
+        self._inventory_lock = threading.Lock()
     monkeypatch.setattr(ClientDocker, "__init__", patched_init)
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,53 @@
+import json
+import pytest
+from click.testing import CliRunner
+
+from tectonic.config import TectonicConfig
+from tectonic.description import Description
+from tectonic.benchmark import benchmark, generate_lab, compare_baseline, STAGES
+
+
+def test_generate_lab(tectonic_config, tmp_path):
+    tectonic_config.lab_repo_uri = tmp_path.as_posix()
+    lab_edition_file = generate_lab(tmp_path, "synthetic", instances=3, guests=4, copies=2, networks=2, traffic_rules=3, services=["caldera"])
+    description = Description(tectonic_config, lab_edition_file)
+
+    assert description.instance_number == 3
+    assert list(description.base_guests.keys()) == ["guest1", "guest2", "guest3", "guest4"]
+    # The entry point has one copy
+    assert len(description.scenario_guests) == 3 * (1 + 3 * 2)
+    assert len(description.scenario_networks) == 3 * 2
+    assert description.caldera.enable
+    assert not description.elastic.enable
+    interfaces = description.scenario_guests["benchmark-synthetic-1-guest1"].interfaces
+    assert len(interfaces) == 2
+    if tectonic_config.platform in ["aws", "libvirt"]:
+        assert sum(len(interface.traffic_rules) for interface in interfaces.values()) > 0
+
+
+def test_compare_baseline():
+    baseline = {"small": {"load": 0.1, "parse_machines": 0.001}}
+    results = {"small": {"load": 0.2, "parse_machines": 0.003, "build_inventory": 1}}
+    assert compare_baseline(results, baseline, 25) == [["small", "load", 0.1, 0.2]]
+    assert compare_baseline(results, baseline, 100) == []
+    assert compare_baseline({"small": {"load": 0.11}}, baseline, 25) == []
+
+
+def test_benchmark_description(tectonic_config_path, tmp_path):
+    if "docker" not in tectonic_config_path:
+        pytest.skip("The simulated platform does not depend on the configured platform")
+    baseline = tmp_path / "baseline.json"
+    runner = CliRunner()
+    result = runner.invoke(benchmark, ["-c", tectonic_config_path, "description", "-s", "small", "-n", "1", "-b", baseline.as_posix(), "--save_baseline"])
+    assert result.exit_code == 0, result.output
+    stored = json.loads(baseline.read_text())
+    assert list(stored["small"].keys()) == STAGES
+
+    result = runner.invoke(benchmark, ["-c", tectonic_config_path, "description", "-s", "small", "-n", "1", "-b", baseline.as_posix(), "-t", "1000"])
+    assert result.exit_code == 0, result.output
+
+    # Every stage is slower than an empty baseline
+    baseline.write_text(json.dumps({"small": {stage: 0 for stage in STAGES}}))
+    result = runner.invoke(benchmark, ["-c", tectonic_config_path, "description", "-s", "small", "-n", "1", "-b", baseline.as_posix()])
+    assert result.exit_code != 0
+    assert "slower than the baseline" in result.output
@@ -137,6 +137,9 @@ commands = [
     { "command": "recreate",
       "core_function": "recreate",
      },
+    { "command": "migrate-states",
+      "core_function": "migrate_terraform_states",
+     },
 ]
 
 @pytest.mark.parametrize('command', commands)
@@ -164,6 +167,16 @@ def test_deploy_images(mock_core, runner, base_cli_args,  mock_ctx):
     result = run_cli(runner, base_cli_args, ["deploy", "-f", "--guest_images"], obj=mock_ctx)
     assert result.exit_code == 0
     mock_ctx["core"].deploy.assert_called_once()
+
+
+@patch("tectonic.cli.Core")
+def test_deploy_routes(mock_core, runner, base_cli_args, mock_ctx, caplog):
+    mock_core.return_value.deploy.return_value = [{"host": "host1", "destination": "10.0.5.0/24", "gateway": "hv2"}]
+    caplog.set_level(logging.INFO)
+    result = run_cli(runner, base_cli_args, ["deploy", "-f"], obj=mock_ctx)
+    assert result.exit_code == 0
+    assert "routes must be added" in caplog.text
+    assert "10.0.5.0/24" in caplog.text
     
     
 # TODO: Test destroy command option combinations
@@ -182,6 +195,12 @@ def test_create_images(mock_core, runner, base_cli_args, mock_ctx):
     result = run_cli(runner, base_cli_args, ["create-images", "-f"], obj=mock_ctx)
     assert result.exit_code == 0
     mock_ctx["core"].create_instances_images.assert_called_once()
+    assert mock_ctx["core"].create_instances_images.call_args.args[1] is False
+
+    mock_ctx["core"].create_instances_images.reset_mock()
+    result = run_cli(runner, base_cli_args, ["create-images", "-f", "--rebuild"], obj=mock_ctx)
+    assert result.exit_code == 0
+    assert mock_ctx["core"].create_instances_images.call_args.args[1] is True
 
 @patch("tectonic.cli.Core")
 def test_list_instance(mock_core, runner, base_cli_args, mock_ctx):
@@ -190,6 +209,21 @@ def test_list_instance(mock_core, runner, base_cli_args, mock_ctx):
         assert result.exit_code == 0
         assert "TABLE" in result.output
 
+@patch("tectonic.cli.Core")
+def test_check(mock_core, runner, base_cli_args, mock_ctx):
+    mock_core.return_value.check.return_value = {"instances": {2: ['docker_container.machines["udelar-lab01-2-attacker"]'], None: ["docker_network.internet"]}, "services": []}
+    with patch("tectonic.cli.utils.create_table", return_value="TABLE") as mock_table:
+        result = run_cli(runner, base_cli_args, ["check", "-i", "2"], obj=mock_ctx)
+        assert result.exit_code == 0
+        assert "TABLE" in result.output
+        assert mock_table.call_args.args[1] == [[2, 'docker_container.machines["udelar-lab01-2-attacker"]'], ["shared", "docker_network.internet"]]
+    mock_ctx["core"].check.assert_called_once_with([2])
+
+    mock_core.return_value.check.return_value = {"instances": {}, "services": []}
+    result = run_cli(runner, base_cli_args, ["check"], obj=mock_ctx)
+    assert result.exit_code == 0
+    assert "No drift found." in result.output
+
 @patch("tectonic.cli.Core")
 def test_console(mock_core, base_cli_args, runner, mock_ctx):
     result = run_cli(runner, base_cli_args, ["console"], obj=mock_ctx)
@@ -1,11 +1,14 @@
 import pytest
 import re
+import time
 from unittest.mock import patch, MagicMock
 import libvirt
 import libvirt_qemu
 from tectonic.client import ClientException
 from tectonic.client_aws import ClientAWS, ClientAWSException
 from tectonic.client_libvirt import ClientLibvirt, ClientLibvirtException
+from tectonic.client_docker import ClientDocker
+import docker
 import xml.etree.ElementTree as ET
 import uuid
 from tectonic.description import TrafficRule, BaseTrafficRule
@@ -24,6 +27,21 @@ def test_get_machine_private_ip(client):
     assert client.get_machine_private_ip("x") == None
 
 
+def test_get_machines_private_ip(client):
+    ips = client.get_machines_private_ip(["udelar-lab01-1-attacker", "x"])
+    assert ips["udelar-lab01-1-attacker"] == client.get_machine_private_ip("udelar-lab01-1-attacker")
+    assert ips["x"] is None
+
+
+def test_seed_machine_info(client):
+    ip = client.get_machine_private_ip("udelar-lab01-1-attacker")
+    client.seed_machine_info({"udelar-lab01-1-attacker": {"private_ip": "10.0.99.99", "services_ip": None}})
+    assert client.get_machine_private_ip("udelar-lab01-1-attacker") == "10.0.99.99"
+    assert client.get_machine_ip_in_services_network("udelar-lab01-1-attacker") is None
+    client.invalidate_cache()
+    assert client.get_machine_private_ip("udelar-lab01-1-attacker") == ip
+
+
 def test_get_machine_public_ip(client):
     if client.config.platform == "aws":
         elastic_ip = client.get_machine_public_ip("udelar-lab01-elastic")
@@ -112,7 +130,7 @@ def test_get_ssh_hostname(client):
 # Tests for ClientAWS internals
 # -------------------------------
 
-@patch("tectonic.client_aws.boto3.client", side_effect=Exception("boom"))
+@patch("tectonic.client_aws.ClientFactoryAWS.get", side_effect=Exception("boom"))
 def test_aws_init_fail(mock_client, description):
     if description.config.platform == "aws":
         with pytest.raises(ClientAWSException, match="boom"):
@@ -122,6 +140,124 @@ def test_aws_init_success(description):
     if description.config.platform == "aws":
         ClientAWS(description.config, description)
 
+def test_aws_image_usage_index(client):
+    if client.config.platform == "aws":
+        with patch.object(client.connection, "describe_instances", wraps=client.connection.describe_instances) as mock_instances:
+            with patch.object(client.connection, "describe_images", wraps=client.connection.describe_images) as mock_images:
+                with client.image_usage_index(["udelar-lab01-attacker", "test2", "x"]):
+                    assert client.is_image_in_use("udelar-lab01-attacker") is True
+                    assert client.is_image_in_use("test2") is False
+                    assert client.is_image_in_use("x") is False
+                    assert client._get_image("test2") is not None
+                    assert client._get_image("x") is None
+                mock_images.assert_called_once()
+                mock_instances.assert_called_once()
+                filters = mock_instances.call_args.kwargs["Filters"]
+                assert filters[0]["Name"] == "image-id"
+                assert len(filters[0]["Values"]) == 2
+        assert client._images is None
+        assert client._image_usage is None
+
+        # The names are sent in chunks of MAX_FILTER_VALUES
+        client.MAX_FILTER_VALUES = 2
+        with patch.object(client.connection, "describe_images", wraps=client.connection.describe_images) as mock_images:
+            images = client._describe_images(["udelar-lab01-attacker", "test2", "x"])
+            assert [len(c.kwargs["Filters"][0]["Values"]) for c in mock_images.call_args_list] == [2, 1]
+        assert images["udelar-lab01-attacker"] is not None
+        assert images["test2"] is not None
+        assert images["x"] is None
+        del client.MAX_FILTER_VALUES
+
+        # An empty batch does not call AWS
+        with patch.object(client.connection, "describe_instances") as mock_instances:
+            with patch.object(client.connection, "describe_images") as mock_images:
+                with client.image_usage_index([]):
+                    assert client._images == {}
+                    assert client._image_usage == {}
+                mock_images.assert_not_called()
+                mock_instances.assert_not_called()
+
+def test_wait_for_machines(client):
+    result = client.wait_for_machines(["udelar-lab01-1-attacker", "x"])
+    if client.config.platform == "aws":
+        assert result == {"udelar-lab01-1-attacker": True, "x": False}
+    else:
+        assert result == {"udelar-lab01-1-attacker": True, "x": True}
+
+def test_aws_wait_for_machines(client):
+    if client.config.platform == "aws":
+        machine_names = ["udelar-lab01-1-attacker", "udelar-lab01-elastic", "udelar-lab01-caldera"]
+        names = {client._get_machine_id(name): name for name in machine_names}
+        clock = [0]
+        polls = []
+        def describe_instance_status(InstanceIds, DryRun):
+            polls.append([names[i] for i in InstanceIds])
+            # The attacker is ready at once. The instance checks of elastic and caldera
+            # pass at once, but the system checks of elastic after a while and of caldera never
+            system_ready = ["udelar-lab01-1-attacker"] + (["udelar-lab01-elastic"] if clock[0] > 0 else [])
+            return {"InstanceStatuses": [
+                {
+                    "InstanceId": i,
+                    "InstanceStatus": {"Status": "ok"},
+                    "SystemStatus": {"Status": "ok" if names[i] in system_ready else "initializing"},
+                } for i in InstanceIds
+            ]}
+        client.MAX_STATUS_INSTANCE_IDS = 2
+        client.invalidate_cache()
+        client.seed_machine_info({"udelar-lab01-caldera": {"id": client._get_machine_id("udelar-lab01-caldera")}})
+        with patch.object(client.connection, "describe_instance_status", side_effect=describe_instance_status), \
+             patch.object(client.connection, "describe_instances", wraps=client.connection.describe_instances) as mock_instances, \
+             patch("tectonic.client_aws.time.monotonic", side_effect=lambda: clock[0]), \
+             patch("tectonic.client_aws.time.sleep", side_effect=lambda seconds: clock.__setitem__(0, clock[0] + seconds)) as mock_sleep:
+            result = client.wait_for_machines(machine_names, sleep=4, timeout=10)
+        assert result == {"udelar-lab01-1-attacker": True, "udelar-lab01-elastic": True, "udelar-lab01-caldera": False}
+        # The ids not seeded are resolved in one call, and kept for later
+        mock_instances.assert_called_once()
+        assert mock_instances.call_args.kwargs["Filters"][0]["Values"] == ["udelar-lab01-1-attacker", "udelar-lab01-elastic"]
+        assert client._get_machine_info("udelar-lab01-elastic")["id"] == client._get_machine_id("udelar-lab01-elastic")
+        client.invalidate_cache()
+        # Only the machines that are not ready are polled, in chunks
+        assert polls == [
+            ["udelar-lab01-1-attacker", "udelar-lab01-elastic"], ["udelar-lab01-caldera"],
+            ["udelar-lab01-elastic", "udelar-lab01-caldera"],
+            ["udelar-lab01-caldera"],
+            ["udelar-lab01-caldera"],
+        ]
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [2, 4, 4]
+
+        with patch.object(client.connection, "describe_instance_status", side_effect=Exception("boom")):
+            with pytest.raises(ClientAWSException):
+                client.wait_for_machines(machine_names)
+
+def test_aws_get_image_fingerprint(client):
+    if client.config.platform == "aws":
+        # Images built by Packer without a fingerprint are always outdated
+        assert client.get_image_fingerprint("udelar-lab01-attacker") is None
+        assert client.get_image_fingerprint("x") is None
+        image = {"Tags": [{"Key": "Name", "Value": "udelar-lab01-attacker"}, {"Key": "TectonicFingerprint", "Value": "abc"}]}
+        with patch.object(client, "_get_image", return_value=image):
+            assert client.get_image_fingerprint("udelar-lab01-attacker") == "abc"
+        with patch.object(client, "_get_image", side_effect=Exception("boom")):
+            with pytest.raises(ClientAWSException):
+                client.get_image_fingerprint("udelar-lab01-attacker")
+
+        # Several fingerprints are looked up with one call, without checking the image usage
+        with patch.object(client.connection, "describe_images", wraps=client.connection.describe_images) as mock_images:
+            with patch.object(client.connection, "describe_instances") as mock_instances:
+                assert client.get_image_fingerprints(["udelar-lab01-attacker", "x"]) == {"udelar-lab01-attacker": None, "x": None}
+                mock_images.assert_called_once()
+                mock_instances.assert_not_called()
+
+def test_aws_delete_image_in_index(client):
+    if client.config.platform == "aws":
+        with patch.object(client.connection, "deregister_image") as mock_image:
+            with patch.object(client.connection, "delete_snapshot") as mock_snapshot:
+                with client.image_usage_index(["test2"]):
+                    client.delete_image("test2")
+                    assert client._get_image("test2") is None
+                mock_image.assert_called_once()
+                mock_snapshot.assert_called_once()
+
 
 # -------------------------------
 # Tests for ClientLibvirt internals
@@ -147,6 +283,140 @@ def test_libvirt_wait_for_agent(monkeypatch, client):
         with pytest.raises(ClientLibvirtException, match="Cannot connect to QEMU agent."):
             client._wait_for_agent(MagicMock(libvirt.virDomain), sleep=1, max_tries=2)
 
+def test_libvirt_wait_for_agent_budget(monkeypatch, client):
+    if client.config.platform == "libvirt":
+        clock = [0]
+        delays = []
+        def fake_sleep(delay):
+            delays.append(delay)
+            clock[0] += delay
+        def raise_error(domain, command, timeout, flags):
+            raise libvirt.libvirtError("boom")
+        monkeypatch.setattr(libvirt_qemu, "qemuAgentCommand", raise_error)
+        monkeypatch.setattr(client, "_agent_events", False)
+        monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+        monkeypatch.setattr(time, "sleep", fake_sleep)
+        with pytest.raises(ClientLibvirtException, match="Cannot connect to QEMU agent."):
+            client._wait_for_agent(MagicMock(libvirt.virDomain), sleep=5, max_tries=10)
+        # Retries back off, but the agent gets the same total time as with fixed retries
+        assert delays[:4] == [0.5, 1, 2, 4]
+        assert max(delays) == 5
+        assert sum(delays) == 45
+
+def test_libvirt_wait_for_agent_cached(monkeypatch, client):
+    if client.config.platform == "libvirt":
+        calls = []
+        def ping(domain, command, timeout, flags):
+            calls.append(domain.name())
+        monkeypatch.setattr(libvirt_qemu, "qemuAgentCommand", ping)
+        domain = client.connection.lookupByName("udelar-lab01-1-attacker")
+        client._wait_for_agent(domain)
+        client._wait_for_agent(domain)
+        assert calls == ["udelar-lab01-1-attacker"]
+
+        client.restart_machine("udelar-lab01-1-attacker")
+        client._wait_for_agent(domain)
+        assert len(calls) == 2
+
+def test_libvirt_wait_for_agents(monkeypatch, client):
+    if client.config.platform == "libvirt":
+        def ping(domain, command, timeout, flags):
+            if domain.name() == "udelar-lab01-caldera":
+                raise libvirt.libvirtError("boom")
+        monkeypatch.setattr(libvirt_qemu, "qemuAgentCommand", ping)
+        result = client.wait_for_agents(["udelar-lab01-1-attacker", "udelar-lab01-caldera", "x"], sleep=0, max_tries=2)
+        assert result == {"udelar-lab01-1-attacker": True, "udelar-lab01-caldera": False, "x": False}
+
+def test_libvirt_agent_events(client):
+    if client.config.platform == "libvirt":
+        domain = MagicMock()
+        domain.name.return_value = "udelar-lab01-1-attacker"
+        client._agents_ready.add("udelar-lab01-1-attacker")
+        client._agent_lifecycle_callback(None, domain, libvirt.VIR_CONNECT_DOMAIN_EVENT_AGENT_LIFECYCLE_STATE_CONNECTED, 0, None)
+        assert "udelar-lab01-1-attacker" in client._agents_ready
+        client._agent_lifecycle_callback(None, domain, libvirt.VIR_CONNECT_DOMAIN_EVENT_AGENT_LIFECYCLE_STATE_DISCONNECTED, 0, None)
+        assert "udelar-lab01-1-attacker" not in client._agents_ready
+
+        client._agents_ready.add("udelar-lab01-1-attacker")
+        client._domain_lifecycle_callback(None, domain, libvirt.VIR_DOMAIN_EVENT_STOPPED, 0, None)
+        assert "udelar-lab01-1-attacker" not in client._agents_ready
+
+def test_libvirt_image_usage_index(client):
+    if client.config.platform == "libvirt":
+        domain = MagicMock()
+        domain.name.return_value = "udelar-lab01-1-attacker"
+        domain.XMLDesc.return_value = """<domain><devices>
+            <disk><source file="/pool/udelar-lab01-1-attacker"/>
+                <backingStore><source file="/pool/udelar-lab01-attacker"/>
+                    <backingStore><source file="/pool/base"/></backingStore>
+                </backingStore>
+            </disk>
+        </devices></domain>"""
+        with patch.object(client.connection, "listAllDomains", return_value=[domain]) as mock_list:
+            with client.image_usage_index(["udelar-lab01-attacker", "base", "test2"]):
+                assert client.is_image_in_use("udelar-lab01-attacker") is True
+                assert client.is_image_in_use("base") is True
+                assert client.is_image_in_use("test2") is False
+            mock_list.assert_called_once()
+            domain.XMLDesc.assert_called_once()
+
+            with client.image_usage_index(["test2"]):
+                client._domain_lifecycle_callback(None, domain, libvirt.VIR_DOMAIN_EVENT_UNDEFINED, 0, None)
+                assert client.is_image_in_use("test2") is False
+            assert mock_list.call_count == 3
+        assert client._image_usage is None
+
+def test_libvirt_image_fingerprint(client):
+    if client.config.platform == "libvirt":
+        volumes = {"udelar-lab01-attacker": b"image"}
+        class Stream:
+            data = b""
+            volume = None
+            def recv(self, size):
+                data, self.data = self.data[:size], self.data[size:]
+                return data
+            def send(self, data):
+                volumes[self.volume] = data
+            def finish(self):
+                pass
+        class Volume:
+            def __init__(self, name):
+                self.name = name
+            def info(self):
+                return [0, len(volumes[self.name]), 0]
+            def delete(self):
+                del volumes[self.name]
+            def download(self, stream, offset, length, flags):
+                stream.data = volumes[self.name]
+            def upload(self, stream, offset, length, flags):
+                stream.volume = self.name
+        def lookup(volume_name):
+            if volume_name not in volumes:
+                raise libvirt.libvirtError("Volume not found")
+            return Volume(volume_name)
+        def create(xml, flags):
+            volume_name = ET.fromstring(xml).find("name").text
+            volumes[volume_name] = b""
+            return Volume(volume_name)
+        pool = MagicMock()
+        pool.storageVolLookupByName.side_effect = lookup
+        pool.createXML.side_effect = create
+
+        with patch.object(client.connection, "storagePoolLookupByName", return_value=pool), \
+             patch.object(client.connection, "newStream", side_effect=lambda flags: Stream()):
+            assert client.get_image_fingerprint("udelar-lab01-attacker") is None
+            client.set_image_fingerprint("udelar-lab01-attacker", "abc")
+            assert client.get_image_fingerprint("udelar-lab01-attacker") == "abc"
+            client.set_image_fingerprint("udelar-lab01-attacker", "def")
+            assert client.get_image_fingerprint("udelar-lab01-attacker") == "def"
+            assert sorted(volumes) == ["udelar-lab01-attacker", "udelar-lab01-attacker-tectonic.json"]
+            # The fingerprint of a missing image is not trusted
+            assert client.get_image_fingerprint("x") is None
+
+            with patch.object(client, "is_image_in_use", return_value=False):
+                client.delete_image("udelar-lab01-attacker")
+            assert volumes == {}
+
 def test_libvirt_add_rule_to_nwfilter(client):
     if client.config.platform == "libvirt":
         root = ET.Element('filter', name="test", chain='root')
@@ -196,4 +466,227 @@ def test_libvirt_create_nwfilter(monkeypatch, client):
         )]
         client.create_nwfilter("test-filter", "10.1.1.5", rules)
         root = ET.fromstring(xml_result["xml"]) 
-        assert len(root.findall("rule")) == 3
\ No newline at end of file
+        assert len(root.findall("rule")) == 3
+
+def test_libvirt_sync_nwfilters(monkeypatch, client):
+    if client.config.platform == "libvirt":
+        rules = [ TrafficRule(
+            BaseTrafficRule("test", "test", "10.1.1.0/24", "10.1.1.5", "tcp", 80),
+            "10.1.1.0/24",
+            1
+        )]
+        unchanged = MagicMock()
+        unchanged.name.return_value = "unchanged"
+        unchanged.XMLDesc.return_value = ET.tostring(client._build_nwfilter("unchanged", "10.1.1.5", rules), encoding='unicode')
+        changed = MagicMock()
+        changed.name.return_value = "changed"
+        changed.XMLDesc.return_value = ET.tostring(client._build_nwfilter("changed", "10.1.1.5", []), encoding='unicode')
+        other = {}
+        for name in ["udelar-lab01-stale", "udelar-lab01-in-use", "udelar-lab01-kept", "udelar-lab02-other"]:
+            other[name] = MagicMock()
+            other[name].name.return_value = name
+        other["udelar-lab01-in-use"].undefine.side_effect = libvirt.libvirtError("Requested operation is not valid: nwfilter is in use")
+        defined = []
+        monkeypatch.setattr(client.connection, "listAllNWFilters", lambda: [unchanged, changed] + list(other.values()))
+        monkeypatch.setattr(client.connection, "nwfilterDefineXML", lambda xml: defined.append(ET.fromstring(xml).get("name")))
+
+        result = client.sync_nwfilters({
+            "unchanged": ("10.1.1.5", rules),
+            "changed": ("10.1.1.5", rules),
+            "new": ("10.1.1.6", rules),
+        })
+        assert sorted(result) == ["changed", "new"]
+        assert sorted(defined) == ["changed", "new"]
+        for nwfilter in other.values():
+            nwfilter.undefine.assert_not_called()
+
+        # Stale filters of the lab are undefined, unless they are still in use
+        defined.clear()
+        result = client.sync_nwfilters({"unchanged": ("10.1.1.5", rules)}, prefix="udelar-lab01-", keep=["udelar-lab01-kept"])
+        assert result == [] and defined == []
+        other["udelar-lab01-stale"].undefine.assert_called_once()
+        other["udelar-lab01-in-use"].undefine.assert_called_once()
+        other["udelar-lab01-kept"].undefine.assert_not_called()
+        other["udelar-lab02-other"].undefine.assert_not_called()
+        unchanged.undefine.assert_not_called()
+
+        client.config.libvirt.nwfilter_workers = 4
+        client.destroy_nwfilters(["unchanged", "changed", "missing"])
+        unchanged.undefine.assert_called_once()
+        changed.undefine.assert_called_once()
+        client.config.libvirt.nwfilter_workers = 1
+
+
+def test_libvirt_nwfilter_hash_round_trip(client):
+    if client.config.platform == "libvirt":
+        rules = [ TrafficRule(
+            BaseTrafficRule("test", "test", "10.1.1.0/24", "10.1.1.5", "tcp", 80),
+            "10.1.1.0/24",
+            1
+        )]
+        root = client._build_nwfilter("udelar-lab01-filter", "10.1.1.5", rules)
+        # The filter as returned by libvirt XMLDesc: attributes are reordered,
+        # quotes and indentation change
+        xml_desc = f"""<filter name='udelar-lab01-filter' chain='root'>
+  <uuid>{root.find("uuid").text}</uuid>
+  <filterref filter='qemu-announce-self'/>
+  <rule action='accept' direction='out' priority='100'>
+    <all/>
+  </rule>
+  <rule action='accept' direction='in' priority='500'>
+    <tcp srcipaddr='10.1.1.0' srcipmask='24' dstipaddr='10.1.1.5' dstipmask='32' dstportstart='80' dstportend='80'/>
+  </rule>
+  <rule action='drop' direction='in' priority='1000'>
+    <all/>
+  </rule>
+</filter>
+"""
+        assert client._nwfilter_hash(ET.fromstring(xml_desc)) == client._nwfilter_hash(root)
+        changed = xml_desc.replace("dstportend='80'", "dstportend='81'")
+        assert client._nwfilter_hash(ET.fromstring(changed)) != client._nwfilter_hash(root)
+
+def test_libvirt_nwfilter_template(client):
+    if client.config.platform == "libvirt":
+        rules = [ TrafficRule(
+            BaseTrafficRule("test", "test", "lan", "victim.lan", "tcp", 80),
+            "$SRC/$SRCMASK",
+            1
+        )]
+        root = client._build_nwfilter("udelar-lab01-victim-lan-0123456789ab", "$IP", rules)
+        tcp = root.find("rule[@priority='500']/tcp")
+        assert tcp.get("srcipaddr") == "$SRC"
+        assert tcp.get("srcipmask") == "$SRCMASK"
+        assert tcp.get("dstipaddr") == "$IP"
+
+def test_libvirt_cluster(description):
+    if description.config.platform == "libvirt":
+        description.config.libvirt.hosts = [
+            {"name": "host1", "uri": description.config.libvirt.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "test:///default", "memory": 8192, "vcpu": 16},
+        ]
+        with pytest.raises(ClientLibvirtException, match="require routing"):
+            ClientLibvirt(description.config, description)
+
+        description.config.libvirt.routing = True
+        client = ClientLibvirt(description.config, description)
+        assert client.connections["host1"] is client.connection
+        assert client.connections["host2"] is not client.connection
+        assert len(client._all_connections()) == 2
+
+        # Instance 1 runs in host2, instance 2 and the services in host1
+        assert client._get_connection("udelar-lab01-1-attacker") is client.connections["host2"]
+        assert client._get_connection("udelar-lab01-2-attacker") is client.connection
+        assert client._get_connection("udelar-lab01-elastic") is client.connection
+        assert client.get_machine_status("udelar-lab01-1-attacker") == "NOT FOUND"
+        assert client.get_machine_status("udelar-lab01-elastic") == "RUNNING"
+
+        # Network filters are defined in every host
+        defined = []
+        for connection, _ in client._all_connections():
+            connection.listAllNWFilters = MagicMock(return_value=[])
+            connection.nwfilterDefineXML = MagicMock(side_effect=lambda xml: defined.append(ET.fromstring(xml).get("name")))
+        assert client.sync_nwfilters({"filter": ("10.0.1.4", [])}) == ["filter"]
+        assert defined == ["filter", "filter"]
+
+        description.config.libvirt.hosts = []
+        description.config.libvirt.routing = False
+
+def test_docker_get_image_fingerprint(client):
+    if client.config.platform == "docker":
+        images = {
+            "udelar-lab01-attacker": MagicMock(labels={"tectonic.fingerprint": "abc"}),
+            "udelar-lab01-victim": MagicMock(labels={}),
+        }
+        with patch.object(client.connection.images, "get", side_effect=lambda image_name: images.get(image_name)):
+            assert client.get_image_fingerprint("udelar-lab01-attacker") == "abc"
+            assert client.get_image_fingerprint("udelar-lab01-victim") is None
+            assert client.get_image_fingerprint("x") is None
+
+def test_docker_inventory(client):
+    if client.config.platform == "docker":
+        list_calls = client.connection.containers.list.call_count
+        assert client.get_machine_status("udelar-lab01-1-attacker") == "RUNNING"
+        assert client.get_machine_private_ip("udelar-lab01-1-attacker") == "10.0.1.4"
+        assert client.get_machine_ip_in_services_network("udelar-lab01-1-victim-1") == "10.0.0.130"
+        assert client.is_image_in_use("udelar-lab01-attacker") is True
+        assert client.is_image_in_use("udelar-lab01-attacker") is True
+        assert client.connection.containers.list.call_count == list_calls + 1
+        assert client.connection.containers.list.call_args.kwargs["all"] is True
+        assert client.connection.containers.list.call_args.kwargs["filters"] == {"name": "udelar-lab01-"}
+        client.connection.containers.get.assert_not_called()
+        assert [c.args for c in client.connection.images.get.call_args_list] == [("udelar-lab01-attacker",)]
+
+        # Lifecycle operations invalidate the snapshot, but not the seeded information
+        client.seed_machine_info({"udelar-lab01-1-attacker": {"private_ip": "10.0.1.4"}})
+        client.stop_machine("udelar-lab01-1-attacker")
+        assert client.get_machine_status("udelar-lab01-1-attacker") == "STOPPED"
+        assert client.connection.containers.list.call_count == list_calls + 2
+        assert client._get_machine_info("udelar-lab01-1-attacker") == {"private_ip": "10.0.1.4"}
+        client.invalidate_cache()
+
+        # The snapshot expires after the TTL
+        client.config.docker.inventory_ttl = 0
+        client.get_machine_status("udelar-lab01-1-attacker")
+        client.get_machine_status("udelar-lab01-1-attacker")
+        assert client.connection.containers.list.call_count == list_calls + 4
+        client.config.docker.inventory_ttl = 5
+
+        # Containers of other labs are not in the snapshot
+        other_lab = MagicMock(attrs={"ImageID": "test2"})
+        client.connection.containers.list.return_value = client.connection.containers.list.return_value + [other_lab]
+        assert client.is_image_in_use("test2") is True
+        assert client.connection.containers.list.call_args.kwargs == {"all": True, "filters": {"ancestor": "test2"}}
+        client.connection.containers.list.return_value.remove(other_lab)
+        assert client.is_image_in_use("test2") is False
+
+        # Each client waits only for its own snapshot
+        other = ClientDocker(client.config, client.description)
+        assert other._inventory_lock is not client._inventory_lock
+
+        # Image ids looked up while the snapshot is invalidated are not cached
+        client._get_inventory()
+        def get_image(image_name):
+            client.invalidate_cache()
+            return MagicMock(id="sha256:new")
+        with patch.object(client.connection.images, "get", side_effect=get_image):
+            assert client._get_image_id("udelar-lab01-victim") == "sha256:new"
+        assert client._image_ids is None
+
+def test_docker_cluster(description):
+    if description.config.platform == "docker":
+        description.config.docker.hosts = [
+            {"name": "host1", "uri": description.config.docker.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "tcp://node2:2376", "memory": 8192, "vcpu": 16},
+        ]
+        client = ClientDocker(description.config, description)
+        remote = MagicMock(docker.DockerClient)
+        remote.containers.get.side_effect = docker.errors.NotFound("not found")
+        remote.containers.list.return_value = []
+        remote.images.get.side_effect = docker.errors.ImageNotFound("not found")
+        with patch("tectonic.client_docker.docker.DockerClient", return_value=remote) as mock_docker_client:
+            client._connect_hosts()
+            mock_docker_client.assert_called_once_with(base_url="tcp://node2:2376")
+        assert client.connections["host1"] is client.connection
+        assert client.connections["host2"] is remote
+        assert client._all_connections() == [client.connection, remote]
+
+        # Instance 1 runs in host2, instance 2 and the services in host1
+        assert client._get_connection("udelar-lab01-1-attacker") is remote
+        assert client._get_connection("udelar-lab01-2-attacker") is client.connection
+        assert client._get_connection("udelar-lab01-elastic") is client.connection
+        assert client.get_docker_host("udelar-lab01-1-attacker") == "tcp://node2:2376"
+        assert client.get_docker_host("udelar-lab01-elastic") == description.config.docker.uri
+        assert client.get_machine_status("udelar-lab01-1-attacker") == "NOT FOUND"
+        assert client.get_machine_status("udelar-lab01-2-attacker") == "RUNNING"
+
+        # Images are copied to and deleted from every host
+        client.copy_image("udelar-lab01-attacker")
+        remote.images.load.assert_called_once()
+        assert client.is_image_in_use("udelar-lab01-attacker")
+        client.connection.containers.list.return_value = []
+        client.invalidate_cache()
+        client.delete_image("udelar-lab01-attacker")
+        client.connection.images.remove.assert_called_with("udelar-lab01-attacker")
+        remote.images.remove.assert_not_called()
+
+        description.config.docker.hosts = []
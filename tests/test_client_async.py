@@ -0,0 +1,50 @@
+import pytest
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+from tectonic.client_async import AsyncClient, ClientAsyncException
+
+
+def test_run(client):
+    async_client = AsyncClient(client, 4)
+    status = async_client.run("get_machine_status", ["udelar-lab01-1-attacker", "x"])
+    assert status == {"udelar-lab01-1-attacker": "RUNNING", "x": "NOT FOUND"}
+    async_client.close()
+
+def test_concurrency_limit():
+    running = []
+    peak = []
+    lock = threading.Lock()
+    def start_machine(machine_name):
+        with lock:
+            running.append(machine_name)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(machine_name)
+    sync_client = MagicMock()
+    sync_client.start_machine.side_effect = start_machine
+
+    async_client = AsyncClient(sync_client, 3)
+    machines = [f"machine-{i}" for i in range(20)]
+    assert async_client.run("start_machine", machines) == {machine: None for machine in machines}
+    assert sync_client.start_machine.call_count == 20
+    assert 1 < max(peak) <= 3
+
+    # The coroutines can also be awaited from an event loop
+    result = asyncio.run(async_client.gather("start_machine", machines[:2]))
+    assert list(result.keys()) == machines[:2]
+    async_client.close()
+
+def test_errors():
+    with pytest.raises(ClientAsyncException):
+        AsyncClient(MagicMock(), 0)
+
+    sync_client = MagicMock()
+    sync_client.stop_machine.side_effect = Exception("error")
+    async_client = AsyncClient(sync_client, 2)
+    with pytest.raises(Exception, match="error"):
+        async_client.run("stop_machine", ["a", "b"])
+    async_client.close()
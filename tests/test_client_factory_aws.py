@@ -0,0 +1,75 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from tectonic.config_aws import TectonicConfigAWS
+from tectonic.client_factory_aws import ClientFactoryAWS, ClientFactoryAWSException, TokenBucket
+from tectonic.instrumentation import Instrumentation
+
+
+def test_get_shared_factory(aws_credentials):
+    aws_config = TectonicConfigAWS()
+    factory = ClientFactoryAWS.get(aws_config)
+    assert ClientFactoryAWS.get(aws_config) is factory
+    assert factory.client("ec2") is factory.client("ec2")
+
+    aws_config.max_pool_connections = "100"
+    other_factory = ClientFactoryAWS.get(aws_config)
+    assert other_factory is not factory
+    assert other_factory.config.max_pool_connections == 100
+    assert other_factory.config.retries == {"max_attempts": 10, "mode": "adaptive"}
+
+def test_client_error(aws_credentials):
+    factory = ClientFactoryAWS("us-east-1")
+    with patch("tectonic.client_factory_aws.boto3.session.Session", side_effect=Exception("boom")):
+        with pytest.raises(ClientFactoryAWSException, match="boom"):
+            factory.client("ec2")
+
+def test_throttling_metrics():
+    factory = ClientFactoryAWS("us-east-1")
+    operation = MagicMock()
+    operation.name = "DescribeInstances"
+    factory._before_send()
+    factory._count_retry(response=(None, {"Error": {"Code": "RequestLimitExceeded"}}), operation=operation, attempts=1)
+    factory._count_retry(response=(None, {"Error": {"Code": "InvalidParameterValue"}}), operation=operation, attempts=1)
+    factory._count_retry(response=None, operation=operation, attempts=1)
+    assert factory.metrics() == {"calls": 1, "retries": 1, "throttled": {"DescribeInstances": 1}}
+
+def test_rate_limit():
+    factory = ClientFactoryAWS("us-east-1", requests_per_second=5)
+    assert factory.rate_limiter is not None
+    with patch.object(factory.rate_limiter, "acquire") as mock_acquire:
+        factory._before_send()
+        mock_acquire.assert_called_once()
+    assert ClientFactoryAWS("us-east-1").rate_limiter is None
+
+@patch("tectonic.client_factory_aws.time.sleep")
+def test_token_bucket(mock_sleep):
+    bucket = TokenBucket(2)
+    bucket.acquire()
+    bucket.acquire()
+    mock_sleep.assert_not_called()
+    with patch("tectonic.client_factory_aws.time.monotonic", side_effect=[bucket._last, bucket._last + 1]):
+        bucket.acquire()
+    mock_sleep.assert_called_once()
+
+def test_instrumentation(aws_credentials):
+    factory = ClientFactoryAWS("us-east-1")
+    instrumentation = Instrumentation(True)
+    factory.instrument(instrumentation)
+    factory.client("ec2")
+
+    model = MagicMock()
+    model.name = "DescribeInstances"
+    context = {}
+    factory._before_call(model=model, context=context)
+    factory._after_call(http_response=MagicMock(status_code=200), context=context)
+    factory._before_call(model=model, context=context)
+    factory._after_call_error(context=context, exception=Exception("boom"))
+    operation = MagicMock()
+    operation.name = "DescribeInstances"
+    factory._count_retry(response=(None, {"Error": {"Code": "Throttling"}}), operation=operation, attempts=1)
+
+    stats = instrumentation.snapshot()["operations"]["aws.DescribeInstances"]
+    assert stats["calls"] == 2
+    assert stats["errors"] == 1
+    assert stats["retries"] == 1
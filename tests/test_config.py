@@ -81,6 +81,10 @@ valid_aws_options = [
         "teacher_access": "endpoint",
         "access_host_instance_type": "t2.small",
         "packetbeat_vlan_id": "2",
+        "max_pool_connections": "100",
+        "max_attempts": "5",
+        "retry_mode": "standard",
+        "requests_per_second": "20",
     },
 ]
 
@@ -96,6 +100,7 @@ valid_libvirt_options = [
         "external_network": "192.168.128.0/25",
         "bridge_base_ip": 100,
         "routing": True,
+        "nwfilter_templates": True,
     },
 ]
 
@@ -159,6 +164,108 @@ def test_tectonic_valid_libvirt_config(option):
         assert getattr(config.libvirt, key) == value
 
 
+def test_tectonic_libvirt_hosts():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.libvirt.hosts == []
+    config.libvirt.hosts = "qemu+ssh://root@hv1/system memory=65536 vcpu=32 address=10.1.0.1, test:///default memory=4096 vcpu=4 storage_pool=tectonic name=local"
+    assert config.libvirt.hosts == [
+        {"uri": "qemu+ssh://root@hv1/system", "memory": "65536", "vcpu": "32", "address": "10.1.0.1", "name": "host1"},
+        {"uri": "test:///default", "memory": "4096", "vcpu": "4", "storage_pool": "tectonic", "name": "local"},
+    ]
+    assert config.libvirt.to_dict()["hosts"] == config.libvirt.hosts
+
+    with pytest.raises(ValueError):
+        config.libvirt.hosts = "test:///default memory=4096"
+    with pytest.raises(ValueError):
+        config.libvirt.hosts = "test:///default memory=4096 vcpu"
+    with pytest.raises(ValueError):
+        config.libvirt.hosts = "test:///default memory=4096 vcpu=4 bridge=br0"
+
+def test_client_concurrency():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.client_concurrency == 10
+    config.client_concurrency = 1
+    with pytest.raises(ValueError):
+        config.client_concurrency = 0
+
+def test_terraform_plugin_cache_dir():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.terraform_plugin_cache_dir == absolute_path("~/.terraform.d/plugin-cache")
+    config.terraform_plugin_cache_dir = ""
+    assert config.terraform_plugin_cache_dir is None
+
+def test_terraform_data_dir():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.terraform_data_dir == absolute_path("~/.local/share/tectonic/terraform")
+    config.terraform_data_dir = "terraform-data"
+    assert config.terraform_data_dir == absolute_path("terraform-data", base_dir=config.tectonic_dir)
+
+def test_terraform_shards():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.terraform_shard_size == 0
+    assert config.terraform_shard_concurrency == 4
+    config.terraform_shard_size = 10
+    with pytest.raises(ValueError):
+        config.terraform_shard_size = -1
+    with pytest.raises(ValueError):
+        config.terraform_shard_concurrency = 0
+
+def test_terraform_parallelism():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.terraform_parallelism == 0
+    config.terraform_parallelism = 20
+    with pytest.raises(ValueError):
+        config.terraform_parallelism = -1
+
+def test_packer_builds():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.packer_build_split == "none"
+    assert config.packer_build_concurrency == 4
+    assert config.packer_parallel_builds == 0
+    assert config.packer_build_retries == 0
+    config.packer_build_split = "os"
+    with pytest.raises(ValueError):
+        config.packer_build_split = "machine"
+    with pytest.raises(ValueError):
+        config.packer_build_concurrency = 0
+    with pytest.raises(ValueError):
+        config.packer_parallel_builds = -1
+    with pytest.raises(ValueError):
+        config.packer_build_retries = -1
+
+def test_tectonic_docker_hosts():
+    config = TectonicConfig(lab_repo_uri)
+    assert config.docker.hosts == []
+    config.docker.hosts = "unix:///var/run/docker.sock memory=16384 vcpu=8, tcp://node2:2376 memory=8192 vcpu=4 name=node2"
+    assert config.docker.hosts == [
+        {"uri": "unix:///var/run/docker.sock", "memory": "16384", "vcpu": "8", "name": "host1"},
+        {"uri": "tcp://node2:2376", "memory": "8192", "vcpu": "4", "name": "node2"},
+    ]
+    assert config.docker.to_dict()["hosts"] == config.docker.hosts
+
+    assert config.docker.inventory_ttl == 5
+    config.docker.inventory_ttl = 0
+    with pytest.raises(ValueError):
+        config.docker.inventory_ttl = -1
+
+    with pytest.raises(ValueError):
+        config.docker.hosts = "tcp://node2:2376 vcpu=4"
+    with pytest.raises(ValueError):
+        config.docker.hosts = "tcp://node2:2376 memory=8192 vcpu=4 storage_pool=default"
+
+def test_tectonic_simulated():
+    config = TectonicConfig(lab_repo_uri)
+    config.platform = "simulated"
+    assert config.simulated.api_latency == 0
+    assert config.simulated.failure_rate == 0
+    config.simulated.failure_rate = 100
+    with pytest.raises(ValueError):
+        config.simulated.failure_rate = 101
+    with pytest.raises(ValueError):
+        config.simulated.boot_time = -1
+    with pytest.raises(ValueError):
+        config.simulated.seed = "invalid"
+
 def test_load_config(test_data_path):
     filename = Path(test_data_path).joinpath("config", "tectonic1.ini")
     config = TectonicConfig.load(filename)
@@ -57,9 +57,24 @@ def test_core_init_invalid_platform(description):
 def test_create_instances_images(core):
     core.packer.destroy_instance_image = MagicMock()
     core.packer.create_instance_image = MagicMock()
-    core.create_instances_images(["guest1"])
-    core.packer.destroy_instance_image.assert_called_once()
-    core.packer.create_instance_image.assert_called_once()
+    core.packer.get_outdated_instance_images = MagicMock(return_value=["guest1"])
+    core.create_instances_images(["guest1", "guest2"])
+    core.packer.get_outdated_instance_images.assert_called_once_with(["guest1", "guest2"])
+    core.packer.destroy_instance_image.assert_called_once_with(["guest1"])
+    core.packer.create_instance_image.assert_called_once_with(["guest1"])
+
+    # Up to date images are not destroyed nor built again
+    core.packer.destroy_instance_image.reset_mock()
+    core.packer.create_instance_image.reset_mock()
+    core.packer.get_outdated_instance_images = MagicMock(return_value=[])
+    core.create_instances_images(None)
+    core.packer.destroy_instance_image.assert_not_called()
+    core.packer.create_instance_image.assert_not_called()
+
+    core.create_instances_images(["guest1", "guest2"], rebuild=True)
+    core.packer.get_outdated_instance_images.assert_called_once_with(None)
+    core.packer.destroy_instance_image.assert_called_once_with(["guest1", "guest2"])
+    core.packer.create_instance_image.assert_called_once_with(["guest1", "guest2"])
 
     core.packer.destroy_instance_image.reset_mock()
     core.packer.create_instance_image.reset_mock()
@@ -104,10 +119,17 @@ def test_deploy(core):
     core.terraform_service.deploy_packetbeat = MagicMock()
     core.terraform_service.install_elastic_agent = MagicMock()
     core.terraform_service.install_caldera_agent = MagicMock()
-    core.client.create_nwfilter = MagicMock()
+    core.client.sync_nwfilters = MagicMock()
 
-    core.deploy([1], True, [])
+    # Routes are only required in libvirt cluster mode
+    assert core.deploy([1], True, []) == []
 
+    if core.config.platform == "libvirt":
+        core.client.sync_nwfilters.assert_called_once()
+        assert core.client.sync_nwfilters.call_args.kwargs["prefix"] == "udelar-lab01-"
+        # Filters of the other instances are kept
+        assert "udelar-lab01-2-attacker-udelar-lab01-2-internal" in core.client.sync_nwfilters.call_args.kwargs["keep"]
+        assert not any(name.startswith("udelar-lab01-2-") for name in core.client.sync_nwfilters.call_args.args[0])
     core.ansible.wait_for_connections.assert_called_once()
     core.ansible.run.assert_called_once()
     core.configure_access.assert_called_once()
@@ -127,10 +149,12 @@ def test_destroy(core):
     core.description.moodle.enable = True
     core.description.ctfd.enable = True
     core.description.bastion_host.enable = True
-    core.client.destroy_nwfilter = MagicMock()
+    core.client.destroy_nwfilters = MagicMock()
 
     core.destroy(None, False, True, ["svc"])
 
+    if core.config.platform == "libvirt":
+        core.client.destroy_nwfilters.assert_called_once()
     core.terraform.destroy.assert_called()
     core.terraform_service.destroy.assert_called()
 
@@ -154,6 +178,20 @@ def test_recreate(core):
     core.terraform.recreate.assert_called_once()
 
 
+def test_wait_for_new_machines(core, caplog):
+    core.terraform.pop_created_machines = MagicMock(return_value=["m1", "m2"])
+    core.client.wait_for_machines = MagicMock(return_value={"m1": True, "m2": False})
+    with caplog.at_level("WARNING"):
+        core._wait_for_new_machines(core.terraform)
+    core.client.wait_for_machines.assert_called_once_with(["m1", "m2"])
+    assert "Machines not ready yet: m2." in caplog.text
+
+    core.terraform.pop_created_machines = MagicMock(return_value=[])
+    core.client.wait_for_machines.reset_mock()
+    core._wait_for_new_machines(core.terraform)
+    core.client.wait_for_machines.assert_not_called()
+
+
 def test_start_stop_restart(core):
     core.description.parse_machines = MagicMock(return_value=["m1"])
     core.client.start_machine = MagicMock()
@@ -282,3 +320,14 @@ def test_get_students_passwords(core):
     core.description.create_students_passwords = False
     core.description.moodle.enable = False
     assert core._get_students_passwords() == {}
+
+def test_report_metrics(core, tmp_path):
+    # Disabled unless a metrics file is configured, even in debug mode
+    assert core.config.debug
+    assert not core.instrumentation.enabled
+    core.instrumentation.enabled = True
+    core.instrumentation.record("op", 0.1)
+    core.config.metrics_file = (tmp_path / "metrics.json").as_posix()
+    core.report_metrics()
+    assert (tmp_path / "metrics.json").exists()
+    core.config.metrics_file = None
@@ -164,6 +164,55 @@ def test_description_traffic_rules(labs_path, tectonic_config):
                                 expected = 3
                             assert len(interface.traffic_rules) == expected
 
+def test_description_nwfilter_templates(labs_path, tectonic_config):
+    lab_edition_path = Path(labs_path) / "test.yml"
+    tectonic_config.libvirt.routing = True
+    tectonic_config.libvirt.nwfilter_templates = True
+    description = Description(tectonic_config, lab_edition_path)
+    if tectonic_config.platform == "libvirt":
+        templates = {}
+        for _, guest in description.scenario_guests.items():
+            for _, interface in guest.interfaces.items():
+                assert interface.nwfilter_name == f"{guest.name}-{interface.network.name}"
+                assert interface.nwfilter_template_name.startswith(f"udelar-lab01-{guest.base_name}-{interface.network.base_name}-")
+                assert interface.nwfilter_parameters["IP"] == interface.private_ip
+                assert "$SRC/$SRCMASK" in [rule.source_cidr for rule in interface.nwfilter_rules]
+                assert interface.to_dict()["nwfilter"] == {
+                    "name": interface.nwfilter_template_name,
+                    "parameters": interface.nwfilter_parameters,
+                }
+                templates.setdefault(interface.nwfilter_template_name, []).append(interface.nwfilter_name)
+        # Every copy in every instance shares the filter of its base guest and network
+        assert len(templates) == 4
+        victim = [interfaces for name, interfaces in templates.items() if name.startswith("udelar-lab01-victim-internal-")]
+        assert len(victim) == 1 and len(victim[0]) == 4
+    else:
+        for _, guest in description.scenario_guests.items():
+            for _, interface in guest.interfaces.items():
+                assert "nwfilter" not in interface.to_dict()
+
+def test_description_nwfilter_templates_cross_network(labs_path, tectonic_config):
+    tectonic_config.libvirt.routing = True
+    tectonic_config.libvirt.nwfilter_templates = True
+    description = Description(tectonic_config, Path(labs_path) / "test-traffic_rules.yml")
+    if tectonic_config.platform != "libvirt":
+        return
+    interfaces = {}
+    attacker_ips = {}
+    for _, guest in description.scenario_guests.items():
+        for _, interface in guest.interfaces.items():
+            if guest.base_name == "victim" and interface.network.base_name == "dmz":
+                interfaces[guest.instance] = interface
+            elif guest.base_name == "attacker" and interface.network.base_name == "lan":
+                attacker_ips[guest.instance] = interface.private_ip
+    assert len(interfaces) == description.instance_number
+    # The address of the attacker changes in each instance, but not the filter
+    assert len(set(attacker_ips.values())) == description.instance_number
+    for instance, interface in interfaces.items():
+        parameter_name = next(name for name, value in interface.nwfilter_parameters.items() if value == attacker_ips[instance])
+        assert f"${parameter_name}/32" in [rule.source_cidr for rule in interface.nwfilter_rules]
+    assert len({interface.nwfilter_template_name for interface in interfaces.values()}) == 1
+
 def test_description_no_services(labs_path, tectonic_config):
     lab_edition_path = Path(labs_path) / "no_services.yml"
     description = Description(tectonic_config, lab_edition_path)
@@ -0,0 +1,128 @@
+import pytest
+import json
+import datetime
+from unittest.mock import MagicMock
+
+from tectonic.instrumentation import Instrumentation, InstrumentationException
+from tectonic.client import ClientException
+
+
+def test_record():
+    instrumentation = Instrumentation(True)
+    instrumentation.record("op", 0.002, machine_name="m1")
+    instrumentation.record("op", 2, True, machine_name="m1")
+    instrumentation.record_retry("op")
+
+    metrics = instrumentation.snapshot()
+    assert metrics["operations"]["op"]["calls"] == 2
+    assert metrics["operations"]["op"]["errors"] == 1
+    assert metrics["operations"]["op"]["retries"] == 1
+    assert metrics["operations"]["op"]["max_time"] == 2
+    assert metrics["operations"]["op"]["histogram"] == {"<=5ms": 1, "<=5000ms": 1}
+    assert metrics["machines"]["m1"]["op"] == {"calls": 2, "errors": 1, "total_time": 2.002}
+
+    headers, rows = instrumentation.summary()
+    assert headers[0] == "Operation"
+    assert rows == [["op", 2, 1, 1, "1001.0", "2000.0"]]
+
+def test_record_terraform():
+    instrumentation = Instrumentation(True)
+    instrumentation.record_terraform("state", "apply", 20, 100, 1.5)
+    instrumentation.record_terraform("state", "destroy", 20, 100, 0.5, True)
+    metrics = instrumentation.snapshot()
+    assert metrics["terraform"]["state"] == [
+        {"operation": "apply", "parallelism": 20, "resources": 100, "time": 1.5, "error": False},
+        {"operation": "destroy", "parallelism": 20, "resources": 100, "time": 0.5, "error": True},
+    ]
+    assert metrics["operations"]["terraform.destroy"]["errors"] == 1
+
+    terraform = MagicMock()
+    terraform.instrumentation = None
+    Instrumentation(False).instrument_terraform(terraform)
+    assert terraform.instrumentation is None
+    instrumentation.instrument_terraform(terraform)
+    assert terraform.instrumentation is instrumentation
+
+def test_record_packer():
+    instrumentation = Instrumentation(True)
+    instrumentation.record_packer("all", 0, ["attacker", "victim"], 60.0, True)
+    instrumentation.record_packer("victim", 1, ["victim"], 30.0)
+    metrics = instrumentation.snapshot()
+    assert metrics["packer"] == {
+        "all": [{"attempt": 0, "machines": ["attacker", "victim"], "time": 60.0, "error": True}],
+        "victim": [{"attempt": 1, "machines": ["victim"], "time": 30.0, "error": False}],
+    }
+    assert metrics["operations"]["packer.build"]["calls"] == 2
+    assert metrics["operations"]["packer.build"]["errors"] == 1
+
+    packer = MagicMock()
+    packer.instrumentation = None
+    Instrumentation(False).instrument_packer(packer)
+    assert packer.instrumentation is None
+    instrumentation.instrument_packer(packer)
+    assert packer.instrumentation is instrumentation
+
+def test_instrument_client(client):
+    instrumentation = Instrumentation(False)
+    instrumentation.instrument_client(client)
+    assert "get_machine_status" not in vars(client)
+
+    instrumentation = Instrumentation(True)
+    instrumentation.instrument_client(client)
+    prefix = type(client).__name__
+    client.get_machine_status("udelar-lab01-1-attacker")
+    with pytest.raises(ClientException):
+        client.start_machine("x")
+    metrics = instrumentation.snapshot()
+    assert metrics["operations"][f"{prefix}.get_machine_status"]["calls"] == 1
+    assert metrics["operations"][f"{prefix}.start_machine"]["errors"] == 1
+    assert metrics["machines"]["udelar-lab01-1-attacker"][f"{prefix}.get_machine_status"]["calls"] == 1
+    assert f"{prefix}.image_usage_index" not in vars(client)
+
+def test_docker_hook():
+    instrumentation = Instrumentation(True)
+    connection = MagicMock()
+    connection.api.hooks = {"response": []}
+    instrumentation.instrument_docker(connection)
+    instrumentation.instrument_docker(connection)
+    assert len(connection.api.hooks["response"]) == 1
+
+    response = MagicMock()
+    response.url = "http+docker://localhost/v1.43/containers/udelar-lab01-1-attacker/start"
+    response.request.method = "POST"
+    response.elapsed = datetime.timedelta(milliseconds=20)
+    response.status_code = 204
+    connection.api.hooks["response"][0](response)
+    metrics = instrumentation.snapshot()
+    assert metrics["operations"]["docker.POST /containers/{id}/start"]["calls"] == 1
+
+def test_instrument_libvirt():
+    class virConnect:
+        __module__ = "libvirt"
+        def lookupByName(self, name):
+            return name
+        def listAllDomains(self):
+            raise Exception("boom")
+    connection = virConnect()
+    Instrumentation(False).instrument_libvirt(connection)
+    assert "lookupByName" not in vars(connection)
+
+    instrumentation = Instrumentation(True)
+    instrumentation.instrument_libvirt(connection)
+    instrumentation.instrument_libvirt(connection)
+    instrumentation.instrument_libvirt(MagicMock())
+    assert connection.lookupByName("udelar-lab01-1-attacker") == "udelar-lab01-1-attacker"
+    with pytest.raises(Exception):
+        connection.listAllDomains()
+    metrics = instrumentation.snapshot()
+    assert metrics["operations"]["libvirt.lookupByName"]["calls"] == 1
+    assert metrics["operations"]["libvirt.listAllDomains"]["errors"] == 1
+
+def test_export(tmp_path):
+    instrumentation = Instrumentation(True)
+    instrumentation.record("op", 0.1)
+    instrumentation.export(tmp_path / "metrics.json")
+    assert json.loads((tmp_path / "metrics.json").read_text())["operations"]["op"]["calls"] == 1
+
+    with pytest.raises(InstrumentationException):
+        instrumentation.export(tmp_path / "missing" / "metrics.json")
@@ -1,7 +1,8 @@
 import pytest
+import os
 import json
 
-from unittest.mock import patch, call
+from unittest.mock import patch, call, MagicMock
 
 from tectonic.packer import PackerException
 import packerpy
@@ -19,6 +20,49 @@ def test_create_instance_image(mocker, packer):
     mj = m.call_args[0][1]['machines_json']
     assert "attacker" in mj
 
+def test_create_instance_image_fingerprint(mocker, packer):
+    m = mocker.patch.object(packer, "_invoke_packer")
+    s = mocker.patch.object(packer.client, "set_image_fingerprint")
+    packer.create_instance_image(["attacker"])
+
+    fingerprint = json.loads(m.call_args[0][1]["machines_json"])["attacker"]["image_fingerprint"]
+    assert fingerprint == packer._get_image_fingerprints([packer.description.base_guests["attacker"]])["attacker"]
+    s.assert_called_once_with("udelar-lab01-attacker", fingerprint)
+
+
+def test_get_outdated_instance_images(mocker, packer):
+    guests = packer.description.base_guests
+    fingerprints = packer._get_image_fingerprints(guests.values())
+    assert len(set(fingerprints.values())) == len(guests)
+    get_fingerprints = mocker.patch.object(packer.client, "get_image_fingerprints",
+                        side_effect=lambda image_names: {image_name: fingerprints["attacker"] if image_name == "udelar-lab01-attacker" else None
+                                                         for image_name in image_names})
+    image_usage_index = mocker.spy(packer.client, "image_usage_index")
+
+    assert packer.get_outdated_instance_images(None) == [name for name in guests if name != "attacker"]
+    assert packer.get_outdated_instance_images(["attacker"]) == []
+    # The images are looked up in one batch, without their usage
+    assert get_fingerprints.call_count == 2
+    image_usage_index.assert_not_called()
+
+    # A change in the guest definition makes its image outdated
+    memory = guests["attacker"].memory
+    guests["attacker"].memory = memory * 2
+    try:
+        assert packer.get_outdated_instance_images(["attacker"]) == ["attacker"]
+    finally:
+        guests["attacker"].memory = memory
+
+    # So does a change in the configuration used to build the images
+    proxy = packer.config.proxy
+    packer.config.proxy = "http://proxy.example.com:3128"
+    try:
+        assert packer.get_outdated_instance_images(None) == list(guests)
+    finally:
+        packer.config.proxy = proxy
+    assert packer.get_outdated_instance_images(["attacker"]) == []
+
+
 def test_create_instance_image_proxy(mocker, packer):
     old_proxy = packer.config.proxy
     proxy = 'http://proxy.example.com:3128'
@@ -36,6 +80,41 @@ def test_create_instance_image_proxy(mocker, packer):
     packer.config.proxy = old_proxy
 
 
+def test_create_instance_image_docker_cluster(mocker, packer):
+    if packer.config.platform == "docker":
+        packer.config.docker.hosts = [
+            {"name": "host1", "uri": packer.config.docker.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "tcp://node2:2376", "memory": 8192, "vcpu": 16},
+        ]
+        m = mocker.patch.object(packer, "_invoke_packer")
+        copy = mocker.patch.object(packer.client, "copy_image", create=True)
+        packer.create_instance_image(["attacker"])
+        m.assert_called_once()
+        copy.assert_called_once_with("udelar-lab01-attacker")
+        packer.config.docker.hosts = []
+
+def test_create_instance_image_libvirt_cluster(mocker, packer):
+    if packer.config.platform == "libvirt":
+        packer.config.libvirt.hosts = [
+            {"name": "host1", "uri": packer.config.libvirt.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "test:///default", "memory": 8192, "vcpu": 16, "storage_pool": "other"},
+        ]
+        m = mocker.patch.object(packer, "_invoke_packer")
+        s = mocker.patch.object(packer.client, "set_image_fingerprint")
+        variables = mocker.spy(packer, "_get_instance_variables")
+        packer.create_instance_image(["attacker"])
+        # Variables and fingerprints are computed once for all the hosts
+        variables.assert_called_once()
+        libvirt_config = [json.loads(c.args[1]["tectonic_json"])["config"]["platforms"]["libvirt"] for c in m.call_args_list]
+        assert [(c["uri"], c["storage_pool"]) for c in libvirt_config] == [
+            (packer.config.libvirt.uri, packer.config.libvirt.storage_pool),
+            ("test:///default", "other"),
+        ]
+        assert len({c.args[1]["machines_json"] for c in m.call_args_list}) == 1
+        s.assert_called_once()
+        packer.config.libvirt.hosts = []
+
+
 def test_create_service_image(mocker, packer):
     m = mocker.patch.object(packer, "_invoke_packer")
     packer.create_service_image(["caldera"])
@@ -97,12 +176,75 @@ def test_invoke_packer_fail(mocker, packer):
     with pytest.raises(PackerException, match="Packer init returned an error"):
         packer._invoke_packer("x", {})
 
-    mocker.patch.object(packerpy.PackerExecutable, 'build', return_value=(2, ''.encode(), None))
-    with pytest.raises(PackerException, match="Packer build returned an error"):
-        packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, {})
-
-    mocker.patch.object(packerpy.PackerExecutable, 'build', return_value=(0, ''.encode(), None))
-    packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, {}) # Success
+    mocker.patch.object(packerpy.PackerExecutable, 'execute_cmd', return_value=(0, ''.encode(), None))
+    variables = packer._get_instance_variables(["attacker"])
+    mocker.patch("tectonic.packer.subprocess.Popen", return_value=MagicMock(stdout=iter(["boom\n"]), returncode=2))
+    with pytest.raises(PackerException, match="Packer build returned an error:\nboom"):
+        packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, variables)
+
+    mocker.patch("tectonic.packer.subprocess.Popen", return_value=MagicMock(stdout=iter([]), returncode=0))
+    packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, variables) # Success
+
+    mocker.patch("tectonic.packer.subprocess.Popen", side_effect=FileNotFoundError("packer"))
+    with pytest.raises(PackerException, match="Cannot run packer"):
+        packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, variables)
+
+
+@pytest.mark.parametrize("split", ["none", "guest", "os"])
+def test_invoke_packer_builds(mocker, packer, caplog, split):
+    mocker.patch.object(packerpy.PackerExecutable, 'execute_cmd', return_value=(0, ''.encode(), None))
+    variables = packer._get_instance_variables(None)
+    guests = sorted(packer.description.base_guests)
+    builds = []
+    variables_files = []
+    def popen(args, **kwargs):
+        assert "-var" not in args
+        variables_file = next(arg for arg in args if arg.startswith("-var-file=")).split("=", 1)[1]
+        variables_files.append(variables_file)
+        assert os.stat(variables_file).st_mode & 0o077 == 0
+        with open(variables_file) as f:
+            build_variables = json.load(f)
+        assert build_variables["tectonic_json"] == variables["tectonic_json"]
+        machines = json.loads(build_variables["machines_json"])
+        builds.append(sorted(machines))
+        # The first build of the victim fails
+        failed = "victim" in machines and not any("victim" in build for build in builds[:-1])
+        output = [f"==> docker.{name}: Building\n" for name in machines]
+        if failed:
+            output.append("Build 'docker.victim' errored after 1 second: boom\n")
+        return MagicMock(stdout=iter(output), returncode=1 if failed else 0)
+    mocker.patch("tectonic.packer.subprocess.Popen", side_effect=popen)
+    packer.instrumentation = MagicMock()
+    packer.config.packer_build_split = split
+    packer.config.packer_build_retries = 1
+    try:
+        with caplog.at_level("INFO"):
+            packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, variables)
+        # Only the failed machine is built again
+        assert sorted(name for build in builds for name in build) == sorted(guests + ["victim"])
+        assert builds[-1] == ["victim"]
+        if split == "guest":
+            assert sorted(builds[:-1]) == [[guest] for guest in guests]
+        elif split == "none":
+            assert builds[0] == guests
+        # Logs are prefixed by the build name
+        build_name = {"none": "all", "guest": "victim", "os": packer.description.base_guests["victim"].os}[split]
+        assert f"[{build_name}] ==> docker.victim: Building" in caplog.text
+        assert f"Packer build {build_name} failed" in caplog.text
+        assert packer.instrumentation.record_packer.call_count == len(builds)
+        assert packer.instrumentation.record_packer.call_args.args[1] == 1
+        # The var files are removed after each build
+        assert not any(os.path.exists(variables_file) for variables_file in variables_files)
+
+        # Without retries, the error is reported
+        builds.clear()
+        packer.config.packer_build_retries = 0
+        with pytest.raises(PackerException, match="errored after 1 second"):
+            packer._invoke_packer(packer.INSTANCES_PACKER_MODULE, variables)
+    finally:
+        packer.config.packer_build_split = "none"
+        packer.config.packer_build_retries = 0
+        packer.instrumentation = None
 
 
 # def test_create_instance_image_calls_invoke(monkeypatch):
@@ -0,0 +1,82 @@
+
+# Tectonic - An academic Cyber Range
+# Copyright (C) 2024 Grupo de Seguridad Informática, Universidad de la República,
+# Uruguay
+#
+# This file is part of Tectonic.
+#
+# Tectonic is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Tectonic is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Tectonic.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+
+from tectonic.placement import Placement, PlacementException
+
+
+def test_placement_balances_instances(description):
+    hosts = [
+        {"name": "host1", "uri": "qemu+ssh://root@hv1/system", "memory": 8192, "vcpu": 16},
+        {"name": "host2", "uri": "qemu+ssh://root@hv2/system", "memory": 8192, "vcpu": 16, "address": "10.1.0.2"},
+    ]
+    placement = Placement(description, hosts)
+    assert placement.assignments == {1: "host1", 2: "host2"}
+    assert placement.host_of_instance(2)["name"] == "host2"
+    assert placement.instances_of_host("host1") == [1]
+    assert placement.host_of_machine("udelar-lab01-2-attacker")["name"] == "host2"
+    assert placement.host_of_machine("udelar-lab01-elastic") is None
+    assert placement.address(hosts[0]) == "hv1"
+    assert placement.address(hosts[1]) == "10.1.0.2"
+
+    with pytest.raises(PlacementException, match="Invalid instance"):
+        placement.host_of_instance(3)
+    with pytest.raises(PlacementException, match="Unknown host"):
+        placement.host("host3")
+
+
+def test_placement_capacity(description):
+    # Both instances fit in the biggest host
+    hosts = [
+        {"name": "small", "uri": "test:///default", "memory": 4096, "vcpu": 4},
+        {"name": "big", "uri": "test:///default", "memory": 16384, "vcpu": 16},
+    ]
+    assert Placement(description, hosts).assignments == {1: "big", 2: "big"}
+
+    # Services use the capacity of their host
+    hosts = [
+        {"name": "services", "uri": "test:///default", "memory": 65536, "vcpu": 32},
+        {"name": "host2", "uri": "test:///default", "memory": 8192, "vcpu": 16},
+    ]
+    assert Placement(description, hosts, "services").assignments == {1: "host2", 2: "services"}
+    with pytest.raises(PlacementException, match="for the services"):
+        Placement(description, hosts, "host2").assignments
+
+    hosts = [{"name": "host1", "uri": "test:///default", "memory": 4096, "vcpu": 4}]
+    with pytest.raises(PlacementException, match="Not enough capacity in the cluster for instance 1"):
+        Placement(description, hosts).assignments
+    with pytest.raises(PlacementException, match="No hosts"):
+        Placement(description, []).assignments
+
+
+def test_placement_routes(description):
+    hosts = [
+        {"name": "host1", "uri": "qemu+ssh://root@hv1/system", "memory": 65536, "vcpu": 32},
+        {"name": "host2", "uri": "qemu+ssh://root@hv2/system", "memory": 8192, "vcpu": 16},
+    ]
+    placement = Placement(description, hosts, "host1")
+    routes = placement.routes("hv1", ["192.168.5.0/24"])
+    instance_networks = [network.ip_network for _, network in description.scenario_networks.items() if network.instance in placement.instances_of_host("host2")]
+    assert len(instance_networks) > 0
+    for network in instance_networks:
+        assert {"host": "host1", "destination": network, "gateway": "hv2"} in routes
+    assert {"host": "host2", "destination": "192.168.5.0/24", "gateway": "hv1"} in routes
+    assert len(routes) == len(instance_networks) + 1
@@ -0,0 +1,179 @@
+import json
+import time
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+from click.testing import CliRunner
+
+from tectonic.description import Description
+from tectonic.core import Core
+from tectonic.client_simulated import ClientSimulatedException
+from tectonic.ansible import AnsibleException
+from tectonic.platform_simulated import SimulatedPlatform
+from tectonic.benchmark import benchmark, PHASES
+
+
+@pytest.fixture()
+def simulated_description(tectonic_config, labs_path):
+    if tectonic_config.platform != "docker":
+        pytest.skip("The simulated platform does not depend on the configured platform")
+    SimulatedPlatform.reset()
+    tectonic_config.platform = "simulated"
+    yield Description(tectonic_config, Path(labs_path) / "test.yml")
+    SimulatedPlatform.reset()
+
+
+def test_simulated_cycle(simulated_description):
+    core = Core(simulated_description)
+    platform = core.client.platform
+    assert platform is core.terraform.platform is core.packer.platform is core.ansible.platform
+
+    core.create_instances_images()
+    assert "udelar-lab01-attacker" in platform.images
+
+    core.deploy(None, False, [])
+    machines = simulated_description.parse_machines(None, None, None, False, [service.base_name for _, service in simulated_description.services_guests.items()])
+    status = core.list_instances(None, None, None)
+    for machine in machines:
+        assert status["instances_info"][machine][1] == "RUNNING"
+    assert status["instances_info"]["udelar-lab01-1-attacker"][0] == next(iter(simulated_description.scenario_guests["udelar-lab01-1-attacker"].interfaces.values())).private_ip
+
+    core.stop([1], ["attacker"], None)
+    assert core.client.get_machine_status("udelar-lab01-1-attacker") == "STOPPED"
+    core.start([1], ["attacker"], None)
+    assert core.client.get_machine_status("udelar-lab01-1-attacker") == "RUNNING"
+
+    # Images in use cannot be deleted
+    with pytest.raises(Exception, match="being used"):
+        core.packer.destroy_instance_image(["attacker"])
+
+    # Destroy a single instance
+    core.destroy([1], False, False, [])
+    assert core.client.get_machine_status("udelar-lab01-1-attacker") == "NOT FOUND"
+    assert core.client.get_machine_status("udelar-lab01-2-attacker") == "RUNNING"
+
+    core.destroy(None, True, True, [])
+    assert platform.machines == {}
+    assert platform.networks == {}
+    assert "udelar-lab01-attacker" not in platform.images
+
+
+def test_simulated_image_cache(simulated_description):
+    core = Core(simulated_description)
+    core.create_instances_images()
+    with patch.object(core.packer, "_invoke_packer", wraps=core.packer._invoke_packer) as mock_invoke:
+        core.create_instances_images()
+        mock_invoke.assert_not_called()
+
+        # Only the guest whose definition changed is built again
+        simulated_description.base_guests["attacker"].memory *= 2
+        core.create_instances_images()
+        mock_invoke.assert_called_once()
+        assert list(json.loads(mock_invoke.call_args.args[1]["machines_json"])) == ["attacker"]
+
+        core.create_instances_images(rebuild=True)
+        assert mock_invoke.call_count == 2
+        assert len(json.loads(mock_invoke.call_args.args[1]["machines_json"])) == len(simulated_description.base_guests)
+
+    core.packer.destroy_instance_image(None)
+    assert core.client.get_image_fingerprint("udelar-lab01-attacker") is None
+
+
+def test_simulated_machine_info(simulated_description):
+    core = Core(simulated_description)
+    platform = core.client.platform
+    core.create_instances_images()
+    core.deploy(None, False, [])
+
+    # Addresses reported by terraform are not requested to the platform
+    requests = platform.requests
+    assert core.client.get_machine_private_ip("udelar-lab01-1-attacker") == platform.get_machine("udelar-lab01-1-attacker")["ip"]
+    assert platform.requests == requests
+
+    core.destroy([1], False, False, [])
+    requests = platform.requests
+    assert core.client.get_machine_private_ip("udelar-lab01-1-attacker") is None
+    assert platform.requests == requests + 1
+
+
+def test_simulated_check(simulated_description):
+    core = Core(simulated_description)
+    core.create_instances_images()
+    core.deploy(None, False, [])
+    assert core.check(None) == {"instances": {}, "services": []}
+
+    core.client.platform.destroy(["udelar-lab01-2-attacker"], [], None)
+    assert core.check(None) == {"instances": {2: ['simulated_machine.machines["udelar-lab01-2-attacker"]']}, "services": []}
+    assert core.check([1]) == {"instances": {}, "services": []}
+
+
+def test_simulated_failures(simulated_description):
+    simulated_description.config.simulated.failure_rate = 100
+    core = Core(simulated_description)
+    with pytest.raises(ClientSimulatedException, match="Simulated failure of get_machine_status"):
+        core.client.get_machine_status("udelar-lab01-1-attacker")
+    with pytest.raises(AnsibleException, match="Simulated failure of ansible"):
+        core.ansible.wait_for_connections(inventory={"attacker": {"hosts": {"udelar-lab01-1-attacker": {}}}})
+
+
+def test_simulated_boot_time(simulated_description):
+    simulated_description.config.simulated.boot_time = 100
+    core = Core(simulated_description)
+    core.terraform.deploy(None)
+    start = time.monotonic()
+    core.ansible.wait_for_connections()
+    assert time.monotonic() - start >= 0.09
+
+    # Stopped machines are unreachable
+    core.client.stop_machine("udelar-lab01-1-attacker")
+    with pytest.raises(AnsibleException, match="unreachable"):
+        core.ansible.wait_for_connections()
+
+
+def test_resource_names():
+    assert SimulatedPlatform.resource_names(None) is None
+    assert SimulatedPlatform.resource_names(['simulated_machine.machines["a"]', 'simulated_network.subnets["b"]']) == {"a", "b"}
+    assert SimulatedPlatform.resource_names(["simulated_machine.machines", 'simulated_network.subnets["b"]'], ["a", "c"], ["b", "d"]) == {"a", "b", "c"}
+    with pytest.raises(Exception, match="Invalid resource address"):
+        SimulatedPlatform.resource_names(['docker_container.machines["a"]'])
+
+
+def test_resource_requests():
+    platform = SimulatedPlatform(api_latency=1)
+    assert platform.resource_requests(0, 10) == 0
+    assert platform.resource_requests(20, 10) == 0.002
+    assert platform.resource_requests(20, 20) == 0.001
+    # Requests above the rate limit are throttled
+    platform.api_rate_limit = 10
+    assert platform.resource_requests(20, 20) == 0.004
+
+    platform.apply({"a": {"ip": None}}, {"n": {}}, parallelism=1)
+    assert platform.requests == 1
+    assert platform.get_machine("a") is not None
+    platform.destroy(["a"], ["n"], parallelism=1)
+    assert platform.get_machine("a") is None
+
+
+def test_benchmark_parallelism(tectonic_config_path, labs_path, tmp_path):
+    if "docker" not in tectonic_config_path:
+        pytest.skip("The simulated platform does not depend on the configured platform")
+    output = tmp_path / "parallelism.json"
+    result = CliRunner().invoke(benchmark, ["-c", tectonic_config_path, "parallelism", "-p", "0", "-p", "5", "-o", output.as_posix(), (Path(labs_path) / "test.yml").as_posix()])
+    assert result.exit_code == 0, result.output
+    assert "Fastest" in result.output
+    timings = json.loads(output.read_text())
+    assert list(timings.keys()) == ["0", "5"]
+    assert timings["5"]["deploy"] >= 0
+
+
+def test_benchmark(simulated_description, tectonic_config_path, labs_path, tmp_path):
+    output = tmp_path / "benchmark.json"
+    result = CliRunner().invoke(benchmark, ["-c", tectonic_config_path, "cycle", "-n", "1", "-o", output.as_posix(), (Path(labs_path) / "test.yml").as_posix()])
+    assert result.exit_code == 0, result.output
+    assert "Mean (s)" in result.output
+    cycles = json.loads(output.read_text())["cycles"]
+    assert len(cycles) == 1
+    for phase in PHASES:
+        assert cycles[0][phase] >= 0
+    assert cycles[0]["machines"] == len(simulated_description.scenario_guests) + len(simulated_description.services_guests)
+    assert cycles[0]["requests"] > 0
@@ -1,6 +1,16 @@
 import pytest
+import os
+import json
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from unittest.mock import MagicMock, patch
 from tectonic.terraform import TerraformException
+from tectonic.terraform_libvirt import TerraformLibvirt
+from tectonic.terraform_docker import TerraformDocker
+from tectonic.terraform_aws import TerraformAWS, TerraformAWSException
+from tectonic.instrumentation import Instrumentation
 
 def test_run_terraform_cmd_success(terraform):
     mock_t = MagicMock()
@@ -17,10 +27,23 @@ def test_run_terraform_cmd_failure(terraform):
         terraform._run_terraform_cmd(mock_t, "apply", {})
 
 
-def test_generate_backend_config_file(terraform):
+def test_generate_backend_config_file(terraform, tmp_path):
     terraform.BACKEND_TYPE = "FILE"
     result = terraform._generate_backend_config("/tmp/mydir")
     assert terraform.description.lab_name in result[0]
+    states_dir = Path(terraform.config.terraform_data_dir) / "mydir" / "terraform-states"
+    assert result == [f"path={states_dir / terraform._get_state_name('/tmp/mydir')}"]
+
+    # States kept in the module directory are moved to the data directory
+    module = tmp_path / "module"
+    legacy_state = module / "terraform-states" / terraform._get_state_name(module.as_posix())
+    legacy_state.parent.mkdir(parents=True)
+    legacy_state.write_text("state")
+    result = terraform._generate_backend_config(module.as_posix())
+    state = Path(result[0].removeprefix("path="))
+    assert state.read_text() == "state"
+    assert state.is_relative_to(terraform.config.terraform_data_dir)
+    assert not legacy_state.exists()
 
 
 def test_generate_backend_config_gitlab(terraform):
@@ -35,25 +58,225 @@ def test_generate_backend_config_invalid(terraform):
     result = terraform._generate_backend_config("/tmp/mydir")
     assert result is None
 
-def test_apply(terraform):
-    with patch.object(terraform, '_run_terraform_cmd', return_value="ok") as mock_run:
-        terraform._apply("dir", {"var": "val"})
-        assert mock_run.call_count == 3
-        assert mock_run.call_args_list[0][0][1] == "init"
-        assert mock_run.call_args_list[1][0][1] == "plan"
-        assert "target" in mock_run.call_args_list[1][1]
-        assert mock_run.call_args_list[2][0][1] == "apply"
-        assert "target" in mock_run.call_args_list[2][1]
+def test_apply(terraform, tmp_path):
+    plan = {
+        "resource_changes": [
+            {"address": "docker_container.machines[\"a\"]", "change": {"actions": ["create"]}},
+            {"address": "docker_container.machines[\"b\"]", "change": {"actions": ["delete", "create"]}},
+            {"address": "docker_network.subnets[\"c\"]", "change": {"actions": ["no-op"]}},
+        ],
+    }
+    outputs = {"machines": {"value": {"a": {"id": "id-a", "private_ip": "10.0.0.4", "public_ip": None}}}}
+    plan_variables = []
+    def run_terraform_cmd(t, cmd, variables, *cmd_args, **args):
+        if cmd == "plan":
+            with open(os.path.join(t.working_dir, terraform.VARIABLES_FILE)) as f:
+                plan_variables.append(json.load(f))
+        if cmd == "output":
+            return json.dumps(outputs)
+        return json.dumps(plan) if cmd == "show" else "ok"
+
+    module = tmp_path / "module"
+    module.mkdir()
+    (module / "main.tf").write_text("terraform {}")
+    data_dir = Path(terraform.config.terraform_data_dir) / "module"
+    with patch.object(terraform, '_run_terraform_cmd', side_effect=run_terraform_cmd) as mock_run:
+        terraform._apply(module.as_posix(), {"var": "val"})
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "plan", "show", "apply", "output"]
+        plan_file = mock_run.call_args_list[1].kwargs["out"]
+        assert "target" in mock_run.call_args_list[1].kwargs
+        assert mock_run.call_args_list[1].kwargs["parallelism"] == terraform._get_parallelism({"var": "val"})
+        # Variables are read from the tfvars file, which is removed afterwards
+        assert mock_run.call_args_list[1].args[2] is None
+        assert plan_variables == [{"var": "val"}]
+        # Nothing is written to the module directory
+        assert os.listdir(module) == ["main.tf"]
+        assert sorted(os.listdir(data_dir)) == ["terraform-plans", "terraform-states", "terraform-workdirs"]
+        assert os.listdir(mock_run.call_args_list[1].args[0].working_dir) == ["main.tf"]
+        # The saved plan is applied without variables nor targets
+        assert mock_run.call_args_list[3].args[2:] == (None, plan_file)
+        assert "target" not in mock_run.call_args_list[3].kwargs
+        assert plan_file == (data_dir / "terraform-plans" / f"{terraform._get_state_name(module.as_posix())}.tfplan").as_posix()
+        with open(plan_file.replace(".tfplan", ".json")) as f:
+            summary = json.load(f)
+        assert summary == {
+            "create": ['docker_container.machines["a"]'],
+            "update": [],
+            "replace": ['docker_container.machines["b"]'],
+            "delete": [],
+            "changes": True,
+            "drift": [],
+        }
+        # Unknown values are left out of the machine information
+        assert terraform.machine_info == {"a": {"id": "id-a", "private_ip": "10.0.0.4"}}
+        # Created and replaced machines are kept until someone waits for them
+        assert terraform.pop_created_machines() == ["a", "b"]
+        assert terraform.pop_created_machines() == []
+
+        mock_run.reset_mock()
+        terraform._apply(module.as_posix(), {"var": "val"}, resources=["res"], recreate=True, state_name="host2")
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "plan", "show", "apply", "output"]
+        assert mock_run.call_args_list[1].kwargs["replace"] == ["res"]
+        assert mock_run.call_args_list[1].kwargs["out"].endswith("-module-host2.tfplan")
+        working_dir = data_dir / "terraform-workdirs" / terraform._get_state_name(module.as_posix(), "host2")
+        assert not (working_dir / terraform.VARIABLES_FILE).exists()
+
+        # Nothing to apply
+        mock_run.reset_mock()
+        plan = {"resource_changes": [{"address": "docker_network.subnets[\"c\"]", "change": {"actions": ["no-op"]}}],
+                "output_changes": {"ip": {"actions": ["no-op"]}}}
+        terraform._apply(module.as_posix(), {"var": "val"})
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "plan", "show", "output"]
+
+        mock_run.reset_mock()
+        plan["output_changes"]["ip"]["actions"] = ["update"]
+        terraform._apply(module.as_posix(), {"var": "val"})
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "plan", "show", "apply", "output"]
+
+        # Machines destroyed with the whole state are forgotten
+        terraform._destroy(module.as_posix(), {"var": "val"}, state_name="host2")
+        assert terraform.machine_info == {"a": {"id": "id-a", "private_ip": "10.0.0.4"}}
+        terraform._destroy(module.as_posix(), {"var": "val"})
+        assert terraform.machine_info == {}
+
+    with patch.object(terraform, '_run_terraform_cmd', return_value="not json"):
+        with pytest.raises(TerraformException, match="cannot parse terraform plan"):
+            terraform._apply(module.as_posix(), {"var": "val"})
+
+
+def test_init_reuse(terraform, tmp_path, monkeypatch):
+    module = tmp_path / "module"
+    module.mkdir()
+    (module / "main.tf").write_text("terraform {}")
+    terraform.config.terraform_plugin_cache_dir = (tmp_path / "plugin-cache").as_posix()
+    monkeypatch.delenv("TF_PLUGIN_CACHE_DIR", raising=False)
+
+    def run_terraform_cmd(t, cmd, variables, *cmd_args, **args):
+        if cmd == "init":
+            (Path(t.working_dir) / ".terraform").mkdir(exist_ok=True)
+            (Path(t.working_dir) / ".terraform.lock.hcl").write_text("provider")
+        return "{}"
+
+    def init_calls(mock_run):
+        return [c for c in mock_run.call_args_list if c.args[1] == "init"]
+
+    with patch.object(terraform, '_run_terraform_cmd', side_effect=run_terraform_cmd) as mock_run:
+        terraform._apply(module.as_posix(), {})
+        terraform._apply(module.as_posix(), {})
+        terraform._destroy(module.as_posix(), {})
+        assert len(init_calls(mock_run)) == 1
+        assert (tmp_path / "plugin-cache").is_dir()
+        assert os.environ["TF_PLUGIN_CACHE_DIR"] == terraform.config.terraform_plugin_cache_dir
+
+        # A different state, in its own working directory
+        mock_run.reset_mock()
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        assert len(init_calls(mock_run)) == 1
+        working_dir = Path(mock_run.call_args.args[0].working_dir)
+        assert working_dir.parent == Path(terraform.config.terraform_data_dir) / "module" / "terraform-workdirs"
+        assert (working_dir / "main.tf").resolve() == module / "main.tf"
+
+        # Changes in the module or the lock file
+        mock_run.reset_mock()
+        (module / "main.tf").write_text("terraform { }")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        (working_dir / ".terraform.lock.hcl").write_text("other provider")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        assert len(init_calls(mock_run)) == 2
+
+        # The init is repeated after a failure
+        mock_run.reset_mock()
+        (module / "main.tf").write_text("terraform {}")
+        mock_run.side_effect = TerraformException("init failed")
+        with pytest.raises(TerraformException):
+            terraform._apply(module.as_posix(), {}, state_name="host2")
+        mock_run.side_effect = run_terraform_cmd
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        assert len(init_calls(mock_run)) == 2
 
+        # The lock file of the module is linked, but not its .terraform directory
         mock_run.reset_mock()
+        (module / ".terraform").mkdir()
+        (module / ".terraform.lock.hcl").write_text("module provider")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        terraform._apply(module.as_posix(), {}, state_name="host2")
+        assert len(init_calls(mock_run)) == 1
+        assert (working_dir / ".terraform.lock.hcl").resolve() == module / ".terraform.lock.hcl"
+        assert not (working_dir / ".terraform").is_symlink()
+
+
+def test_check(terraform, tmp_path):
+    module = tmp_path / "module"
+    module.mkdir()
+    plan = {"resource_drift": [{"address": "docker_container.machines[\"a\"]", "change": {"actions": ["update"]}}]}
+    with patch.object(terraform, '_run_terraform_cmd', return_value=json.dumps(plan)) as mock_run:
+        with patch.object(terraform, '_refresh_plan', return_value=False) as mock_refresh:
+            assert terraform._check(module.as_posix(), {}, ["res"]) == []
+            assert mock_refresh.call_args.args[1].endswith(f"{terraform._get_state_name(module.as_posix())}.check.tfplan")
+            assert mock_refresh.call_args.args[2] == ["res"]
+            assert [c.args[1] for c in mock_run.call_args_list] == ["init"]
+
+            mock_refresh.return_value = True
+            assert terraform._check(module.as_posix(), {}) == ['docker_container.machines["a"]']
+            plans_dir = Path(terraform.config.terraform_data_dir) / "module" / "terraform-plans"
+            assert (plans_dir / f"{terraform._get_state_name(module.as_posix())}.check.json").is_file()
+
+    t = MagicMock()
+    for return_code, drift in [(0, False), (2, True)]:
+        t.cmd.return_value = (return_code, "", "")
+        assert terraform._refresh_plan(t, "plan.tfplan") is drift
+    assert t.cmd.call_args.kwargs["refresh_only"] and t.cmd.call_args.kwargs["detailed_exitcode"]
+    t.cmd.return_value = (1, "", "failed")
+    with pytest.raises(TerraformException, match="failed"):
+        terraform._refresh_plan(t, "plan.tfplan")
+
+    machine = terraform._get_machine_resources_name([2], None, None)[0]
+    with patch.object(terraform, '_check', return_value=[machine, "shared.resource"]) as mock_check:
+        assert terraform.check([2]) == {2: [machine], None: ["shared.resource"]}
+        # Only the resources of the selected instances are checked
+        assert mock_check.call_args.args[2] == terraform._get_resources_to_target_apply([2])
+        mock_check.reset_mock()
+        terraform.check(None)
+        assert mock_check.call_args.args[2] is None
+
 
-        terraform._apply("dir", {"var": "val"}, resources=["res"], recreate=True)
-        assert mock_run.call_count == 3
-        assert mock_run.call_args_list[0][0][1] == "init"
-        assert mock_run.call_args_list[1][0][1] == "plan"
-        assert "replace" in mock_run.call_args_list[1][1]
-        assert mock_run.call_args_list[2][0][1] == "apply"
-        assert "replace" in mock_run.call_args_list[2][1]
+def test_concurrent_editions(terraform, tmp_path):
+    module = tmp_path / "module"
+    module.mkdir()
+    (module / "main.tf").write_text("terraform {}")
+    terraform.config.terraform_plugin_cache_dir = (tmp_path / "plugin-cache").as_posix()
+    description = copy.copy(terraform.description)
+    description.lab_name = "lab02"
+    other = type(terraform)(terraform.config, description)
+
+    planning = threading.Barrier(2)
+    working_dirs = {}
+    def run_terraform_cmd(t, cmd, variables, *cmd_args, **args):
+        if cmd == "init":
+            # Fails if both editions share the directory
+            (Path(t.working_dir) / ".terraform").mkdir()
+        elif cmd == "plan":
+            planning.wait(timeout=10)
+            with open(Path(t.working_dir) / terraform.VARIABLES_FILE) as f:
+                working_dirs[json.load(f)["edition"]] = t.working_dir
+        return "{}"
+
+    with patch.object(terraform, '_run_terraform_cmd', side_effect=run_terraform_cmd), \
+         patch.object(other, '_run_terraform_cmd', side_effect=run_terraform_cmd):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(t._apply, module.as_posix(), {"edition": t.description.lab_name}) for t in [terraform, other]]
+        for future in futures:
+            future.result()
+
+    data_dir = Path(terraform.config.terraform_data_dir) / "module"
+    assert working_dirs == {
+        "lab01": (data_dir / "terraform-workdirs" / terraform._get_state_name(module.as_posix())).as_posix(),
+        "lab02": (data_dir / "terraform-workdirs" / other._get_state_name(module.as_posix())).as_posix(),
+    }
+    assert os.listdir(module) == ["main.tf"]
+    assert sorted(os.listdir(data_dir / "terraform-plans")) == ["udelar-lab01-module.json", "udelar-lab02-module.json"]
 
 
 def test_deploy(terraform):
@@ -73,30 +296,298 @@ def test_deploy(terraform):
         mock_apply.assert_called_once()
 
 def test_destroy(terraform):
-    with patch.object(terraform, '_run_terraform_cmd', return_value="ok") as mock_run:
+    with patch.object(terraform, '_run_terraform_cmd', return_value="{}") as mock_run:
         terraform.destroy(None)
-        assert mock_run.call_count == 2
-        assert mock_run.call_args_list[0][0][1] == "init"
-        assert mock_run.call_args_list[1][0][1] == "destroy"
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "destroy"]
 
+        # The outputs of the remaining machines are read again
         mock_run.reset_mock()
         terraform.destroy([1])
-        assert mock_run.call_count == 2
-        assert mock_run.call_args_list[0][0][1] == "init"
-        assert mock_run.call_args_list[1][0][1] == "destroy"
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "destroy", "output"]
 
         mock_run.reset_mock()
         terraform.config.configure_dns = True
         terraform.destroy([1])
-        assert mock_run.call_count == 2
-        assert mock_run.call_args_list[0][0][1] == "init"
-        assert mock_run.call_args_list[1][0][1] == "destroy"
+        assert [c.args[1] for c in mock_run.call_args_list] == ["init", "destroy", "output"]
         
 def test_recreate(terraform):
     with patch.object(terraform, '_apply', return_value="ok") as mock_apply:
         terraform.recreate([1], [], [])
         mock_apply.assert_called_once()
 
+def test_parallelism(terraform):
+    platform = terraform.config.platform
+    variables = terraform._get_state_variables(None, None, [1, 2])
+    resources = terraform._count_resources(variables)
+    assert resources == len(variables["guest_data"]) + len(variables["subnets"]) + \
+        sum(len(guest["interfaces"]) for guest in variables["guest_data"].values())
+    low, high = terraform.PARALLELISM_LIMITS[platform]
+    assert low <= terraform._get_parallelism(variables) <= high
+
+    many = {"guest_data": {f"m{i}": {"interfaces": {"a": {}, "b": {}, "c": {}}} for i in range(100)}, "subnets": {}}
+    few = {"guest_data": {"m": {"interfaces": {}}}, "subnets": {}}
+    with patch.object(terraform, '_get_host_cpus', return_value=2):
+        if platform == "aws":
+            # Bound by the API, not by the CPUs
+            assert terraform._get_parallelism(many) == 64
+            assert terraform._get_parallelism(few) == 10
+        elif platform == "libvirt":
+            assert terraform._get_parallelism(many) == 2
+        else:
+            assert terraform._get_parallelism(many) == 4
+    with patch.object(terraform, '_get_host_cpus', return_value=12):
+        if platform == "libvirt":
+            assert terraform._get_parallelism(few) == 6
+        elif platform == "docker":
+            assert terraform._get_parallelism(few) == 24
+
+    terraform.config.terraform_parallelism = 3
+    assert terraform._get_parallelism(many) == 3
+    terraform.config.terraform_parallelism = 0
+
+    if platform in ["libvirt", "docker"]:
+        hosts = [{"name": "host1", "uri": "tcp://node1:2376", "memory": 8192, "vcpu": 6}]
+        platform_config = getattr(terraform.config, platform)
+        previous = platform_config.hosts
+        platform_config.hosts = hosts
+        variables = {"tectonic": {"config": {"platforms": {platform: {"uri": "tcp://node1:2376"}}}}}
+        assert terraform._get_host_cpus(variables) == 6
+        platform_config.hosts = previous
+
+        # The CPUs of remote libvirt servers outside the cluster are not known
+        variables = {"tectonic": {"config": {"platforms": {platform: {"uri": "qemu+ssh://node2/system"}}}}}
+        with patch("tectonic.terraform.os.cpu_count", return_value=64):
+            if platform == "libvirt":
+                assert terraform._get_host_cpus(variables) is None
+                assert terraform._get_parallelism(variables) == 2
+            else:
+                assert terraform._get_host_cpus(variables) == 64
+            variables = {"tectonic": {"config": {"platforms": {platform: {"uri": "qemu:///system"}}}}}
+            assert terraform._get_host_cpus(variables) == 64
+
+    instrumentation = Instrumentation(True)
+    instrumentation.instrument_terraform(terraform)
+    with patch.object(terraform, '_run_terraform_cmd', return_value="{}"):
+        terraform._destroy("dir", many)
+    terraform.instrumentation = None
+    runs = instrumentation.snapshot()["terraform"][terraform._get_state_name("dir")]
+    assert runs[0]["operation"] == "destroy"
+    assert runs[0]["parallelism"] == terraform._get_parallelism(many)
+    assert runs[0]["resources"] == 400
+
+def test_resources_to_target(terraform):
+    terraform.config.configure_dns = True
+    resources = terraform._get_resources_to_target_apply([1, 1, 2])
+    assert len(resources) == len(set(resources))
+    assert resources == terraform._get_resources_to_target_apply([1, 2])
+
+    by_instance = terraform._get_resources_by_instance([1, 2])
+    assert list(by_instance) == [1, 2]
+    for instance, addresses in by_instance.items():
+        assert addresses == terraform._get_resources_to_target_apply([instance])
+    machines = [address for addresses in by_instance.values() for address in addresses if ".machines[" in address]
+    assert len(machines) == len(set(machines))
+
+    if terraform.description.config.platform == "aws":
+        guest = terraform.description.scenario_guests["udelar-lab01-2-attacker"]
+        network = next(iter(guest.interfaces.values())).network.name
+        assert f'aws_route53_record.records["{guest.hostname}-{network}"]' in by_instance[2]
+        assert f'aws_route53_zone.zones["{network}"]' in by_instance[2]
+        assert f'aws_route53_record.records["{guest.hostname}-{network}"]' not in by_instance[1]
+        assert "aws_route53_zone.reverse[0]" not in resources
+
+    assert terraform._collapse_resources(['a.b["x"]', 'a.b["y"]', "c.d[0]", "e.f"]) == ["a.b", "c.d", "e.f"]
+    with patch.object(terraform, '_apply') as mock_apply:
+        # All the instances are selected, so whole resources are targeted
+        terraform.deploy([1, 2])
+        assert mock_apply.call_args.args[2] == terraform._collapse_resources(resources)
+    terraform.config.configure_dns = False
+
+def test_libvirt_cluster(description):
+    if description.config.platform == "libvirt":
+        description.config.libvirt.hosts = [
+            {"name": "host1", "uri": description.config.libvirt.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "test:///default", "memory": 8192, "vcpu": 16, "storage_pool": "pool2"},
+        ]
+        terraform = TerraformLibvirt(description.config, description)
+        assert terraform.placement.assignments == {1: "host2", 2: "host1"}
+
+        variables = terraform._get_state_variables("host2", terraform.placement.host("host2"), [1])
+        tectonic = variables["tectonic"]
+        assert tectonic["config"]["platforms"]["libvirt"]["uri"] == "test:///default"
+        assert tectonic["config"]["platforms"]["libvirt"]["storage_pool"] == "pool2"
+        assert tectonic["config"]["platforms"]["libvirt"]["local_internet_network"] is True
+        assert set(guest["instance"] for guest in variables["guest_data"].values()) == {1}
+        assert all("-1-" in network for network in variables["subnets"])
+
+        with patch.object(terraform, '_apply') as mock_apply:
+            terraform.deploy(None)
+            assert sorted(c.kwargs["state_name"] for c in mock_apply.call_args_list) == ["host1", "host2"]
+            assert all(c.args[2] is None for c in mock_apply.call_args_list)
+
+            mock_apply.reset_mock()
+            terraform.deploy([1])
+            mock_apply.assert_called_once()
+            assert mock_apply.call_args.kwargs["state_name"] == "host2"
+            # Instance 1 is the only one in host2, so whole resources are targeted
+            assert 'libvirt_domain.machines' in mock_apply.call_args.args[2]
+            assert not any("[" in address for address in mock_apply.call_args.args[2])
+
+            mock_apply.reset_mock()
+            terraform.recreate([2], ["attacker"], [])
+            mock_apply.assert_called_once()
+            assert mock_apply.call_args.kwargs["state_name"] == "host1"
+
+        with patch.object(terraform, '_destroy') as mock_destroy:
+            terraform.destroy(None)
+            assert sorted(c.kwargs["state_name"] for c in mock_destroy.call_args_list) == ["host1", "host2"]
+
+        with patch.object(terraform, '_run_terraform_cmd') as mock_run:
+            terraform._destroy("dir", {}, None, state_name="host2")
+            assert mock_run.call_args_list[0].kwargs["backend_config"][0].endswith("-dir-host2")
+        description.config.libvirt.hosts = []
+
+def test_docker_cluster(description):
+    if description.config.platform == "docker":
+        description.config.docker.hosts = [
+            {"name": "host1", "uri": description.config.docker.uri, "memory": 65536, "vcpu": 32},
+            {"name": "host2", "uri": "tcp://node2:2376", "memory": 8192, "vcpu": 16},
+        ]
+        terraform = TerraformDocker(description.config, description)
+        assert terraform.placement.assignments == {1: "host2", 2: "host1"}
+
+        variables = terraform._get_state_variables("host2", terraform.placement.host("host2"), [1])
+        tectonic = variables["tectonic"]
+        assert tectonic["config"]["platforms"]["docker"]["uri"] == "tcp://node2:2376"
+        assert set(guest["instance"] for guest in variables["guest_data"].values()) == {1}
+        assert all("-1-" in network for network in variables["subnets"])
+
+        with patch.object(terraform, '_apply') as mock_apply:
+            terraform.deploy(None)
+            assert sorted(c.kwargs["state_name"] for c in mock_apply.call_args_list) == ["host1", "host2"]
+
+            mock_apply.reset_mock()
+            terraform.deploy([1])
+            mock_apply.assert_called_once()
+            assert mock_apply.call_args.kwargs["state_name"] == "host2"
+            # Instance 1 is the only one in host2, so whole resources are targeted
+            assert mock_apply.call_args.args[2] == ["docker_container.machines", "docker_network.subnets"]
+
+            mock_apply.reset_mock()
+            terraform.recreate([2], ["attacker"], [])
+            mock_apply.assert_called_once()
+            assert mock_apply.call_args.kwargs["state_name"] == "host1"
+
+        with patch.object(terraform, '_destroy') as mock_destroy:
+            terraform.destroy([2])
+            mock_destroy.assert_called_once()
+            assert mock_destroy.call_args.kwargs["state_name"] == "host1"
+        description.config.docker.hosts = []
+
+def test_run_states_sequential(terraform):
+    terraform.config.terraform_shard_concurrency = 1
+    processed = []
+    def operation(state_name, host, state_instances, selected):
+        processed.append(state_name)
+        if state_name in failing:
+            raise TerraformException(f"{state_name} failed")
+        return state_name
+    states = [(f"shard{i}", None, [i], [i]) for i in range(1, 4)]
+
+    failing = []
+    assert terraform._run_states(operation, states) == ["shard1", "shard2", "shard3"]
+
+    # The states after a failed one are still processed
+    processed.clear()
+    failing = ["shard1"]
+    with pytest.raises(TerraformException, match="^shard1 failed$"):
+        terraform._run_states(operation, states)
+    assert processed == ["shard1", "shard2", "shard3"]
+
+    processed.clear()
+    failing = ["shard1", "shard3"]
+    with pytest.raises(TerraformException, match="several states: shard1: shard1 failed; shard3: shard3 failed"):
+        terraform._run_states(operation, states)
+    assert processed == ["shard1", "shard2", "shard3"]
+    terraform.config.terraform_shard_concurrency = 4
+
+def test_sharded_states(description, tmp_path):
+    description.config.terraform_shard_size = 1
+    if description.config.platform == "aws":
+        with pytest.raises(TerraformAWSException):
+            TerraformAWS(description.config, description)
+        description.config.terraform_shard_size = 0
+        return
+
+    if description.config.platform == "docker":
+        terraform = TerraformDocker(description.config, description)
+    else:
+        terraform = TerraformLibvirt(description.config, description)
+    assert terraform._get_instance_states() == [("shard1", None, [1]), ("shard2", None, [2])]
+    shared_states = [state_name for state_name, _ in terraform._get_shared_states()]
+    assert shared_states == ([] if description.config.platform == "docker" else ["shared"])
+
+    with patch.object(terraform, '_apply') as mock_apply:
+        terraform.deploy(None)
+        state_names = [c.kwargs["state_name"] for c in mock_apply.call_args_list]
+        # Shared states are applied before the shards
+        assert state_names[:len(shared_states)] == shared_states
+        assert sorted(state_names[len(shared_states):]) == ["shard1", "shard2"]
+        for c in mock_apply.call_args_list:
+            guests = c.args[1]["guest_data"]
+            if c.kwargs["state_name"] == "shard1":
+                assert set(guest["instance"] for guest in guests.values()) == {1}
+            elif c.kwargs["state_name"] == "shared":
+                assert guests == {}
+                assert c.args[1]["tectonic"]["config"]["platforms"]["libvirt"]["shared_networks"]
+
+        mock_apply.reset_mock()
+        terraform.recreate([2], ["attacker"], [])
+        mock_apply.assert_called_once()
+        assert mock_apply.call_args.kwargs["state_name"] == "shard2"
+
+    with patch.object(terraform, '_destroy') as mock_destroy:
+        terraform.destroy([1])
+        assert [c.kwargs["state_name"] for c in mock_destroy.call_args_list] == ["shard1"]
+        mock_destroy.reset_mock()
+        terraform.destroy(None)
+        # Shared states are destroyed after the shards
+        assert [c.kwargs["state_name"] for c in mock_destroy.call_args_list][2:] == shared_states
+
+    # Every state is processed even if some of them fail
+    def fail(state_name, host, state_instances, selected):
+        raise TerraformException(f"{state_name} failed")
+    with pytest.raises(TerraformException, match="several states"):
+        terraform._run_states(fail, terraform._select_states(None))
+
+    # Migration from a single state
+    terraform.terraform_instances_module = tmp_path / f"gsi-lab-{description.config.platform}"
+    terraform.terraform_instances_module.mkdir()
+    addresses = terraform._get_resources_to_target_apply([1, 2])
+    if description.config.platform == "libvirt":
+        addresses.append("libvirt_network.external")
+    state_list = "\n".join(addresses + ['data.docker_image.base_images["attacker"]'])
+    def run_terraform_cmd(t, cmd, variables, *cmd_args, **args):
+        return {"state pull": "{}", "state list": state_list}.get(cmd, "")
+    with patch.object(terraform, '_run_terraform_cmd', side_effect=run_terraform_cmd) as mock_run:
+        moved = terraform.migrate_states()
+        assert moved == {
+            "shard1": len(terraform._get_resources_to_target_apply([1])),
+            "shard2": len(terraform._get_resources_to_target_apply([2])),
+        } | ({"shared": 1} if description.config.platform == "libvirt" else {})
+        moves = [c for c in mock_run.call_args_list if c.args[1] == "state mv"]
+        assert len(moves) == len(addresses)
+        pushes = [c for c in mock_run.call_args_list if c.args[1] == "state push"]
+        assert len(pushes) == len(moved) + 1
+        # The previous state is pushed last
+        assert pushes[-1].args[0].working_dir == terraform._get_working_dir(terraform.terraform_instances_module)
+    states_dir = Path(description.config.terraform_data_dir) / f"gsi-lab-{description.config.platform}" / "terraform-states"
+    assert (states_dir / f"udelar-lab01-gsi-lab-{description.config.platform}.unsharded.backup").is_file()
+
+    description.config.terraform_shard_size = 0
+    with pytest.raises(TerraformException, match="terraform_shard_size"):
+        terraform.migrate_states()
+
 # def test_deploy_and_destroy_and_recreate(terraform, monkeypatch):
 #     monkeypatch.setattr(terraform, "_apply", lambda *a, **kw: "applied")
 #     monkeypatch.setattr(terraform, "_destroy", lambda *a, **kw: "destroyed")
@@ -149,4 +149,4 @@ def test_deploy_destroy_recreate(service):
 
 def test_get_terraform_variables(service):
     result = service._get_terraform_variables()
-    assert "guest_data_json" in result
+    assert "guest_data" in result
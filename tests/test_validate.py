@@ -166,3 +166,23 @@ def test_ip_address_or_hostname():
     with pytest.raises(ValueError) as exception:
         ip_address_or_hostname("test", False)
     
+
+def test_hosts():
+    hosts("test", [], [])
+    hosts("test", [{"uri": "test:///default", "memory": "4096", "vcpu": 4}], [])
+    hosts("test", [{"uri": "test:///default", "memory": 4096, "vcpu": 4, "name": "h1", "storage_pool": "pool"},
+                   {"uri": "test:///default", "memory": 4096, "vcpu": 4}], ["storage_pool"])
+
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"memory": 4096, "vcpu": 4}], [])
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"uri": "test:///default", "vcpu": 4}], [])
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"uri": "test:///default", "memory": 4096, "vcpu": 0}], [])
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"uri": "test:///default", "memory": 4096, "vcpu": 4, "pool": "x"}], [])
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"uri": "test:///default", "memory": 4096, "vcpu": 4, "name": "h-1"}], [])
+    with pytest.raises(ValueError) as exception:
+        hosts("test", [{"uri": "test:///default", "memory": 4096, "vcpu": 4, "name": "host2"},
+                       {"uri": "test:///default", "memory": 4096, "vcpu": 4}], [])